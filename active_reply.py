@@ -0,0 +1,231 @@
+import random
+import re
+import time
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+from astrbot.api import logger
+
+"""
+主动回复调度
+
+原来的主动回复对每条群消息掷一次骰子，LLM 调用量随群聊流量线性增长，流量突增时没有任何保护。
+这里按从便宜到昂贵的顺序做决定，任何一步拒绝就不再往下:
+1. 会话已经有进行中的 LLM 请求(正在回复)时不再插话
+2. 冷却: 距离上次主动回复不足 cooldown 秒
+3. 进行中的 LLM 请求数达到 max_inflight 时(提供商排队已深)不再发起新的主动回复
+4. 可选的启发式预筛: 只有提到关键词或像是提问的消息才继续
+5. 按 ar_possibility 掷骰子
+6. 令牌桶: 每个群每分钟 group_per_minute 次(可突发 burst 次)，全局每秒 max_qps 次
+
+令牌桶保证任意 T 秒内全局主动回复不超过 max_qps * T + max(1, max_qps) 次。
+第 2、3、6 步的限制默认全部关闭(0 表示不限制)，升级后的行为与原来一致，需要时在配置中开启。
+"""
+
+QUESTION_RE = re.compile(r"[?？]|吗|呢|什么|怎么|为什么|谁|哪|几|多少|如何|能不能|是不是|有没有")
+"""像是提问的消息"""
+
+REPLY = "reply"
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        """
+        Args:
+            rate: 每秒补充的令牌数，<= 0 表示不限制
+            capacity: 桶容量(允许的突发次数)
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = now
+
+    def available(self, now: float) -> float:
+        if self.rate <= 0:
+            return self.capacity
+        if now > self.stamp:
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+        return self.tokens
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        return self.available(now) >= self.capacity
+
+
+class _GroupState:
+    __slots__ = ("bucket", "last_reply")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.last_reply = float("-inf")
+
+
+class ActiveReplyScheduler:
+    PRUNE_EVERY = 1024
+    """每做这么多次决定检查一次是否需要清理群状态"""
+
+    def __init__(
+        self,
+        max_qps: float = 0.0,
+        group_per_minute: float = 0.0,
+        burst: float = 2.0,
+        cooldown: float = 0.0,
+        max_inflight: int = 0,
+        prefilter: bool = False,
+        keywords: Iterable[str] = (),
+        inflight_timeout: float = 120.0,
+        max_groups: int = 4096,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None,
+    ):
+        """
+        Args:
+            max_qps: 全局主动回复速率上限(次/秒)，<= 0 表示不限制
+            group_per_minute: 每个群的主动回复速率上限(次/分钟)，<= 0 表示不限制
+            burst: 每个群允许的突发次数
+            cooldown: 同一个群两次主动回复的最小间隔(秒)，0 表示不限制
+            max_inflight: 进行中的 LLM 请求达到该数量时不再主动回复，<= 0 表示不限制
+            prefilter: 是否只对提到关键词或像是提问的消息主动回复
+            keywords: 预筛关键词，比如机器人的名字
+            inflight_timeout: 进行中的请求超过该时间(秒)没有结束时视为已结束(比如请求失败没有回调)
+            max_groups: 群状态超过该数量时清理已经恢复初始状态的群
+            clock: 时钟，模拟时可以替换
+        """
+        self.max_qps = max_qps
+        self.group_rate = group_per_minute / 60
+        self.burst = max(1.0, burst)
+        self.cooldown = cooldown
+        self.max_inflight = max_inflight
+        self.prefilter = prefilter
+        self.keywords = tuple(k for k in keywords if k)
+        self.inflight_timeout = inflight_timeout
+        self.max_groups = max_groups
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._global = TokenBucket(max_qps, max(1.0, max_qps), clock())
+        self._groups: dict[str, _GroupState] = {}
+        self._inflight: dict[object, tuple[str, float]] = {}
+        """进行中的 LLM 请求: key -> (会话, 开始时间)"""
+        self._inflight_sessions: Counter[str] = Counter()
+        self._decisions = 0
+        self.outcomes: Counter[str] = Counter()
+        """各个决定结果的次数，reply 之外的是拒绝原因"""
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "ActiveReplyScheduler":
+        """从插件配置的 ltm 部分创建"""
+        keywords = cfg.get("ar_keywords", [])
+        if isinstance(keywords, str):
+            keywords = keywords.split(",")
+        return cls(
+            max_qps=float(cfg.get("ar_max_qps", 0)),
+            group_per_minute=float(cfg.get("ar_group_per_minute", 0)),
+            burst=float(cfg.get("ar_burst", 2)),
+            cooldown=float(cfg.get("ar_cooldown_seconds", 0)),
+            max_inflight=int(cfg.get("ar_max_inflight", 0)),
+            prefilter=bool(cfg.get("ar_prefilter", False)),
+            keywords=[k.strip() for k in keywords],
+        )
+
+    @property
+    def inflight(self) -> int:
+        return len(self._inflight)
+
+    def begin(self, key: object, umo: str):
+        """一个 LLM 请求开始。同一个 key 重复调用只记一次"""
+        if key in self._inflight:
+            return
+        self._inflight[key] = (umo, self.clock())
+        self._inflight_sessions[umo] += 1
+
+    def end(self, key: object):
+        """一个 LLM 请求结束。没有开始或已经结束的 key 直接忽略"""
+        entry = self._inflight.pop(key, None)
+        if entry is not None:
+            self._release(entry[0])
+
+    def _release(self, umo: str):
+        self._inflight_sessions[umo] -= 1
+        if self._inflight_sessions[umo] <= 0:
+            del self._inflight_sessions[umo]
+
+    def _expire(self, now: float):
+        # 按开始时间顺序插入，最早的在最前面
+        deadline = now - self.inflight_timeout
+        while self._inflight:
+            key, (umo, started) = next(iter(self._inflight.items()))
+            if started >= deadline:
+                break
+            del self._inflight[key]
+            self._release(umo)
+            logger.debug(f"ltm | {umo} | LLM 请求超过 {self.inflight_timeout}s 没有结束，不再计入进行中")
+
+    def interesting(self, text: str) -> bool:
+        """启发式预筛: 提到关键词或者像是提问"""
+        return any(k in text for k in self.keywords) or QUESTION_RE.search(text) is not None
+
+    def decide(self, umo: str, text: str, possibility: float, key: object = None) -> str:
+        """
+        决定是否主动回复，返回 REPLY 或拒绝原因。
+        决定回复且给出 key 时，立即把这次回复记为进行中的请求，请求结束时调用 end(key)。
+        """
+        now = self.clock()
+        self._decisions += 1
+        if self._decisions % self.PRUNE_EVERY == 0:
+            self._prune(now)
+        if self._inflight:
+            self._expire(now)
+        outcome = self._decide(umo, text, possibility, now)
+        self.outcomes[outcome] += 1
+        if outcome == REPLY and key is not None:
+            self.begin(key, umo)
+        return outcome
+
+    def _decide(self, umo: str, text: str, possibility: float, now: float) -> str:
+        if umo in self._inflight_sessions:
+            return "inflight_session"
+        state = self._groups.get(umo)
+        if state is not None and now - state.last_reply < self.cooldown:
+            return "cooldown"
+        if self.max_inflight > 0 and len(self._inflight) >= self.max_inflight:
+            return "busy"
+        if self.prefilter and not self.interesting(text):
+            return "prefilter"
+        if self.rng.random() >= possibility:
+            return "possibility"
+        if state is None:
+            state = self._groups[umo] = _GroupState(
+                TokenBucket(self.group_rate, self.burst, now)
+            )
+        if state.bucket.available(now) < 1:
+            return "group_rate"
+        if self._global.available(now) < 1:
+            return "global_rate"
+        state.bucket.take()
+        self._global.take()
+        state.last_reply = now
+        return REPLY
+
+    def _prune(self, now: float):
+        """清理令牌已经补满、冷却已经结束的群，它们与新建的状态没有区别"""
+        if len(self._groups) <= self.max_groups:
+            return
+        for umo in [
+            umo
+            for umo, state in self._groups.items()
+            if now - state.last_reply >= self.cooldown and state.bucket.full(now)
+        ]:
+            del self._groups[umo]
+
+    def stats(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "groups": len(self._groups),
+            "outcomes": dict(self.outcomes),
+        }
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from ._harness import ROOT
+
+"""
+运行整套基准测试并汇总结果，方便在不同版本之间比较:
+
+    python -m benchmarks --out before.json
+    (切换到新版本)
+    python -m benchmarks --out after.json --compare before.json
+
+每个基准在独立的子进程中运行(互不影响内存统计)，结果连同 git 版本写入一个 JSON 文件。
+--compare 会按指标名逐项比较，延迟和内存上升、吞吐下降超过阈值的指标标记为退化，有退化时退出码为 1。
+"""
+
+HIGHER_IS_BETTER = ("per_s", "speedup", "hit_rate")
+"""指标名以这些开头或结尾时越大越好"""
+LOWER_IS_BETTER = ("_ms", "_s", "_ns", "bytes", "chars", "calls", "underruns", "reads")
+"""指标名包含这些时越小越好"""
+
+
+def discover() -> list[str]:
+    here = os.path.dirname(os.path.abspath(__file__))
+    return sorted(
+        name[:-3]
+        for name in os.listdir(here)
+        if name.startswith("bench_") and name.endswith(".py")
+    )
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_one(name: str, timeout: float) -> dict:
+    start = time.perf_counter()
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-m", f"benchmarks.{name}"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        return {"ok": False, "error": f"timeout after {timeout}s"}
+    elapsed = time.perf_counter() - start
+    results = []
+    for line in proc.stdout.splitlines():
+        line = line.strip()
+        if line.startswith("{"):
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    if proc.returncode != 0 or not results:
+        return {
+            "ok": False,
+            "error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}",
+            "wall_s": elapsed,
+        }
+    return {"ok": True, "wall_s": elapsed, "results": [r["results"] for r in results]}
+
+
+def flatten(value, prefix: str = "") -> dict[str, float]:
+    """把嵌套结果展开为 {"a.b.c": 数值}"""
+    out = {}
+    if isinstance(value, dict):
+        for k, v in value.items():
+            out.update(flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            out.update(flatten(v, f"{prefix}[{i}]"))
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        out[prefix] = float(value)
+    return out
+
+
+def direction(metric: str) -> int:
+    """1: 越大越好，-1: 越小越好，0: 不比较(比如参数)"""
+    leaf = metric.rsplit(".", 1)[-1]
+    if leaf.startswith(HIGHER_IS_BETTER) or leaf.endswith(HIGHER_IS_BETTER):
+        return 1
+    if any(s in leaf for s in LOWER_IS_BETTER):
+        return -1
+    return 0
+
+
+def compare(before: dict, after: dict, threshold: float) -> dict:
+    report = {}
+    for name, new in after["benchmarks"].items():
+        old = before.get("benchmarks", {}).get(name)
+        if not (old and old.get("ok") and new.get("ok")):
+            continue
+        old_metrics = flatten(old["results"])
+        for metric, value in flatten(new["results"]).items():
+            sign = direction(metric)
+            base = old_metrics.get(metric)
+            if not sign or not base:
+                continue
+            change = (value - base) / base
+            report[f"{name}.{metric}"] = {
+                "before": base,
+                "after": value,
+                "change": change,
+                "regression": change * sign < -threshold,
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument("--only", help="只运行这些基准，逗号分隔，比如 bench_plugin,bench_ltm_store")
+    parser.add_argument("--out", help="结果写入该文件，默认输出到 stdout")
+    parser.add_argument("--compare", help="与之前保存的结果比较")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定为退化的相对变化，默认 0.1")
+    parser.add_argument("--timeout", type=float, default=600.0, help="单个基准的超时时间(秒)")
+    args = parser.parse_args()
+
+    names = discover()
+    if args.only:
+        wanted = {n if n.startswith("bench_") else f"bench_{n}" for n in args.only.split(",")}
+        names = [n for n in names if n in wanted]
+
+    suite = {
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "benchmarks": {},
+    }
+    for name in names:
+        print(f"running {name} ...", file=sys.stderr)
+        suite["benchmarks"][name] = run_one(name, args.timeout)
+        if not suite["benchmarks"][name]["ok"]:
+            print(f"  failed: {suite['benchmarks'][name]['error']}", file=sys.stderr)
+
+    regressions = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            before = json.load(f)
+        report = compare(before, suite, args.threshold)
+        suite["compare"] = {"baseline": before.get("revision", ""), "metrics": report}
+        regressions = sum(1 for r in report.values() if r["regression"])
+        for metric, r in sorted(report.items()):
+            if r["regression"]:
+                print(
+                    f"  regression {metric}: {r['before']:.4g} -> {r['after']:.4g} ({r['change']:+.1%})",
+                    file=sys.stderr,
+                )
+
+    text = json.dumps(suite, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import types
+
+"""
+基准测试公共工具。所有基准测试在仓库根目录以模块方式运行，例如:
+
+    python -m benchmarks.bench_tts_client
+
+结果以一行 JSON 输出到 stdout，方便在不同版本之间对比。
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PKG = "_plugin"
+"""插件模块之间使用相对导入，基准测试把仓库根目录注册为这个包名后再导入"""
+
+
+def import_plugin(name: str) -> types.ModuleType:
+    """以包内模块的方式导入插件模块，例如 import_plugin("ltm_store")"""
+    if PKG not in sys.modules:
+        pkg = types.ModuleType(PKG)
+        pkg.__path__ = [ROOT]
+        sys.modules[PKG] = pkg
+    return importlib.import_module(f"{PKG}.{name}")
+
+
+def summarize(values: list[float]) -> dict:
+    """延迟样本(秒)汇总为毫秒级的 p50/p95/p99，百分位数与插件的耗时统计使用同一个实现"""
+    percentile = import_plugin("instrumentation").percentile
+    return {
+        "n": len(values),
+        "mean_ms": statistics.fmean(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+def emit(bench: str, results: dict):
+    """输出一条机器可读的基准测试结果"""
+    print(
+        json.dumps(
+            {
+                "bench": bench,
+                "python": platform.python_version(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "results": results,
+            },
+            ensure_ascii=False,
+        )
+    )
@@ -0,0 +1,153 @@
+import heapq
+import random
+import sys
+import time
+from collections import deque
+
+from ._harness import emit, import_plugin
+from .fakes import GroupChatWorkload
+
+"""
+主动回复调度的模拟基准(模拟时钟，不真正等待)。
+
+GROUPS 个群，消息按 Zipf 分布落在各个群上，平时 BASE_RATE 条/秒，SPIKES 期间流量放大 SPIKE_FACTOR 倍。
+AT_RATIO 的消息 @ 了机器人(正常回复，不经过调度，但计入进行中的请求)，每次 LLM 请求耗时 LLM_LATENCY 秒左右。
+
+- possibility: 改动前的做法，每条消息按 POSSIBILITY 掷骰子
+- scheduler: ActiveReplyScheduler，全局上限 MAX_QPS 次/秒，每个群每分钟 2 次、冷却 30 秒、进行中的请求上限 4
+- scheduler_prefilter: 同上，开启启发式预筛
+
+输出每种做法的主动回复次数、平均和 1s/10s 窗口内的最大 QPS、最大并发请求数和每次决定的耗时，
+并断言调度器在任意窗口内都不超过令牌桶允许的上限。
+用法: python -m benchmarks.bench_active_reply [simulated_seconds]
+"""
+
+DURATION = float(sys.argv[1]) if len(sys.argv) > 1 else 600.0
+GROUPS = 1000
+BASE_RATE = 100.0
+SPIKES = ((200.0, 260.0), (400.0, 430.0))
+SPIKE_FACTOR = 10
+AT_RATIO = 0.005
+POSSIBILITY = 0.1
+MAX_QPS = 0.5
+LLM_LATENCY = 3.0
+
+
+def _arrivals(seed: int = 0):
+    """(时间, 群, 文本, 是否 @) 序列"""
+    rng = random.Random(seed)
+    weights = [1 / (i + 1) for i in range(GROUPS)]
+    texts = GroupChatWorkload.TEXTS
+    t = 0.0
+    out = []
+    while True:
+        rate = BASE_RATE * (SPIKE_FACTOR if any(a <= t < b for a, b in SPIKES) else 1)
+        t += rng.expovariate(rate)
+        if t >= DURATION:
+            break
+        out.append((t, None, rng.choice(texts), rng.random() < AT_RATIO))
+    groups = rng.choices(range(GROUPS), weights, k=len(out))
+    return [(t, f"aiocqhttp:GroupMessage:{g}", text, at) for (t, _, text, at), g in zip(out, groups)]
+
+
+def _max_in_window(times: list[float], window: float) -> int:
+    best = 0
+    q = deque()
+    for t in times:
+        q.append(t)
+        while q[0] <= t - window:
+            q.popleft()
+        best = max(best, len(q))
+    return best
+
+
+def _simulate(arrivals, make_decider) -> dict:
+    now = [0.0]
+    rng = random.Random(1)
+    decide, begin, end = make_decider(lambda: now[0])
+    finishing: list[tuple[float, int]] = []
+    replies = []
+    inflight = 0
+    max_inflight = 0
+    decide_ns = 0
+    for seq, (t, umo, text, at) in enumerate(arrivals):
+        now[0] = t
+        while finishing and finishing[0][0] <= t:
+            _, key = heapq.heappop(finishing)
+            end(key)
+            inflight -= 1
+        if at:
+            begin(seq, umo)
+        else:
+            t0 = time.perf_counter_ns()
+            reply = decide(umo, text, seq)
+            decide_ns += time.perf_counter_ns() - t0
+            if not reply:
+                continue
+            replies.append(t)
+        inflight += 1
+        max_inflight = max(max_inflight, inflight)
+        heapq.heappush(finishing, (t + LLM_LATENCY * rng.uniform(0.5, 1.5), seq))
+    decisions = sum(1 for a in arrivals if not a[3])
+    return {
+        "active_replies": len(replies),
+        "mean_qps": len(replies) / DURATION,
+        "max_qps_1s": _max_in_window(replies, 1.0),
+        "max_qps_10s": _max_in_window(replies, 10.0) / 10,
+        "max_inflight": max_inflight,
+        "decide_ns": decide_ns / decisions,
+    }
+
+
+def _possibility(clock):
+    rng = random.Random(2)
+    return (lambda umo, text, key: rng.random() < POSSIBILITY), (lambda key, umo: None), (lambda key: None)
+
+
+def _scheduler(prefilter: bool, holder: list):
+    ActiveReplyScheduler = import_plugin("active_reply").ActiveReplyScheduler
+    REPLY = import_plugin("active_reply").REPLY
+
+    def make(clock):
+        scheduler = ActiveReplyScheduler(
+            max_qps=MAX_QPS,
+            group_per_minute=2,
+            cooldown=30,
+            max_inflight=4,
+            prefilter=prefilter,
+            clock=clock,
+            rng=random.Random(2),
+        )
+        holder.append(scheduler)
+        return (
+            lambda umo, text, key: scheduler.decide(umo, text, POSSIBILITY, key=key) == REPLY,
+            scheduler.begin,
+            scheduler.end,
+        )
+
+    return make
+
+
+def main():
+    arrivals = _arrivals()
+    results = {
+        "simulated_seconds": DURATION,
+        "groups": GROUPS,
+        "messages": len(arrivals),
+        "max_qps": MAX_QPS,
+        "possibility": _simulate(arrivals, _possibility),
+    }
+    for name, prefilter in (("scheduler", False), ("scheduler_prefilter", True)):
+        holder = []
+        result = _simulate(arrivals, _scheduler(prefilter, holder))
+        scheduler = holder[0]
+        # 令牌桶: 任意 T 秒内最多 capacity + rate * T 次
+        capacity = max(1.0, MAX_QPS)
+        assert result["max_qps_1s"] <= capacity + MAX_QPS * 1.0, result
+        assert result["max_qps_10s"] * 10 <= capacity + MAX_QPS * 10.0, result
+        results[name] = {**result, "outcomes": dict(scheduler.outcomes), "tracked_groups": scheduler.stats()["groups"]}
+    emit("active_reply", results)
+
+
+if __name__ == "__main__":
+    main()
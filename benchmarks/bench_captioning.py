@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from ._harness import emit, import_plugin
+from .fakes import FakeCaptionProvider
+
+"""
+图片描述基准: 同一个表情包在群里被发 REPEATS 次(一部分同时到达)，另有若干条消息各带多张不同的图片。
+
+对比逐张串行请求(旧实现)与 CaptionService(并发 + 合并进行中的请求 + 持久化缓存)的
+提供商调用次数和总耗时，并验证重启后缓存仍然命中。
+用法: python -m benchmarks.bench_captioning [repeats]
+"""
+
+REPEATS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+IMAGES_PER_MESSAGE = 4
+MESSAGES = 5
+LATENCY = 0.2
+
+
+def _write_images(tmp: str) -> tuple[str, list[list[str]]]:
+    meme = os.path.join(tmp, "meme.png")
+    with open(meme, "wb") as f:
+        f.write(b"\x89PNG meme" * 100)
+    messages = []
+    for m in range(MESSAGES):
+        paths = []
+        for i in range(IMAGES_PER_MESSAGE):
+            path = os.path.join(tmp, f"img_{m}_{i}.png")
+            with open(path, "wb") as f:
+                f.write(f"\x89PNG {m} {i}".encode() * 100)
+            paths.append(path)
+        messages.append(paths)
+    return meme, messages
+
+
+async def _legacy(meme: str, messages: list[list[str]]) -> dict:
+    provider = FakeCaptionProvider(LATENCY)
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        await provider.text_chat(prompt="describe", image_urls=[meme])
+    for paths in messages:
+        for path in paths:
+            await provider.text_chat(prompt="describe", image_urls=[path])
+    return {"provider_calls": provider.calls, "elapsed_s": time.perf_counter() - start}
+
+
+async def _service(CaptionService, db: str, meme: str, messages: list[list[str]]) -> dict:
+    provider = FakeCaptionProvider(LATENCY)
+    service = CaptionService(db, concurrency=4)
+    start = time.perf_counter()
+    # 前一半同时到达(合并进行中的请求)，后一半在第一次描述完成后陆续到达(命中缓存)
+    burst = REPEATS // 2
+    await asyncio.gather(*(service.caption(provider, [meme], "describe") for _ in range(burst)))
+    for _ in range(REPEATS - burst):
+        await service.caption(provider, [meme], "describe")
+    for paths in messages:
+        await service.caption_each(provider, paths, "describe")
+    elapsed = time.perf_counter() - start
+    await service.close()
+    return {
+        "provider_calls": provider.calls,
+        "max_concurrency": provider.max_active,
+        "elapsed_s": elapsed,
+        **service.stats.to_dict(),
+    }
+
+
+async def _cancelled_leader(CaptionService) -> dict:
+    """第一个请求被取消时，等待同一张图片的其他请求应当自己重新发起，而不是跟着被取消"""
+    provider = FakeCaptionProvider(LATENCY)
+    service = CaptionService()
+    url = "base64://bWVtZQ=="
+    leader = asyncio.create_task(service.caption(provider, [url], "describe"))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(service.caption(provider, [url], "describe")) for _ in range(3)]
+    await asyncio.sleep(LATENCY / 2)
+    leader.cancel()
+    outcomes = await asyncio.gather(*waiters, return_exceptions=True)
+    assert all(isinstance(o, str) for o in outcomes), outcomes
+    await service.close()
+    return {"waiters_ok": len(outcomes), "provider_calls": provider.calls}
+
+
+async def main():
+    CaptionService = import_plugin("captioning").CaptionService
+    with tempfile.TemporaryDirectory() as tmp:
+        meme, messages = _write_images(tmp)
+        db = os.path.join(tmp, "captions.db")
+        results = {
+            "repeats": REPEATS,
+            "images": REPEATS + MESSAGES * IMAGES_PER_MESSAGE,
+            "legacy": await _legacy(meme, messages),
+            "service": await _service(CaptionService, db, meme, messages),
+            # 重启后同样的负载应当全部命中持久化缓存
+            "service_warm_restart": await _service(CaptionService, db, meme, messages),
+            "cancelled_leader": await _cancelled_leader(CaptionService),
+        }
+    emit("captioning", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
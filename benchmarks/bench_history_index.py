@@ -0,0 +1,152 @@
+import asyncio
+import random
+import sys
+import time
+
+from ._harness import emit, import_plugin, summarize
+from .fakes import FakeContext, FakeEvent, FakeProviderRequest, make_astrbot_config
+
+"""
+聊天记录检索基准: 一个会话 MESSAGES 条消息(最大条数也是 MESSAGES)时的索引维护和检索耗时，以及 prompt 的缩减。
+
+消息由随机的中文词(两字)和少量英文词组成，其中每隔 NEEDLE_EVERY 条放一条带独有词的"针"。
+- index: BM25Index 建立索引、滚动窗口下每条消息的追加 + 淘汰耗时、QUERIES 次检索的延迟分位数，
+  以及用针的独有词(加上几个随机词)检索时针出现在前 TOP_K 条中的比例
+- prompt: LongTermMemory.on_req_llm 注入全部记录和开启检索(最近 RECENT 条 + 相关的 TOP_K 条)时的请求大小和耗时
+用法: python -m benchmarks.bench_history_index [messages]
+"""
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+QUERIES = 1000
+REQUESTS = 200
+TOP_K = 20
+RECENT = 30
+NEEDLE_EVERY = 97
+
+CHARS = (
+    "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而"
+    "方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好"
+    "应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向"
+    "道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特"
+)
+ENGLISH = ("python", "docker", "github", "linux", "api", "bug", "deploy", "gpu", "cache", "redis")
+
+
+def _vocab(rng: random.Random, size: int = 800) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add(rng.choice(CHARS) + rng.choice(CHARS))
+    return sorted(words) + list(ENGLISH)
+
+
+def _corpus(rng: random.Random, vocab: list[str]) -> tuple[list[str], dict[int, str]]:
+    """消息文本和 {针的下标: 独有词}"""
+    texts = []
+    needles = {}
+    for i in range(MESSAGES):
+        words = rng.choices(vocab, k=rng.randint(4, 12))
+        if i % NEEDLE_EVERY == 0:
+            token = f"needle{i}"
+            needles[i] = token
+            words.insert(rng.randrange(len(words) + 1), f" {token} ")
+        texts.append("".join(words))
+    return texts, needles
+
+
+def _index(texts: list[str], needles: dict[int, str], vocab: list[str], rng: random.Random) -> dict:
+    BM25Index = import_plugin("history_index").BM25Index
+    index = BM25Index()
+    t0 = time.perf_counter()
+    for seq, text in enumerate(texts):
+        index.add(seq, text)
+    build_s = time.perf_counter() - t0
+
+    # 滚动窗口: 每追加一条淘汰最早的一条，索引大小保持不变
+    t0 = time.perf_counter()
+    for seq, text in enumerate(texts, start=len(texts)):
+        index.remove(seq - len(texts))
+        index.add(seq, text)
+    rolling_us = (time.perf_counter() - t0) / len(texts) * 1e6
+    assert len(index) == len(texts)
+
+    samples = []
+    for _ in range(QUERIES):
+        query = "".join(rng.choices(vocab, k=rng.randint(3, 8)))
+        t0 = time.perf_counter()
+        index.search(query, TOP_K)
+        samples.append(time.perf_counter() - t0)
+
+    hits = 0
+    for i, token in needles.items():
+        query = "".join(rng.choices(vocab, k=3)) + f" {token}"
+        top = index.search(query, TOP_K)
+        hits += (i + len(texts)) in top
+    return {
+        "build_ms": build_s * 1000,
+        "rolling_add_remove_us": rolling_us,
+        "query": summarize(samples),
+        "needle_hit_rate": hits / len(needles),
+        "index_bytes": index.nbytes,
+    }
+
+
+async def _prompt(texts: list[str], needles: dict[int, str], retrieval: bool) -> dict:
+    from astrbot.api.message_components import Plain
+
+    estimate_tokens = import_plugin("chat_history").estimate_tokens
+    ltm_mod = import_plugin("long_term_memory")
+    context = FakeContext(config=make_astrbot_config(caption_provider_id=None, max_cnt=MESSAGES))
+    ltm = ltm_mod.LongTermMemory(
+        None,
+        context,
+        {
+            "persist": False,
+            "max_resident_mb": 0,
+            "retrieval_enable": retrieval,
+            "retrieval_top_k": TOP_K,
+            "retrieval_recent": RECENT,
+        },
+    )
+    umo = "aiocqhttp:GroupMessage:1"
+    for i, text in enumerate(texts):
+        event = FakeEvent(umo, [Plain(text=text)], text, (str(i % 50), f"user{i % 50}"), "1")
+        await ltm.handle_message(event)
+
+    samples, tokens = [], []
+    hits = 0
+    for i, token in list(needles.items())[:REQUESTS]:
+        event = FakeEvent(umo, [], f"还记得 {token} 吗", group_id="1")
+        req = FakeProviderRequest(event.message_str)
+        t0 = time.perf_counter()
+        await ltm.on_req_llm(event, req)
+        samples.append(time.perf_counter() - t0)
+        tokens.append(estimate_tokens(req.system_prompt))
+        hits += token in req.system_prompt
+    history = ltm.session_chats.get(umo)
+    return {
+        "ltm": summarize(samples),
+        "mean_prompt_tokens": sum(tokens) / len(tokens),
+        "needle_in_prompt_rate": hits / len(samples),
+        "resident_bytes": ltm.session_chats.resident_bytes,
+        "history": len(history),
+    }
+
+
+async def main():
+    rng = random.Random(0)
+    vocab = _vocab(rng)
+    texts, needles = _corpus(rng, vocab)
+    results = {"messages": MESSAGES, "top_k": TOP_K, "recent": RECENT}
+    results["index"] = _index(texts, needles, vocab, rng)
+    full = await _prompt(texts, needles, retrieval=False)
+    retrieval = await _prompt(texts, needles, retrieval=True)
+    results["prompt"] = {
+        "full_history": full,
+        "retrieval": retrieval,
+        "prompt_tokens_ratio": retrieval["mean_prompt_tokens"] / full["mean_prompt_tokens"],
+    }
+    emit("history_index", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
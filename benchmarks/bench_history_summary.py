@@ -0,0 +1,121 @@
+import asyncio
+import random
+import sys
+import time
+
+from ._harness import emit, import_plugin, summarize
+from .fakes import (
+    FakeCaptionProvider,
+    FakeChatProvider,
+    FakeContext,
+    FakeProviderRequest,
+    FakeSummaryProvider,
+    GroupChatWorkload,
+    allow_fake_providers,
+    fake_conversation,
+)
+
+"""
+滚动摘要基准: 注入全部聊天记录和注入摘要 + 最近记录的 prompt 大小与请求耗时。
+
+GROUPS 个群各写入 HISTORY 条消息(最大条数 300)，然后随机对各群发起 REQUESTS 次请求:
+- ltm_ms: LongTermMemory.on_req_llm 的耗时(请求装饰)
+- llm_ms: 假对话提供商的耗时，固定延迟加上每个 prompt 字符 CHAR_LATENCY 秒，模拟 prefill 随 prompt 增长
+- prompt_chars / prompt_tokens: 请求的大小
+
+摘要由 FakeSummaryProvider 在写入期间于后台生成，同时记录开启摘要后写入耗时是否受影响。
+用法: python -m benchmarks.bench_history_summary [groups] [history] [requests]
+"""
+
+GROUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+HISTORY = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+REQUESTS = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+CHAR_LATENCY = 2e-6
+SUMMARY_LATENCY = 0.05
+
+LTM_CONFIG = {
+    "persist": False,
+    "lazy_caption": True,
+    "summary_provider_id": "fake_summary",
+    "summary_threshold": 100,
+    "summary_keep_recent": 50,
+    "summary_concurrency": 4,
+}
+
+
+async def _run(summary: bool) -> dict:
+    ltm_mod = import_plugin("long_term_memory")
+    allow_fake_providers(
+        ltm_mod,
+        import_plugin("history_summary"),
+        fakes=(FakeCaptionProvider,),
+    )
+    estimate_tokens = import_plugin("chat_history").estimate_tokens
+    context = FakeContext(
+        chat_provider=FakeChatProvider(latency=0.005, char_latency=CHAR_LATENCY),
+        summary_provider=FakeSummaryProvider(latency=SUMMARY_LATENCY),
+    )
+    ltm = ltm_mod.LongTermMemory(
+        None, context, {**LTM_CONFIG, "summary_enable": summary}
+    )
+    ltm.start()
+    try:
+        workload = GroupChatWorkload(GROUPS, image_ratio=0.1)
+        ingest = []
+        for _ in range(HISTORY):
+            for group in range(GROUPS):
+                event = workload.message(group, quote=False)
+                t0 = time.perf_counter()
+                await ltm.handle_message(event)
+                ingest.append(time.perf_counter() - t0)
+            # 让后台的摘要任务有机会运行
+            await asyncio.sleep(0)
+        if ltm.summarizer:
+            await ltm.summarizer.join()
+
+        rng = random.Random(0)
+        conversation = fake_conversation()
+        decorate, llm, chars, tokens = [], [], [], []
+        for _ in range(REQUESTS):
+            event = workload.message(rng.randrange(GROUPS), quote=False)
+            req = FakeProviderRequest(event.message_str, conversation=conversation)
+            t0 = time.perf_counter()
+            await ltm.on_req_llm(event, req)
+            decorate.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            await context.chat_provider.text_chat(prompt=req.prompt, system_prompt=req.system_prompt)
+            llm.append(time.perf_counter() - t0)
+            chars.append(req.size())
+            tokens.append(estimate_tokens(req.prompt) + estimate_tokens(req.system_prompt))
+        return {
+            "ingest": summarize(ingest),
+            "ltm": summarize(decorate),
+            "llm": summarize(llm),
+            "mean_prompt_chars": sum(chars) / len(chars),
+            "mean_prompt_tokens": sum(tokens) / len(tokens),
+            "summary": ltm.summarizer.stats() if ltm.summarizer else None,
+            "summary_calls": context.summary_provider.calls,
+        }
+    finally:
+        await ltm.close()
+
+
+async def main():
+    full = await _run(False)
+    summarized = await _run(True)
+    emit(
+        "history_summary",
+        {
+            "groups": GROUPS,
+            "history": HISTORY,
+            "requests": REQUESTS,
+            "full_history": full,
+            "summarized": summarized,
+            "prompt_tokens_ratio": summarized["mean_prompt_tokens"] / full["mean_prompt_tokens"],
+            "llm_speedup": full["llm"]["mean_ms"] / summarized["llm"]["mean_ms"],
+        },
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from ._harness import emit, import_plugin
+from .fakes import FakeStreamingProvider
+
+IncrementalSpeech = import_plugin("tts.pipeline").IncrementalSpeech
+split_sentences = import_plugin("tts.pipeline").split_sentences
+ArraySink = import_plugin("tts.stream_player").ArraySink
+StubTTSServer = import_plugin("tts.stub_server").StubTTSServer
+TTSClient = import_plugin("tts.tts_api").TTSClient
+TTSPlayer = import_plugin("tts.tts_api").TTSPlayer
+
+"""
+增量 TTS 的 token-to-speech 延迟: 首个 LLM token 到第一个采样被播放。
+
+对比等待完整回复后再合成(on_llm_response 路径)与边接收 token 边切句合成。
+"""
+
+REPLY = (
+    "好的，我来给你讲讲这个问题。首先，我们需要明确目标是什么。"
+    "其次，要把大问题拆成几个可以独立完成的小问题。"
+    "最后，把经验整理下来，下次遇到类似的问题就能更快处理了。"
+)
+
+
+def _player() -> TTSPlayer:
+    return TTSPlayer(sink_factory=lambda *a: ArraySink(*a, speed=8.0), prebuffer_ms=100)
+
+
+async def _after_completion(client: TTSClient, provider: FakeStreamingProvider) -> float:
+    first_token_at = None
+    parts = []
+    async for token in provider.stream():
+        first_token_at = first_token_at or time.monotonic()
+        parts.append(token)
+    stats = await _player().play_async_segments(
+        client.pipeline.segments(split_sentences("".join(parts)))
+    )
+    return stats.first_sample_at - first_token_at
+
+
+async def _incremental(client: TTSClient, provider: FakeStreamingProvider) -> tuple[float, float]:
+    speech = IncrementalSpeech()
+
+    async def pump():
+        try:
+            async for token in provider.stream():
+                speech.feed(token)
+        finally:
+            speech.close()
+
+    pump_task = asyncio.create_task(pump())
+    await client.play_incremental(speech, player=_player())
+    await pump_task
+    return speech.latency.token_to_speech, speech.latency.token_to_sentence
+
+
+async def main():
+    server = StubTTSServer(first_byte_delay=0.05, first_byte_per_char=0.005, seconds_per_char=0.2)
+    base_url = await server.start()
+    client = TTSClient(base_url, segment_concurrency=2)
+    results = {}
+    try:
+        for interval in (0.02, 0.05):
+            provider = FakeStreamingProvider(REPLY, token_interval=interval)
+            t2s_full = await _after_completion(client, provider)
+            t2s_inc, t2sent = await _incremental(client, provider)
+            results[f"token_interval_{int(interval * 1000)}ms"] = {
+                "after_completion_ms": t2s_full * 1000,
+                "incremental_ms": t2s_inc * 1000,
+                "incremental_first_sentence_ms": t2sent * 1000,
+            }
+    finally:
+        await client.close()
+        await server.stop()
+    emit("incremental_tts", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,139 @@
+import asyncio
+import sys
+import time
+
+from ._harness import emit, import_plugin, summarize
+from .fakes import (
+    FakeCaptionProvider,
+    FakeContext,
+    GroupChatWorkload,
+    allow_fake_providers,
+)
+
+"""
+群聊消息写入基准: 图片描述提供商越来越慢时，群消息钩子本身的耗时。
+
+消息以 RATE 条/秒到达 GROUPS 个群，每条消息一个任务(与 AstrBot 并发处理事件一致)，30% 带图片，图片在写入时描述(lazy_caption 关闭)。
+- inline: 钩子中直接 await LongTermMemory.handle_message，耗时包含图片描述
+- queued: MyPlugin.on_group_message，只解析和入队，由写入队列在后台描述和写入
+
+每个描述延迟下输出两种方式的钩子延迟分位数，以及队列处理完全部消息的时间。
+最后用一个很小的队列和很慢的描述对比两种溢出策略丢弃的消息和图片数。
+用法: python -m benchmarks.bench_ingest_queue [messages]
+"""
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+RATE = 1000
+GROUPS = 50
+CAPTION_LATENCIES = (0.0, 0.05, 0.2, 0.5)
+TICK = 0.01
+
+
+def _plugin(caption_latency: float, ltm_cfg: dict | None = None):
+    main_mod = import_plugin("main")
+    allow_fake_providers(import_plugin("long_term_memory"), fakes=(FakeCaptionProvider,))
+    context = FakeContext(caption_provider=FakeCaptionProvider(latency=caption_latency))
+    config = {
+        "tts": {"cache_enable": False, "incremental": False},
+        "ltm": {"persist": False, "lazy_caption": False, **(ltm_cfg or {})},
+        "caption": {"cache_enable": False, "concurrency": 16},
+    }
+    return main_mod.MyPlugin(context, config)
+
+
+async def _group_hook(plugin, event):
+    async for _ in plugin.on_group_message(event):
+        pass
+
+
+async def _arrive(hook, workload: GroupChatWorkload) -> list[float]:
+    """按 RATE 条/秒产生消息，每条消息在独立的任务中调用钩子，返回每次钩子调用的耗时"""
+    samples = []
+
+    async def one(event):
+        t0 = time.perf_counter()
+        await hook(event)
+        samples.append(time.perf_counter() - t0)
+
+    tasks = []
+    per_tick = max(1, int(RATE * TICK))
+    sent = 0
+    while sent < MESSAGES:
+        for _ in range(min(per_tick, MESSAGES - sent)):
+            tasks.append(asyncio.create_task(one(workload.message(quote=False))))
+            sent += 1
+        await asyncio.sleep(TICK)
+    await asyncio.gather(*tasks)
+    return samples
+
+
+async def _inline(caption_latency: float) -> dict:
+    plugin = _plugin(caption_latency)
+    await plugin.initialize()
+    try:
+        workload = GroupChatWorkload(GROUPS, image_ratio=0.3)
+        start = time.perf_counter()
+        samples = await _arrive(plugin.ltm.handle_message, workload)
+        return {**summarize(samples), "total_s": time.perf_counter() - start}
+    finally:
+        await plugin.terminate()
+
+
+async def _queued(caption_latency: float) -> dict:
+    plugin = _plugin(caption_latency)
+    await plugin.initialize()
+    try:
+        workload = GroupChatWorkload(GROUPS, image_ratio=0.3)
+        start = time.perf_counter()
+        samples = await _arrive(lambda event: _group_hook(plugin, event), workload)
+        await plugin.ltm.ingest_queue.join()
+        stats = plugin.ltm.ingest_queue.stats()
+        records = sum(len(plugin.ltm.session_chats.get(workload.umo(g)) or ()) for g in range(GROUPS))
+        assert stats["dropped"] == 0 and records == MESSAGES, (stats, records)
+        return {
+            **summarize(samples),
+            "total_s": time.perf_counter() - start,
+            "batches": stats["batches"],
+            "max_depth": stats["max_depth"],
+        }
+    finally:
+        await plugin.terminate()
+
+
+async def _overflow(policy: str) -> dict:
+    plugin = _plugin(
+        0.5,
+        {"ingest_queue_size": 100, "ingest_workers": 2, "ingest_batch_size": 8, "ingest_overflow": policy},
+    )
+    await plugin.initialize()
+    try:
+        workload = GroupChatWorkload(GROUPS, image_ratio=0.3)
+        samples = await _arrive(lambda event: _group_hook(plugin, event), workload)
+        await plugin.ltm.ingest_queue.join()
+        stats = plugin.ltm.ingest_queue.stats()
+        return {
+            **summarize(samples),
+            "dropped_messages": stats["dropped"],
+            "images_dropped": stats["images_dropped"],
+            "max_depth": stats["max_depth"],
+        }
+    finally:
+        await plugin.terminate()
+
+
+async def main():
+    results = {"messages": MESSAGES, "rate": RATE, "groups": GROUPS}
+    for latency in CAPTION_LATENCIES:
+        results[f"caption_{int(latency * 1000)}ms"] = {
+            "inline": await _inline(latency),
+            "queued": await _queued(latency),
+        }
+    base = results[f"caption_{int(CAPTION_LATENCIES[0] * 1000)}ms"]["queued"]["p99_ms"]
+    slow = results[f"caption_{int(CAPTION_LATENCIES[-1] * 1000)}ms"]["queued"]["p99_ms"]
+    results["queued_p99_growth"] = slow / base if base else 0.0
+    results["overflow"] = {policy: await _overflow(policy) for policy in ("drop_oldest", "drop_images")}
+    emit("ingest_queue", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+import asyncio
+import base64
+import sys
+import time
+from types import SimpleNamespace
+
+from ._harness import emit, import_plugin
+from .fakes import FakeCaptionProvider
+
+"""
+延迟图片描述基准: 一个很忙的群(MESSAGES 条消息，其中 IMAGE_RATIO 带图)，机器人每 REPLY_EVERY 条才回复一次。
+
+对比写入时立即描述(eager)与只为注入请求的窗口描述(lazy)的提供商调用次数和写入耗时。
+用法: python -m benchmarks.bench_lazy_caption [messages] [reply_every]
+"""
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+REPLY_EVERY = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+IMAGE_RATIO = 5  # 每 5 条消息 1 张图片
+MAX_CNT = 300
+TOKEN_BUDGET = 2000
+LATENCY = 0.001
+
+
+async def _run(lazy: bool) -> dict:
+    mod = import_plugin("long_term_memory")
+    IMAGE_MARK = import_plugin("chat_history").IMAGE_MARK
+    LTMSettings = import_plugin("config_snapshot").LTMSettings
+    provider = FakeCaptionProvider(LATENCY)
+    # 让 isinstance(provider, Provider) 检查通过
+    mod.Provider = FakeCaptionProvider
+    context = SimpleNamespace(get_provider_by_id=lambda _: provider)
+    ltm = mod.LongTermMemory(
+        None, context, {"lazy_caption": lazy, "token_budget": TOKEN_BUDGET}
+    )
+    cfg = LTMSettings(
+        image_caption=True,
+        image_caption_provider_id="fake_caption",
+        image_caption_prompt="describe",
+        max_cnt=MAX_CNT,
+    )
+    umo = "aiocqhttp:GroupMessage:1"
+    history = await ltm._get_history(umo, MAX_CNT, create=True)
+    ingest = 0.0
+    render = 0.0
+    for i in range(MESSAGES):
+        start = time.perf_counter()
+        if i % IMAGE_RATIO == 0:
+            # base64:// 不需要下载就能按内容哈希
+            url = "base64://" + base64.b64encode(f"image {i}".encode()).decode()
+            if lazy:
+                record = ltm._new_record(f"user{i % 37}", f" 看这个 {IMAGE_MARK}", (url,))
+            else:
+                captions = await ltm.get_image_captions([url], cfg.image_caption_provider_id, "describe")
+                record = ltm._new_record(f"user{i % 37}", f" 看这个 [Image: {captions[0]}]")
+        else:
+            record = ltm._new_record(f"user{i % 37}", " 今天谁去打球？")
+        ltm.session_chats.append(umo, history, record)
+        ingest += time.perf_counter() - start
+        if (i + 1) % REPLY_EVERY == 0:
+            start = time.perf_counter()
+            window = history.window_start(TOKEN_BUDGET)
+            if lazy:
+                await ltm._resolve_captions(umo, history, window, cfg)
+                window = history.window_start(TOKEN_BUDGET)
+            history.render(window)
+            render += time.perf_counter() - start
+    await ltm.captions.close()
+    return {
+        "provider_calls": provider.calls,
+        "ingest_s": ingest,
+        "render_s": render,
+        "replies": MESSAGES // REPLY_EVERY,
+    }
+
+
+async def main():
+    results = {
+        "messages": MESSAGES,
+        "images": (MESSAGES + IMAGE_RATIO - 1) // IMAGE_RATIO,
+        "eager": await _run(False),
+        "lazy": await _run(True),
+    }
+    emit("lazy_caption", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+import datetime
+import gc
+import sys
+import time
+import tracemalloc
+
+from chat_history import ChatRecord, SessionHistory, now_ts
+
+from ._harness import emit
+
+"""
+群聊记录写入微基准: GROUPS 个群 x MAX_CNT 条上限，每个群写入 MESSAGES_PER_GROUP 条消息。
+
+对比旧实现(list + 预格式化字符串 + pop(0))与 SessionHistory(deque 环形结构 + 紧凑记录)的
+写入速率和常驻内存。用法: python -m benchmarks.bench_ltm_history [groups] [max_cnt]
+"""
+
+GROUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+MAX_CNT = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+MESSAGES_PER_GROUP = MAX_CNT + MAX_CNT // 3  # 写满后继续写入，覆盖淘汰路径
+
+TEXTS = [" 哈哈哈", " 今天谁去打球？", " [Image]", " 收到 [At: 小明]", " 这个问题我也遇到过，重启一下就好了"]
+
+
+def _legacy(store: dict, umo: str, nickname: str, text: str):
+    datetime_str = datetime.datetime.now().strftime("%H:%M:%S")
+    store.setdefault(umo, []).append(f"[{nickname}/{datetime_str}]: {text}")
+    if len(store[umo]) > MAX_CNT:
+        store[umo].pop(0)
+
+
+def _ring(store: dict, umo: str, nickname: str, text: str):
+    history = store.get(umo)
+    if history is None:
+        history = store[umo] = SessionHistory(MAX_CNT)
+    history.append(ChatRecord(nickname, now_ts(), text))
+
+
+def _ingest(append) -> dict:
+    store = {}
+    for i in range(MESSAGES_PER_GROUP):
+        for g in range(GROUPS):
+            text = f"{TEXTS[(i + g) % len(TEXTS)]} #{i}"
+            # 每条消息的昵称都是新字符串，和真实事件一致
+            append(store, f"aiocqhttp:GroupMessage:{g}", f"user{g % 97}_{i % 13}", text)
+    return store
+
+
+def _measure(append) -> dict:
+    gc.collect()
+    t0 = time.perf_counter()
+    store = _ingest(append)
+    elapsed = time.perf_counter() - t0
+    total = GROUPS * MESSAGES_PER_GROUP
+    del store
+    gc.collect()
+
+    tracemalloc.start()
+    store = _ingest(append)
+    resident, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del store
+    return {
+        "msgs_per_s": total / elapsed,
+        "resident_mb": resident / 1024 / 1024,
+        "bytes_per_msg": resident / (GROUPS * MAX_CNT),
+    }
+
+
+def main():
+    emit(
+        "ltm_history",
+        {
+            "groups": GROUPS,
+            "max_cnt": MAX_CNT,
+            "legacy_list": _measure(_legacy),
+            "ring": _measure(_ring),
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
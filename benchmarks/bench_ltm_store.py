@@ -0,0 +1,85 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from chat_history import ChatRecord, now_ts
+
+from ._harness import emit, import_plugin
+
+"""
+聊天记录持久化基准:
+
+- ingest: 开启/关闭持久化时的消息写入速率(持久化只在内存中排队，后台批量提交)
+- startup: 磁盘上已有 SESSIONS 个会话时，打开存储的耗时，以及第一次访问某个会话时加载它的耗时
+
+用法: python -m benchmarks.bench_ltm_store [sessions] [max_cnt]
+"""
+
+SESSIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+MAX_CNT = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+INGEST_MESSAGES = 200_000
+
+TEXTS = [" 哈哈哈", " 今天谁去打球？", " [Image]", " 收到 [At: 小明]", " 这个问题我也遇到过，重启一下就好了"]
+
+
+async def _ingest(store) -> float:
+    from chat_history import SessionHistory
+
+    sessions: dict = {}
+    if store:
+        store.start()
+    start = time.perf_counter()
+    for i in range(INGEST_MESSAGES):
+        umo = f"aiocqhttp:GroupMessage:{i % 1000}"
+        record = ChatRecord(f"user{i % 37}", now_ts(), TEXTS[i % len(TEXTS)], 8)
+        history = sessions.get(umo)
+        if history is None:
+            history = sessions[umo] = SessionHistory(MAX_CNT)
+        history.append(record)
+        if store:
+            store.append(umo, record, MAX_CNT)
+        if i % 1000 == 0:
+            # 模拟消息之间的调度点，让后台提交有机会运行
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    if store:
+        await store.close()
+    return INGEST_MESSAGES / elapsed
+
+
+async def main():
+    HistoryStore = import_plugin("ltm_store").HistoryStore
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {"memory_only_msgs_per_s": await _ingest(None)}
+        store = HistoryStore(os.path.join(tmp, "ingest.db"))
+        results["persist_msgs_per_s"] = await _ingest(store)
+
+        path = os.path.join(tmp, "startup.db")
+        store = HistoryStore(path)
+        for s in range(SESSIONS):
+            umo = f"aiocqhttp:GroupMessage:{s}"
+            for i in range(MAX_CNT):
+                store.append(umo, ChatRecord(f"user{i % 37}", now_ts(), TEXTS[i % len(TEXTS)], 8), MAX_CNT)
+        await store.close()
+
+        start = time.perf_counter()
+        store = HistoryStore(path)
+        opened = time.perf_counter()
+        records = await store.load(f"aiocqhttp:GroupMessage:{SESSIONS // 2}", MAX_CNT)
+        loaded = time.perf_counter()
+        await store.close()
+        results.update(
+            sessions=SESSIONS,
+            max_cnt=MAX_CNT,
+            db_bytes=os.path.getsize(path),
+            open_ms=(opened - start) * 1000,
+            first_session_load_ms=(loaded - opened) * 1000,
+            first_session_records=len(records),
+        )
+    emit("ltm_store", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,119 @@
+import struct
+import sys
+import time
+
+import numpy as np
+
+from ._harness import emit, import_plugin
+
+WavStreamDecoder = import_plugin("tts.stream_player").WavStreamDecoder
+
+"""
+PCM 解码吞吐基准(采样点/秒): SECONDS 秒 32kHz int16 音频，按奇数字节的块切分(每块都会切开一帧)，
+块大小取网络流的 4KB 和缓存回放的 64KB 两种。
+
+- legacy: 改动前的路径，frombuffer -> astype -> 除法，每块先与上一块剩下的字节拼接，输出一维交错数组
+- feed: WavStreamDecoder.feed，每块分配一个 (帧数, 声道数) 的输出数组
+- feed_into: WavStreamDecoder.feed_into，解码到预分配的缓冲区，不分配中间数组
+
+单声道和立体声各测一次，并验证三者的解码结果一致。
+用法: python -m benchmarks.bench_pcm_decode [seconds]
+"""
+
+SECONDS = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+CHUNK_SIZES = (4096 | 1, 65536 | 1)
+SAMPLE_RATE = 32000
+ROUNDS = 3
+
+
+def _wav(channels: int, chunk_size: int) -> tuple[np.ndarray, list[bytes]]:
+    rng = np.random.default_rng(0)
+    pcm = (rng.standard_normal(SAMPLE_RATE * SECONDS * channels) * 3000).astype("<i2")
+    data = pcm.tobytes()
+    header = (
+        b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, SAMPLE_RATE, SAMPLE_RATE * channels * 2, channels * 2, 16)
+        + b"data" + struct.pack("<I", len(data))
+    )
+    data = header + data
+    return pcm, [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def _legacy(chunks: list[bytes]) -> list[np.ndarray]:
+    # 改动前: 头部固定 44 字节，只按采样宽度对齐
+    out = []
+    pending = b""
+    header = b""
+    ready = False
+    for chunk in chunks:
+        if not ready:
+            header += chunk
+            if len(header) < 44:
+                continue
+            chunk, header, ready = header[44:], b"", True
+        if pending:
+            chunk = pending + chunk
+        usable = len(chunk) - len(chunk) % 2
+        pending = bytes(chunk[usable:])
+        data = np.frombuffer(chunk[:usable], dtype=np.int16)
+        out.append(data.astype(np.float32) / 32768.0)
+    return out
+
+
+def _feed(chunks: list[bytes]) -> list[np.ndarray]:
+    decoder = WavStreamDecoder()
+    return [decoder.feed(chunk) for chunk in chunks]
+
+
+def _feed_into(chunks: list[bytes], keep: bool = False) -> list[np.ndarray]:
+    decoder = WavStreamDecoder()
+    out = []
+    buf = None
+    for chunk in chunks:
+        if not decoder.format_ready:
+            chunk = decoder.strip_header(chunk)
+            if chunk is None:
+                continue
+        if buf is None:
+            buf = np.empty((decoder.max_frames(max(map(len, chunks))) + 1, decoder.channels), dtype=np.float32)
+        n = decoder.feed_into(chunk, buf)
+        if keep:
+            out.append(buf[:n].copy())
+    return out
+
+
+def _throughput(fn, chunks: list[bytes], samples: int) -> float:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    return samples / best
+
+
+def main():
+    results = {"seconds": SECONDS}
+    for chunk_size in CHUNK_SIZES:
+        for channels in (1, 2):
+            pcm, chunks = _wav(channels, chunk_size)
+            expected = pcm.astype(np.float32) / 32768.0
+            assert np.array_equal(np.concatenate(_legacy(chunks)), expected)
+            decoded = np.concatenate([a for a in _feed(chunks) if len(a)])
+            assert decoded.shape == (len(pcm) // channels, channels)
+            assert np.array_equal(decoded.reshape(-1), expected)
+            assert np.array_equal(np.concatenate(_feed_into(chunks, keep=True)).reshape(-1), expected)
+
+            legacy = _throughput(_legacy, chunks, len(pcm))
+            feed = _throughput(_feed, chunks, len(pcm))
+            feed_into = _throughput(_feed_into, chunks, len(pcm))
+            results[f"chunk_{chunk_size}_channels_{channels}"] = {
+                "legacy_samples_per_s": legacy,
+                "feed_samples_per_s": feed,
+                "feed_into_samples_per_s": feed_into,
+                "speedup_feed_into": feed_into / legacy,
+            }
+    emit("pcm_decode", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import builtins
+import copy
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from astrbot.core.provider.func_tool_manager import ToolSet
+
+from ._harness import emit, import_plugin, summarize
+from .fakes import FakePersonaManager, FakeToolManager, make_personas
+
+"""
+人格解析的单次请求开销: PERSONAS 个人格、TOOLS 个工具。
+
+legacy 复现旧的 _ensure_persona 中的人格查找(线性过滤)、预设对话深拷贝和工具集重建；
+registry 使用 PersonaRegistry(按名称索引 + 预计算的只读人格包 + 缓存工具集的写时复制视图)。
+用法: python -m benchmarks.bench_persona_registry [personas] [tools] [requests]
+"""
+
+PERSONAS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+TOOLS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+REQUESTS = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+
+
+def _legacy(ctx, persona_id: str, contexts: list):
+    persona = next(
+        builtins.filter(
+            lambda persona: persona["name"] == persona_id, ctx.persona_manager.personas_v3
+        ),
+        None,
+    )
+    if persona:
+        if begin_dialogs := copy.deepcopy(persona["_begin_dialogs_processed"]):
+            contexts[:0] = begin_dialogs
+    tmgr = ctx.get_llm_tool_manager()
+    if (persona and persona.get("tools") is None) or not persona:
+        toolset = tmgr.get_full_tool_set()
+        for tool in list(toolset):
+            if not tool.active:
+                toolset.remove_tool(tool.name)
+    else:
+        toolset = ToolSet()
+        if persona["tools"]:
+            for tool_name in persona["tools"]:
+                tool = tmgr.get_func(tool_name)
+                if tool and tool.active:
+                    toolset.add_tool(tool)
+    return toolset
+
+
+def _registry(registry, persona_id: str, contexts: list):
+    persona = registry.get(persona_id)
+    if persona and persona.begin_dialogs:
+        contexts[:0] = persona.contexts()
+    return registry.toolset_for(persona)
+
+
+def _measure(fn, target, ids: list[str]) -> list[float]:
+    samples = []
+    for persona_id in ids:
+        contexts = []
+        start = time.perf_counter()
+        fn(target, persona_id, contexts)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    PersonaRegistry = import_plugin("persona_registry").PersonaRegistry
+    tmgr = FakeToolManager(TOOLS)
+    ctx = SimpleNamespace(
+        persona_manager=FakePersonaManager(make_personas(PERSONAS, TOOLS)),
+        get_llm_tool_manager=lambda: tmgr,
+    )
+    rng = random.Random(0)
+    ids = [f"persona_{rng.randrange(PERSONAS)}" for _ in range(REQUESTS)]
+
+    registry = PersonaRegistry(ctx)
+    # 两种实现解析出的工具和预设对话必须一致，注入的预设对话是每个请求各自的普通 dict
+    for persona_id in ids[:200]:
+        legacy_contexts, registry_contexts = [], []
+        assert (
+            _legacy(ctx, persona_id, legacy_contexts).names()
+            == _registry(registry, persona_id, registry_contexts).names()
+        )
+        assert registry_contexts == legacy_contexts
+        assert all(type(msg) is dict for msg in registry_contexts)
+        if registry_contexts:
+            registry_contexts[0]["content"] = "modified"
+            assert registry.get(persona_id).contexts()[0]["content"] != "modified"
+
+    start = time.perf_counter()
+    registry = PersonaRegistry(ctx)
+    registry.get("persona_0")
+    build = time.perf_counter() - start
+
+    emit(
+        "persona_registry",
+        {
+            "personas": PERSONAS,
+            "tools": TOOLS,
+            "legacy": summarize(_measure(_legacy, ctx, ids)),
+            "registry": summarize(_measure(_registry, registry, ids)),
+            "registry_build_ms": build * 1000,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from ._harness import emit, import_plugin, summarize
+from .fakes import (
+    FakeCaptionProvider,
+    FakeContext,
+    FakeProviderRequest,
+    FakeSharedPreferences,
+    FakeSkillManager,
+    GroupChatWorkload,
+    allow_fake_providers,
+    build_fake_skills_prompt,
+    fake_conversation,
+)
+
+ArraySink = import_plugin("tts.stream_player").ArraySink
+WavStreamDecoder = import_plugin("tts.stream_player").WavStreamDecoder
+wav_header = import_plugin("tts.stub_server").wav_header
+TTSPlayer = import_plugin("tts.tts_api").TTSPlayer
+
+"""
+插件热路径的端到端基准，不需要运行中的 AstrBot 和模型服务(仍然需要安装 astrbot 包)。
+
+用假的 Context / 事件 / 请求 / 提供商驱动 MyPlugin 的各个钩子:
+- ingest: LongTermMemory.handle_message 写入 GROUPS 个群、每群 HISTORY 条消息(带图片、@、引用)
+- process_llm_request: 只做请求装饰(人格、图片描述、引用、系统提醒)
+- hooks: 完整的一轮 decorate_llm_req -> record_llm_resp_to_ltm -> after_message_sent
+- tts_decode: WAV 流解码吞吐，以及 TTSPlayer.play_stream 不限速播放到 ArraySink
+
+每个阶段输出吞吐、延迟分位数和 tracemalloc 峰值内存，结果为一行 JSON。
+用法: python -m benchmarks.bench_plugin [groups] [history] [requests]
+"""
+
+GROUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+HISTORY = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+REQUESTS = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+TTS_SECONDS = 60
+SAMPLE_RATE = 32000
+
+PLUGIN_CONFIG = {
+    # 不访问插件数据目录，不连接 TTS 服务
+    "tts": {"cache_enable": False, "incremental": False},
+    "ltm": {"persist": False, "lazy_caption": True, "token_budget": 4000},
+    "caption": {"cache_enable": False},
+    "metrics": {"enable": True, "trace": True},
+}
+
+
+def _memory(fn):
+    """执行协程函数，返回 (结果, tracemalloc 峰值字节数)"""
+
+    async def run():
+        tracemalloc.reset_peak()
+        result = await fn()
+        return result, tracemalloc.get_traced_memory()[1]
+
+    return run()
+
+
+async def _ingest(plugin, workload: GroupChatWorkload) -> dict:
+    samples = []
+    start = time.perf_counter()
+    for _ in range(HISTORY):
+        for group in range(GROUPS):
+            event = workload.message(group, quote=False)
+            t0 = time.perf_counter()
+            await plugin.ltm.handle_message(event)
+            samples.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return {
+        **summarize(samples),
+        "messages_per_s": len(samples) / elapsed,
+        "resident_bytes": plugin.ltm.session_chats.resident_bytes,
+        "resident_sessions": len(plugin.ltm.session_chats),
+    }
+
+
+def _request(event, conversation) -> FakeProviderRequest:
+    image_urls = []
+    for comp in event.get_messages():
+        url = getattr(comp, "file", None)
+        if isinstance(url, str) and url.startswith("base64://"):
+            image_urls.append(url)
+    return FakeProviderRequest(event.message_str, image_urls, conversation=conversation)
+
+
+async def _process(plugin, workload: GroupChatWorkload) -> dict:
+    samples = []
+    sizes = []
+    conversation = fake_conversation()
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        event = workload.message()
+        req = _request(event, conversation)
+        t0 = time.perf_counter()
+        await plugin.proc_llm_req.process_llm_request(event, req)
+        samples.append(time.perf_counter() - t0)
+        sizes.append(req.size())
+    elapsed = time.perf_counter() - start
+    return {
+        **summarize(samples),
+        "requests_per_s": len(samples) / elapsed,
+        "mean_request_chars": sum(sizes) / len(sizes),
+    }
+
+
+async def _hooks(plugin, workload: GroupChatWorkload, chat_provider) -> dict:
+    samples = []
+    sizes = []
+    conversation = fake_conversation()
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        event = workload.message()
+        req = _request(event, conversation)
+        t0 = time.perf_counter()
+        await plugin.decorate_llm_req(event, req)
+        resp = await chat_provider.text_chat(req.prompt)
+        await plugin.record_llm_resp_to_ltm(event, resp)
+        await plugin.after_message_sent(event)
+        samples.append(time.perf_counter() - t0)
+        sizes.append(req.size())
+    elapsed = time.perf_counter() - start
+    return {
+        **summarize(samples),
+        "requests_per_s": len(samples) / elapsed,
+        "mean_request_chars": sum(sizes) / len(sizes),
+        "stages": plugin.metrics.dump()["stages"],
+    }
+
+
+def _wav_chunks(seconds: int, chunk_size: int = 4096) -> list[bytes]:
+    rng = np.random.default_rng(0)
+    pcm = (rng.standard_normal(SAMPLE_RATE * seconds) * 3000).astype("<i2").tobytes()
+    data = wav_header(SAMPLE_RATE) + pcm
+    # 块大小取奇数倍，覆盖采样点跨块的情况
+    chunk_size |= 1
+    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+
+def _tts_decode() -> dict:
+    chunks = _wav_chunks(TTS_SECONDS)
+    decoder = WavStreamDecoder()
+    t0 = time.perf_counter()
+    samples = sum(len(decoder.feed(chunk)) for chunk in chunks)
+    decode_s = time.perf_counter() - t0
+
+    player = TTSPlayer(sink_factory=lambda *a: ArraySink(*a, speed=0), prebuffer_ms=100)
+    t0 = time.perf_counter()
+    stats = player.play_stream(iter(chunks))
+    play_s = time.perf_counter() - t0
+    return {
+        "audio_seconds": TTS_SECONDS,
+        "decode_samples_per_s": samples / decode_s,
+        "play_stream_samples_per_s": stats.samples_played / play_s if stats else 0.0,
+    }
+
+
+def _fake_skills(plugin, root: str, count: int = 5):
+    """技能管理器默认读取 AstrBot 数据目录，换成临时目录中的几个技能"""
+    skills_root = os.path.join(root, "skills")
+    for i in range(count):
+        os.makedirs(os.path.join(skills_root, f"skill_{i}"))
+        with open(os.path.join(skills_root, f"skill_{i}", "SKILL.md"), "w", encoding="utf-8") as f:
+            f.write(f"第 {i} 个技能: 处理某类任务的说明\n")
+    config_path = os.path.join(root, "skills.json")
+    with open(config_path, "w") as f:
+        f.write("{}")
+    SkillsPromptCache = import_plugin("skills_cache").SkillsPromptCache
+    plugin.proc_llm_req.skills_prompts = SkillsPromptCache(
+        FakeSkillManager(skills_root, config_path), build_prompt=build_fake_skills_prompt
+    )
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        await _run(tmp)
+
+
+async def _run(tmp: str):
+    main_mod = import_plugin("main")
+    allow_fake_providers(
+        import_plugin("process_llm_request"),
+        import_plugin("long_term_memory"),
+        fakes=(FakeCaptionProvider,),
+    )
+    context = FakeContext()
+    plugin = main_mod.MyPlugin(context, dict(PLUGIN_CONFIG))
+    # 会话配置从全局 sp 读取，换成内存中的假 sp
+    sp = FakeSharedPreferences(latency=0.0, jitter=0.0)
+    SessionServiceConfigCache = import_plugin("session_config").SessionServiceConfigCache
+    plugin.proc_llm_req.session_configs = SessionServiceConfigCache(sp)
+    _fake_skills(plugin, tmp)
+    await plugin.initialize()
+    workload = GroupChatWorkload(GROUPS)
+
+    tracemalloc.start()
+    results = {"groups": GROUPS, "history": HISTORY, "requests": REQUESTS}
+    try:
+        for name, fn in (
+            ("ingest", lambda: _ingest(plugin, workload)),
+            ("process_llm_request", lambda: _process(plugin, workload)),
+            ("hooks", lambda: _hooks(plugin, workload, context.chat_provider)),
+        ):
+            result, peak = await _memory(fn)
+            results[name] = {**result, "peak_alloc_bytes": peak}
+    finally:
+        tracemalloc.stop()
+        await plugin.terminate()
+    results["caption_calls"] = context.caption_provider.calls
+    results["tts_decode"] = _tts_decode()
+    emit("plugin", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+import asyncio
+import random
+import sys
+import time
+
+from ._harness import emit, import_plugin, summarize
+from .fakes import FakeSharedPreferences
+
+"""
+会话服务配置读取基准: 带人为延迟的假 sp(2ms + 0~3ms 抖动)，SESSIONS 个会话，
+每轮 BURST 个请求同时到达(同一会话的请求会并发)，共 ROUNDS 轮。
+
+对比每次请求直接 sp.get_async(旧实现)与 SessionServiceConfigCache 的请求准备耗时 p50/p99，
+并验证写入配置后缓存立即失效。
+用法: python -m benchmarks.bench_session_config [sessions] [rounds]
+"""
+
+SESSIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+ROUNDS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+BURST = 10
+KEY = "session_service_config"
+
+
+async def _run(get_persona) -> list[float]:
+    rng = random.Random(1)
+    samples = []
+
+    async def one(umo: str):
+        start = time.perf_counter()
+        await get_persona(umo)
+        samples.append(time.perf_counter() - start)
+
+    for _ in range(ROUNDS):
+        await asyncio.gather(
+            *(one(f"aiocqhttp:GroupMessage:{rng.randrange(SESSIONS)}") for _ in range(BURST))
+        )
+        await asyncio.sleep(0.001)
+    return samples
+
+
+async def main():
+    SessionServiceConfigCache = import_plugin("session_config").SessionServiceConfigCache
+    sp = FakeSharedPreferences()
+    for i in range(SESSIONS):
+        await sp.put_async("umo", f"aiocqhttp:GroupMessage:{i}", KEY, {"persona_id": f"p{i}"})
+
+    async def legacy(umo: str):
+        return (await sp.get_async(scope="umo", scope_id=umo, key=KEY, default={})).get("persona_id")
+
+    reads = sp.reads
+    legacy_samples = await _run(legacy)
+    legacy_reads = sp.reads - reads
+
+    cache = SessionServiceConfigCache(sp, ttl=10.0)
+
+    async def cached(umo: str):
+        return (await cache.get(umo)).get("persona_id")
+
+    reads = sp.reads
+    cached_samples = await _run(cached)
+    cached_reads = sp.reads - reads
+
+    umo = "aiocqhttp:GroupMessage:0"
+    await sp.put_async("umo", umo, KEY, {"persona_id": "changed"})
+    assert await cached(umo) == "changed", "写入后缓存应当立即失效"
+
+    emit(
+        "session_config",
+        {
+            "sessions": SESSIONS,
+            "requests": ROUNDS * BURST,
+            "legacy": {**summarize(legacy_samples), "store_reads": legacy_reads},
+            "cached": {**summarize(cached_samples), "store_reads": cached_reads, **cache.stats()},
+        },
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+import os
+import sys
+import tempfile
+import time
+
+from ._harness import emit, import_plugin, summarize
+from .fakes import FakeSkillManager, build_fake_skills_prompt
+
+"""
+技能提示词基准: 技能目录中有 SKILLS 个技能。
+
+- legacy: 每次请求 list_skills(扫描目录、读取每个 SKILL.md) + 按人格过滤 + 生成提示词
+- cached: SkillsPromptCache 命中(check_interval 内不做 I/O)
+- cached_check_every_time: check_interval=0，每次请求都检查目录指纹(只 stat，不读取)
+另外验证修改某个 SKILL.md 后缓存会失效。
+用法: python -m benchmarks.bench_skills_prompt [skills] [requests]
+"""
+
+SKILLS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+REQUESTS = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+
+def _make_skills(root: str):
+    for i in range(SKILLS):
+        os.makedirs(os.path.join(root, f"skill_{i}"))
+        with open(os.path.join(root, f"skill_{i}", "SKILL.md"), "w", encoding="utf-8") as f:
+            f.write(f"第 {i} 个技能: 处理某类任务的说明\n" + "详细步骤。\n" * 50)
+
+
+def _time(fn) -> list[float]:
+    samples = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    SkillsPromptCache = import_plugin("skills_cache").SkillsPromptCache
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, "skills")
+        config_path = os.path.join(tmp, "skills.json")
+        os.makedirs(root)
+        _make_skills(root)
+        with open(config_path, "w") as f:
+            f.write("{}")
+        allowed = frozenset(f"skill_{i}" for i in range(0, SKILLS, 3))
+        manager = FakeSkillManager(root, config_path)
+
+        def legacy():
+            skills = manager.list_skills(active_only=True, runtime="local")
+            skills = [skill for skill in skills if skill.name in allowed]
+            return build_fake_skills_prompt(skills)
+
+        cache = SkillsPromptCache(manager, build_prompt=build_fake_skills_prompt)
+        strict = SkillsPromptCache(
+            manager, check_interval=0, build_prompt=build_fake_skills_prompt
+        )
+        assert cache.prompt("local", allowed) == legacy()
+
+        results = {
+            "skills": SKILLS,
+            "legacy": summarize(_time(legacy)),
+            "cached": summarize(_time(lambda: cache.prompt("local", allowed))),
+            "cached_check_every_time": summarize(_time(lambda: strict.prompt("local", allowed))),
+        }
+
+        calls = manager.list_calls
+        strict.prompt("local", allowed)
+        assert manager.list_calls == calls, "命中缓存时不应该重新扫描技能目录"
+        path = os.path.join(root, "skill_0", "SKILL.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("修改后的说明\n")
+        os.utime(path, ns=(time.time_ns() + 10**9,) * 2)
+        assert "修改后的说明" in strict.prompt("local", allowed)
+        results["invalidated_on_change"] = True
+    emit("skills_prompt", results)
+
+
+if __name__ == "__main__":
+    main()
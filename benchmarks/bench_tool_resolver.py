@@ -0,0 +1,83 @@
+import sys
+import time
+from types import SimpleNamespace
+
+from astrbot.core.provider.func_tool_manager import ToolSet
+
+from ._harness import emit, import_plugin, summarize
+from .fakes import FakeTool, FakeToolManager
+
+"""
+工具集解析微基准: TOOLS 个工具(十分之一未启用)。
+
+- global: 没有人格工具时的全部启用工具。旧实现是 get_full_tool_set() 后逐个 remove_tool
+- persona: 人格指定 10 个工具。旧实现是逐个 get_func
+- extend: 解析后再加入一个本地工具(写时复制)，并检查缓存没有被修改
+用法: python -m benchmarks.bench_tool_resolver [tools] [iterations]
+"""
+
+TOOLS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+ITERATIONS = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+PERSONA_TOOLS = tuple(f"tool_{i * 7 % TOOLS}" for i in range(10))
+LOCAL_TOOL = FakeTool("local_python")
+
+
+def _legacy_global(tmgr) -> ToolSet:
+    toolset = tmgr.get_full_tool_set()
+    for tool in list(toolset):
+        if not tool.active:
+            toolset.remove_tool(tool.name)
+    return toolset
+
+
+def _legacy_persona(tmgr) -> ToolSet:
+    toolset = ToolSet()
+    for tool_name in PERSONA_TOOLS:
+        tool = tmgr.get_func(tool_name)
+        if tool and tool.active:
+            toolset.add_tool(tool)
+    return toolset
+
+
+def _time(fn) -> list[float]:
+    samples = []
+    for _ in range(ITERATIONS):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    ToolSetResolver = import_plugin("tool_resolver").ToolSetResolver
+    tmgr = FakeToolManager(TOOLS)
+    resolver = ToolSetResolver(SimpleNamespace(get_llm_tool_manager=lambda: tmgr))
+
+    assert resolver.resolve().names() == _legacy_global(tmgr).names()
+    assert resolver.resolve(PERSONA_TOOLS).names() == _legacy_persona(tmgr).names()
+
+    def extend():
+        view = resolver.resolve()
+        view.add_tool(LOCAL_TOOL)
+        return view
+
+    extended = extend()
+    assert extended.names()[-1] == "local_python"
+    assert "local_python" not in resolver.resolve().names()
+
+    emit(
+        "tool_resolver",
+        {
+            "tools": TOOLS,
+            "legacy_global": summarize(_time(lambda: _legacy_global(tmgr))),
+            "resolver_global": summarize(_time(lambda: resolver.resolve())),
+            "legacy_persona": summarize(_time(lambda: _legacy_persona(tmgr))),
+            "resolver_persona": summarize(_time(lambda: resolver.resolve(PERSONA_TOOLS))),
+            "resolver_extend": summarize(_time(extend)),
+            "version": resolver.version,
+        },
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from ._harness import emit, import_plugin, summarize
+
+StubTTSServer = import_plugin("tts.stub_server").StubTTSServer
+TTSClient = import_plugin("tts.tts_api").TTSClient
+
+"""
+并发合成吞吐量: 共享连接池的 TTSClient 与每次请求新建客户端(旧的用法)对比。
+"""
+
+TEXT = "今天天气不错，我们去公园散步吧。"
+REQUESTS = 64
+
+
+async def _drain(client: TTSClient) -> int:
+    size = 0
+    async for chunk in client.synthesize_to_stream(TEXT, ref_audio_path="ref.wav", prompt_text=""):
+        size += len(chunk)
+    return size
+
+
+async def _run(base_url: str, concurrency: int, shared: bool) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+    client = TTSClient(base_url, pool_size=concurrency) if shared else None
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            if shared:
+                await _drain(client)
+            else:
+                c = TTSClient(base_url, pool_size=concurrency)
+                try:
+                    await _drain(c)
+                finally:
+                    await c.close()
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(REQUESTS)))
+    wall = time.perf_counter() - t0
+    if client:
+        await client.close()
+    return {"req_per_s": REQUESTS / wall, "latency": summarize(latencies)}
+
+
+async def main():
+    server = StubTTSServer(first_byte_delay=0.02, realtime_factor=0.05, seconds_per_char=0.1)
+    base_url = await server.start()
+    results = {}
+    try:
+        for concurrency in (1, 4, 16):
+            for shared in (False, True):
+                key = f"c{concurrency}_{'pooled' if shared else 'per_request'}"
+                results[key] = await _run(base_url, concurrency, shared)
+    finally:
+        await server.stop()
+    emit("tts_client", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+from ._harness import emit, import_plugin
+
+SentencePipeline = import_plugin("tts.pipeline").SentencePipeline
+split_sentences = import_plugin("tts.pipeline").split_sentences
+ArraySink = import_plugin("tts.stream_player").ArraySink
+StubTTSServer = import_plugin("tts.stub_server").StubTTSServer
+TTSClient = import_plugin("tts.tts_api").TTSClient
+TTSPlayer = import_plugin("tts.tts_api").TTSPlayer
+
+"""
+分句流水线与整段单请求对比: 首个音频延迟(time to first audio)和总耗时。
+
+桩服务的首包延迟与文本长度成正比，模拟非流式推理；播放端为 4 倍速的 ArraySink。
+"""
+
+REPLY = (
+    "好的，我来给你讲讲这个问题。首先，我们需要明确目标是什么。"
+    "其次，要把大问题拆成几个可以独立完成的小问题。"
+    "然后按优先级逐个解决，每完成一步都检查一下结果。"
+    "最后，把经验整理下来，下次遇到类似的问题就能更快处理了。"
+    "如果还有不清楚的地方，随时问我！"
+)
+SPEED = 4.0
+
+
+def _player() -> TTSPlayer:
+    return TTSPlayer(sink_factory=lambda *a: ArraySink(*a, speed=SPEED), prebuffer_ms=100)
+
+
+async def _single(client: TTSClient) -> dict:
+    t0 = time.perf_counter()
+    stats = await _player().play_async_stream(client.synthesize_to_stream(REPLY))
+    return {
+        "ttfa_ms": stats.time_to_first_sample * 1000,
+        "wall_ms": (time.perf_counter() - t0) * 1000,
+        "underruns": stats.underruns,
+    }
+
+
+async def _pipelined(client: TTSClient, concurrency: int) -> dict:
+    pipeline = SentencePipeline(client, concurrency=concurrency, lookahead=concurrency + 2)
+    t0 = time.perf_counter()
+    stats = await _player().play_async_segments(pipeline.segments(split_sentences(REPLY)))
+    return {
+        "ttfa_ms": stats.time_to_first_sample * 1000,
+        "wall_ms": (time.perf_counter() - t0) * 1000,
+        "underruns": stats.underruns,
+    }
+
+
+async def main():
+    server = StubTTSServer(
+        first_byte_delay=0.05, first_byte_per_char=0.01, seconds_per_char=0.2, realtime_factor=0.02
+    )
+    base_url = await server.start()
+    client = TTSClient(base_url, pool_size=8)
+    results = {"sentences": len(split_sentences(REPLY))}
+    try:
+        results["single_request"] = await _single(client)
+        for concurrency in (1, 2, 4):
+            results[f"pipelined_c{concurrency}"] = await _pipelined(client, concurrency)
+    finally:
+        await client.close()
+        await server.stop()
+    emit("tts_pipeline", results)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,515 @@
+import asyncio
+import os
+import random
+from types import SimpleNamespace
+from typing import AsyncGenerator
+
+"""
+基准测试使用的假对象，不依赖真实的 AstrBot 和模型服务。
+"""
+
+
+class FakeStreamingProvider:
+    """按固定节奏逐个吐出 token 的假 LLM 提供商"""
+
+    def __init__(
+        self,
+        reply: str,
+        token_chars: int = 2,
+        first_token_delay: float = 0.3,
+        token_interval: float = 0.03,
+    ):
+        """
+        Args:
+            reply: 完整回复
+            token_chars: 每个 token 包含的字符数
+            first_token_delay: 首个 token 的延迟
+            token_interval: 后续 token 之间的间隔
+        """
+        self.reply = reply
+        self.token_chars = token_chars
+        self.first_token_delay = first_token_delay
+        self.token_interval = token_interval
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        await asyncio.sleep(self.first_token_delay)
+        for i in range(0, len(self.reply), self.token_chars):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            yield self.reply[i:i + self.token_chars]
+
+    async def text_chat(self, **kwargs) -> SimpleNamespace:
+        """非流式调用: 等整段生成完再返回"""
+        text = "".join([t async for t in self.stream()])
+        return SimpleNamespace(completion_text=text)
+
+
+class FakeCaptionProvider:
+    """固定延迟返回图片描述的假提供商，记录调用次数和最大并发数"""
+
+    def __init__(self, latency: float = 0.5, model: str = "fake-vision"):
+        self.latency = latency
+        self.model = model
+        self.provider_config = {"id": "fake_caption"}
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    def get_model(self) -> str:
+        return self.model
+
+    async def text_chat(self, prompt: str = "", image_urls=None, **kwargs) -> SimpleNamespace:
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        return SimpleNamespace(completion_text=f"描述({len(image_urls or [])} 张图片)")
+
+
+class FakeTool:
+    def __init__(self, name: str, active: bool = True):
+        self.name = name
+        self.active = active
+
+
+class FakeToolManager:
+    """与 FunctionToolManager 相同的 func_list / get_full_tool_set / get_func 接口"""
+
+    def __init__(self, tools: int = 200, inactive_every: int = 10):
+        self.func_list = [
+            FakeTool(f"tool_{i}", active=bool(i % inactive_every)) for i in range(tools)
+        ]
+
+    def get_full_tool_set(self):
+        from astrbot.core.provider.func_tool_manager import ToolSet
+
+        return ToolSet(self.func_list.copy())
+
+    def get_func(self, name: str):
+        for tool in self.func_list:
+            if tool.name == name:
+                return tool
+        return None
+
+
+def make_personas(count: int = 500, tools: int = 200, dialogs: int = 6) -> list[dict]:
+    """生成 personas_v3 结构的人格列表: 三分之一用全局工具，其余各指定 10 个工具，部分限制技能"""
+    personas = []
+    for i in range(count):
+        personas.append(
+            {
+                "name": f"persona_{i}",
+                "prompt": f"你是第 {i} 号助手。" * 20,
+                "tools": None if i % 3 == 0 else [f"tool_{(i + k * 7) % tools}" for k in range(10)],
+                "skills": None if i % 2 else [f"skill_{i % 5}"],
+                "_begin_dialogs_processed": [
+                    {"role": "user" if k % 2 == 0 else "assistant", "content": f"预设对话 {k}"}
+                    for k in range(dialogs)
+                ],
+            }
+        )
+    return personas
+
+
+class FakePersonaManager:
+    def __init__(self, personas: list[dict], default: str | None = None):
+        self.personas_v3 = personas
+        self.selected_default_persona_v3 = default
+
+
+class FakeSkillManager:
+    """
+    与 SkillManager 相同的 skills_root / config_path / list_skills 接口。
+    每次 list_skills 都扫描目录并读取每个技能的 SKILL.md，和真实实现的 I/O 模式一致。
+    """
+
+    def __init__(self, skills_root: str, config_path: str):
+        self.skills_root = skills_root
+        self.config_path = config_path
+        self.list_calls = 0
+
+    def list_skills(self, active_only: bool = True, runtime: str = "local") -> list:
+        self.list_calls += 1
+        skills = []
+        for name in sorted(os.listdir(self.skills_root)):
+            path = os.path.join(self.skills_root, name, "SKILL.md")
+            if not os.path.isfile(path):
+                continue
+            with open(path, encoding="utf-8") as f:
+                description = f.readline().strip()
+            skills.append(SimpleNamespace(name=name, description=description, path=path))
+        return skills
+
+
+def build_fake_skills_prompt(skills: list) -> str:
+    lines = ["\n## Skills\n"]
+    for skill in skills:
+        lines.append(f"- **{skill.name}**: {skill.description} (file: {skill.path})")
+    return "\n".join(lines) + "\n"
+
+
+class FakeSharedPreferences:
+    """带人为延迟的 sp，get_async/put_async/remove_async 接口与 astrbot.api.sp 一致"""
+
+    def __init__(self, latency: float = 0.002, jitter: float = 0.003, seed: int = 0):
+        """
+        Args:
+            latency: 每次读写的基础延迟(秒)
+            jitter: 额外的随机延迟上限(秒)，模拟存储偶尔变慢
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.reads = 0
+        self._data: dict = {}
+        self._rng = random.Random(seed)
+
+    async def _delay(self):
+        await asyncio.sleep(self.latency + self._rng.random() * self.jitter)
+
+    async def get_async(self, scope: str, scope_id: str, key: str, default=None):
+        self.reads += 1
+        await self._delay()
+        return self._data.get((scope, scope_id, key), default)
+
+    async def put_async(self, scope: str, scope_id: str, key: str, value):
+        await self._delay()
+        self._data[(scope, scope_id, key)] = value
+
+    async def remove_async(self, scope: str, scope_id: str, key: str):
+        await self._delay()
+        self._data.pop((scope, scope_id, key), None)
+
+
+# ---- AstrBot 运行时对象 ----
+
+
+class FakeTrace:
+    def __init__(self):
+        self.records: list[tuple[str, dict]] = []
+
+    def record(self, action: str, **fields):
+        self.records.append((action, fields))
+
+
+class FakeConfig(dict):
+    """AstrBotConfig 的替身: 就是一个 dict，save_config 只计数"""
+
+    saves = 0
+
+    def save_config(self, replace_config: dict | None = None):
+        if replace_config:
+            self.update(replace_config)
+        self.saves += 1
+
+
+def make_astrbot_config(
+    caption_provider_id: str | None = "fake_caption",
+    max_cnt: int = 300,
+    active_reply: bool = False,
+) -> FakeConfig:
+    """与 AstrBot 默认配置结构一致，只包含插件读取的字段"""
+    return FakeConfig(
+        {
+            "timezone": "Asia/Shanghai",
+            "provider_settings": {
+                "prompt_prefix": "",
+                "identifier": True,
+                "group_name_display": True,
+                "datetime_system_prompt": True,
+                "default_image_caption_provider_id": caption_provider_id or "",
+                "image_caption_prompt": "Please describe the image.",
+                "default_persona_id": "persona_1",
+                "skills": {"runtime": "local"},
+            },
+            "provider_ltm_settings": {
+                "group_icl_enable": True,
+                "group_message_max_cnt": max_cnt,
+                "image_caption": bool(caption_provider_id),
+                "image_caption_provider_id": caption_provider_id,
+                "active_reply": {
+                    "enable": active_reply,
+                    "method": "possibility_reply",
+                    "possibility_reply": 0.1,
+                    "prompt": "",
+                    "whitelist": [],
+                },
+            },
+        }
+    )
+
+
+class FakeChatProvider(FakeCaptionProvider):
+    """
+    对话提供商: 固定延迟返回固定回复。图片描述和对话共用同一套接口。
+    char_latency 大于 0 时每个 prompt 字符(含系统提示词)再增加这么多秒，模拟 prefill 耗时随 prompt 增长。
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        reply: str = "好的，我知道了。",
+        model: str = "fake-chat",
+        char_latency: float = 0.0,
+    ):
+        super().__init__(latency, model)
+        self.provider_config = {"id": "fake_chat"}
+        self.reply = reply
+        self.char_latency = char_latency
+        self.prompt_chars = 0
+
+    async def text_chat(self, prompt: str = "", image_urls=None, **kwargs) -> SimpleNamespace:
+        chars = len(prompt or "") + len(kwargs.get("system_prompt") or "")
+        self.prompt_chars += chars
+        if self.char_latency > 0:
+            await asyncio.sleep(chars * self.char_latency)
+        resp = await super().text_chat(prompt, image_urls, **kwargs)
+        if not image_urls:
+            resp.completion_text = self.reply
+        return resp
+
+
+class FakeSummaryProvider(FakeCaptionProvider):
+    """
+    摘要提供商: 固定延迟后返回一段长度有上限的摘要(统计消息数、参与者和开头的几条消息)，
+    不调用模型，结果可复现。
+    """
+
+    def __init__(self, latency: float = 0.2, max_chars: int = 400, model: str = "fake-summary"):
+        super().__init__(latency, model)
+        self.provider_config = {"id": "fake_summary"}
+        self.max_chars = max_chars
+
+    async def text_chat(self, prompt: str = "", image_urls=None, **kwargs) -> SimpleNamespace:
+        resp = await super().text_chat(prompt, image_urls, **kwargs)
+        messages = prompt.split("Messages:\n", 1)[-1].split("\n---\n")
+        senders = sorted({m[1:m.find("/")] for m in messages if m.startswith("[") and "/" in m})
+        topics = "；".join(m.split("]: ", 1)[-1].strip() for m in messages[:5])
+        summary = f"共 {len(messages)} 条消息，参与者: {', '.join(senders[:10])}。话题: {topics}"
+        resp.completion_text = summary[: self.max_chars]
+        return resp
+
+
+def allow_fake_providers(*modules, fakes: tuple = (FakeCaptionProvider,)):
+    """
+    插件用 isinstance(provider, Provider) 检查提供商。把这些模块中的 Provider 名称
+    替换为 (Provider, 假提供商...) 元组，真实的提供商仍然能通过检查。
+    """
+    for module in modules:
+        provider = module.Provider
+        if isinstance(provider, tuple):
+            continue
+        module.Provider = (provider, *fakes)
+
+
+class FakeContext:
+    """star.Context 的替身，只实现插件用到的部分"""
+
+    def __init__(
+        self,
+        config: FakeConfig | None = None,
+        caption_provider: FakeCaptionProvider | None = None,
+        chat_provider: FakeChatProvider | None = None,
+        summary_provider: FakeSummaryProvider | None = None,
+        personas: list[dict] | None = None,
+        tools: int = 200,
+    ):
+        self.config = config if config is not None else make_astrbot_config()
+        self.caption_provider = caption_provider or FakeCaptionProvider(latency=0.0)
+        self.chat_provider = chat_provider or FakeChatProvider()
+        self.summary_provider = summary_provider or FakeSummaryProvider(latency=0.0)
+        self.persona_manager = FakePersonaManager(
+            personas if personas is not None else make_personas(50, tools)
+        )
+        self.tool_manager = FakeToolManager(tools)
+        self.astrbot_config_mgr = None
+
+    def get_config(self, umo: str | None = None) -> FakeConfig:
+        return self.config
+
+    def get_provider_by_id(self, provider_id: str):
+        if provider_id == self.caption_provider.provider_config["id"]:
+            return self.caption_provider
+        if provider_id == self.chat_provider.provider_config["id"]:
+            return self.chat_provider
+        if provider_id == self.summary_provider.provider_config["id"]:
+            return self.summary_provider
+        return None
+
+    def get_using_provider(self, umo: str | None = None):
+        return self.chat_provider
+
+    def get_llm_tool_manager(self) -> FakeToolManager:
+        return self.tool_manager
+
+
+class FakeEvent:
+    """AstrMessageEvent 的替身。message 使用真实的消息段(Plain/Image/At/Reply)"""
+
+    def __init__(
+        self,
+        umo: str,
+        message: list,
+        message_str: str = "",
+        sender: tuple[str, str] = ("10000", "tester"),
+        group_id: str | None = None,
+        group_name: str = "测试群",
+        message_type=None,
+    ):
+        from astrbot.api.platform import MessageType
+
+        self.unified_msg_origin = umo
+        self.session_id = umo.rsplit(":", 1)[-1]
+        self.message_str = message_str
+        self.is_at_or_wake_command = False
+        self.trace = FakeTrace()
+        self.message_obj = SimpleNamespace(
+            sender=SimpleNamespace(user_id=sender[0], nickname=sender[1]),
+            group_id=group_id,
+            group=SimpleNamespace(group_name=group_name) if group_id else None,
+            message=message,
+        )
+        self._message_type = message_type or (
+            MessageType.GROUP_MESSAGE if group_id else MessageType.FRIEND_MESSAGE
+        )
+        self._extras: dict = {}
+        self.sent: list = []
+
+    def get_message_type(self):
+        return self._message_type
+
+    def get_messages(self) -> list:
+        return self.message_obj.message
+
+    def get_group_id(self) -> str | None:
+        return self.message_obj.group_id
+
+    def get_platform_name(self) -> str:
+        return self.unified_msg_origin.split(":", 1)[0]
+
+    def get_extra(self, key: str | None = None, default=None):
+        if key is None:
+            return self._extras
+        return self._extras.get(key, default)
+
+    def set_extra(self, key: str, value):
+        self._extras[key] = value
+
+    def plain_result(self, text: str) -> SimpleNamespace:
+        return SimpleNamespace(text=text)
+
+    async def send_streaming(self, generator, use_fallback: bool = False):
+        async for chain in generator:
+            self.sent.append(chain)
+
+
+class FakeProviderRequest:
+    """ProviderRequest 的替身，字段与真实的请求一致"""
+
+    def __init__(
+        self,
+        prompt: str,
+        image_urls: list[str] | None = None,
+        contexts: list | None = None,
+        conversation=None,
+    ):
+        self.prompt = prompt
+        self.system_prompt = ""
+        self.image_urls = image_urls or []
+        self.contexts = contexts or []
+        self.extra_user_content_parts: list = []
+        self.func_tool = None
+        self.conversation = conversation
+
+    def size(self) -> int:
+        """请求中文本的总字符数，近似代表 prompt 大小"""
+        parts = sum(len(getattr(p, "text", "") or "") for p in self.extra_user_content_parts)
+        contexts = sum(len(str(c.get("content", ""))) for c in self.contexts if hasattr(c, "get"))
+        return len(self.prompt) + len(self.system_prompt) + parts + contexts
+
+
+def fake_conversation(persona_id: str | None = None) -> SimpleNamespace:
+    return SimpleNamespace(persona_id=persona_id, history="[]", cid="fake")
+
+
+def fake_image_b64(seed: int) -> str:
+    import base64
+
+    return base64.b64encode(f"fake image {seed}".encode()).decode()
+
+
+def fake_image_url(seed: int) -> str:
+    """不需要下载、按内容区分的图片地址"""
+    return "base64://" + fake_image_b64(seed)
+
+
+class GroupChatWorkload:
+    """
+    可复现的群聊消息生成器: groups 个群，每条消息随机落在某个群，
+    按比例带图片、@ 和引用(引用里也可能有图片)。
+    """
+
+    TEXTS = (
+        "今天谁去打球？",
+        "晚上一起吃饭吗",
+        "这个问题我也遇到过，重启一下就好了",
+        "哈哈哈哈",
+        "有没有人知道这个怎么弄？",
+        "刚看到一个很有意思的新闻，分享给大家看看",
+        "明天记得带伞，天气预报说有雨",
+    )
+
+    def __init__(
+        self,
+        groups: int = 200,
+        image_ratio: float = 0.2,
+        at_ratio: float = 0.1,
+        quote_ratio: float = 0.1,
+        seed: int = 0,
+    ):
+        self.groups = groups
+        self.image_ratio = image_ratio
+        self.at_ratio = at_ratio
+        self.quote_ratio = quote_ratio
+        self._rng = random.Random(seed)
+        self._seq = 0
+
+    def umo(self, group: int) -> str:
+        return f"aiocqhttp:GroupMessage:{group}"
+
+    def message(self, group: int | None = None, quote: bool | None = None) -> FakeEvent:
+        from astrbot.api.message_components import At, Image, Plain, Reply
+
+        rng = self._rng
+        self._seq += 1
+        if group is None:
+            group = rng.randrange(self.groups)
+        text = rng.choice(self.TEXTS)
+        chain = []
+        if quote if quote is not None else rng.random() < self.quote_ratio:
+            quoted = [Plain(text=rng.choice(self.TEXTS))]
+            if rng.random() < 0.5:
+                quoted.append(Image.fromBase64(fake_image_b64(self._seq)))
+            chain.append(
+                Reply(
+                    id=str(self._seq - 1),
+                    chain=quoted,
+                    sender_nickname=f"user{rng.randrange(50)}",
+                    message_str=quoted[0].text,
+                )
+            )
+        if rng.random() < self.at_ratio:
+            chain.append(At(qq="10001", name="bot"))
+        chain.append(Plain(text=text))
+        if rng.random() < self.image_ratio:
+            chain.append(Image.fromBase64(fake_image_b64(self._seq)))
+        sender = rng.randrange(50)
+        return FakeEvent(
+            self.umo(group),
+            chain,
+            message_str=text,
+            sender=(str(20000 + sender), f"user{sender}"),
+            group_id=str(group),
+        )
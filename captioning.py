@@ -0,0 +1,411 @@
+import asyncio
+import base64
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+from astrbot.api import logger
+from astrbot.api.provider import Provider
+
+"""
+图片描述服务
+
+群聊记忆和请求处理共用。同一张图片(按内容哈希)、同一个提供商/模型、同一个提示词只请求一次:
+- 正在进行中的相同请求合并为一次(single-flight)
+- 网络图片按 URL 记住内容哈希，同一个 URL 只下载一次；超过大小上限的图片按 URL 区分。
+  第一次见到的 URL 为了计算哈希下载的内容直接以 base64 交给提供商，不会再下载第二次
+- 结果写入持久化缓存(SQLite)，按 TTL 过期、按条目数 LRU 淘汰，内存和数据库中的条目数都不超过上限
+一条消息中的多张图片并发请求，总并发数受 concurrency 限制。
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captions (
+    key TEXT PRIMARY KEY,
+    caption TEXT NOT NULL,
+    created REAL NOT NULL,
+    used REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class CaptionStats:
+    requests: int = 0
+    hits: int = 0
+    """命中缓存的次数"""
+    deduplicated: int = 0
+    """与进行中的相同请求合并的次数"""
+    provider_calls: int = 0
+    failures: int = 0
+
+    @property
+    def calls_saved(self) -> int:
+        return self.hits + self.deduplicated
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "deduplicated": self.deduplicated,
+            "provider_calls": self.provider_calls,
+            "calls_saved": self.calls_saved,
+            "failures": self.failures,
+        }
+
+
+class CaptionService:
+    def __init__(
+        self,
+        cache_path: Optional[str] = None,
+        concurrency: int = 4,
+        ttl: float = 7 * 24 * 3600,
+        max_entries: int = 5000,
+        download_timeout: float = 15.0,
+        max_download_bytes: int = 20 * 1024 * 1024,
+        max_url_digests: int = 2048,
+    ):
+        """
+        Args:
+            cache_path: 缓存数据库路径，为 None 时只缓存在内存中
+            concurrency: 同时进行的描述请求数
+            ttl: 缓存有效期(秒)，0 表示不过期
+            max_entries: 缓存条目数上限
+            download_timeout: 下载图片计算哈希的超时(秒)
+            max_download_bytes: 计算哈希时最多下载的字节数，超过时按 URL 区分
+            max_url_digests: 记住的 URL -> 内容哈希条目数上限
+        """
+        self.concurrency = max(concurrency, 1)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.download_timeout = download_timeout
+        self.max_download_bytes = max_download_bytes
+        self.max_url_digests = max(max_url_digests, 1)
+        self.stats = CaptionStats()
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._url_digests: OrderedDict[str, bytes] = OrderedDict()
+        """网络图片 URL -> 内容哈希，按最近使用排序"""
+        self._digest_inflight: dict[str, asyncio.Future] = {}
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        """key -> (描述, 写入时间)，按最近使用排序"""
+        self._touched: dict[str, float] = {}
+        """命中过、还没写回的最近使用时间"""
+        self._expired: list[str] = []
+        """在内存中过期、还没从数据库删除的条目"""
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if cache_path:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._load()
+
+    def _load(self):
+        """启动时加载未过期的条目，按最近使用时间恢复 LRU 顺序"""
+        now = time.time()
+        with self._db_lock, self._conn:
+            if self.ttl:
+                self._conn.execute("DELETE FROM captions WHERE created < ?", (now - self.ttl,))
+            # 上限调小或者上次退出前没来得及淘汰时，数据库中的条目可能多于上限
+            self._prune()
+            rows = self._conn.execute(
+                "SELECT key, caption, created FROM captions ORDER BY used DESC LIMIT ?",
+                (self.max_entries,),
+            ).fetchall()
+        for key, caption, created in reversed(rows):
+            self._entries[key] = (caption, created)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.close()
+            self._conn = None
+
+    async def caption(
+        self,
+        provider: Provider,
+        image_urls: list[str],
+        prompt: str,
+        **chat_kwargs,
+    ) -> str:
+        """
+        获取一组图片的描述(一次请求)。
+
+        Args:
+            provider: 用于生成描述的提供商
+            image_urls: 图片 URL、本地路径或 base64://
+            prompt: 提示词
+            **chat_kwargs: 透传给 provider.text_chat 的参数
+        """
+        self.stats.requests += 1
+        key, fetched = await self._key(provider, image_urls, prompt)
+        while True:
+            if (caption := self._get(key)) is not None:
+                self.stats.hits += 1
+                return caption
+            if (fut := self._inflight.get(key)) is None:
+                break
+            self.stats.deduplicated += 1
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                # 发起请求的一方被取消不代表自己被取消，重新检查后自己发起
+                if not fut.cancelled():
+                    raise
+                self.stats.deduplicated -= 1
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        try:
+            if fetched:
+                # 已经下载过的图片不让提供商再下载一次
+                image_urls = [
+                    "base64://" + base64.b64encode(fetched[url]).decode()
+                    if url in fetched else url
+                    for url in image_urls
+                ]
+            caption = await self._request(provider, image_urls, prompt, **chat_kwargs)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            self.stats.failures += 1
+            fut.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved"
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+        fut.set_result(caption)
+        if caption:
+            await self._put(key, caption)
+        return caption
+
+    async def caption_each(
+        self,
+        provider: Provider,
+        image_urls: list[str],
+        prompt: str,
+        **chat_kwargs,
+    ) -> list:
+        """并发获取每张图片各自的描述，按输入顺序返回，失败的位置是异常对象"""
+        return await asyncio.gather(
+            *(self.caption(provider, [url], prompt, **chat_kwargs) for url in image_urls),
+            return_exceptions=True,
+        )
+
+    async def _request(
+        self, provider: Provider, image_urls: list[str], prompt: str, **chat_kwargs
+    ) -> str:
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        async with self._sem:
+            self.stats.provider_calls += 1
+            resp = await provider.text_chat(
+                prompt=prompt, image_urls=image_urls, **chat_kwargs
+            )
+        return resp.completion_text
+
+    async def _key(
+        self, provider: Provider, image_urls: list[str], prompt: str
+    ) -> tuple[str, dict[str, bytes]]:
+        """
+        缓存键，以及为计算哈希而下载的网络图片内容(URL -> 字节)，缓存未命中时直接交给提供商
+        """
+        h = hashlib.sha256()
+        h.update(_provider_key(provider).encode())
+        h.update(b"\0")
+        h.update(prompt.encode())
+        fetched = {}
+        for url in image_urls:
+            h.update(b"\0")
+            digest, data = await self._digest(url)
+            h.update(digest)
+            if data is not None:
+                fetched[url] = data
+        return h.hexdigest(), fetched
+
+    async def _digest(self, url: str) -> tuple[bytes, Optional[bytes]]:
+        """
+        图片内容的哈希。读取失败时退化为按 URL 区分(仍然可以合并进行中的相同请求)。
+        网络图片由这次调用下载时同时返回下载的内容，否则第二项为 None。
+        """
+        if url.startswith(("http://", "https://")):
+            return await self._url_digest(url)
+        return await self._local_digest(url), None
+
+    async def _local_digest(self, url: str) -> bytes:
+        try:
+            if url.startswith("base64://"):
+                return hashlib.sha256(base64.b64decode(url[len("base64://"):])).digest()
+            path = url[len("file://"):] if url.startswith("file://") else url
+            if os.path.isfile(path):
+                return await asyncio.to_thread(_file_digest, path)
+        except Exception as e:
+            logger.debug(f"读取图片失败，按 URL 缓存描述: {e}")
+        return _url_key(url)
+
+    async def _url_digest(self, url: str) -> tuple[bytes, Optional[bytes]]:
+        """
+        网络图片的哈希，同一个 URL 只下载一次，同时到达的相同 URL 合并为一次下载。
+        只有发起下载的一方拿到图片内容，合并等待的一方只拿到哈希。
+        """
+        while True:
+            if (digest := self._url_digests.get(url)) is not None:
+                self._url_digests.move_to_end(url)
+                return digest, None
+            if (fut := self._digest_inflight.get(url)) is None:
+                break
+            try:
+                return await asyncio.shield(fut), None
+            except asyncio.CancelledError:
+                if not fut.cancelled():
+                    raise
+
+        fut = asyncio.get_running_loop().create_future()
+        self._digest_inflight[url] = fut
+        try:
+            digest, data = await self._download_digest(url)
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        finally:
+            self._digest_inflight.pop(url, None)
+        fut.set_result(digest)
+        return digest, data
+
+    async def _download_digest(self, url: str) -> tuple[bytes, Optional[bytes]]:
+        """
+        下载并计算哈希，返回哈希和图片内容。超过 max_download_bytes 时按 URL 区分，不返回内容；
+        下载失败的结果不记住，下次重试
+        """
+        try:
+            h = hashlib.sha256()
+            data = bytearray()
+            session = self._get_session()
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                if (resp.content_length or 0) > self.max_download_bytes:
+                    return self._remember(url, _url_key(url)), None
+                async for chunk in resp.content.iter_chunked(64 * 1024):
+                    if len(data) + len(chunk) > self.max_download_bytes:
+                        logger.debug(f"图片超过 {self.max_download_bytes} 字节，按 URL 缓存描述")
+                        return self._remember(url, _url_key(url)), None
+                    h.update(chunk)
+                    data += chunk
+        except Exception as e:
+            logger.debug(f"下载图片失败，按 URL 缓存描述: {e}")
+            return _url_key(url), None
+        return self._remember(url, h.digest()), bytes(data)
+
+    def _remember(self, url: str, digest: bytes) -> bytes:
+        self._url_digests[url] = digest
+        self._url_digests.move_to_end(url)
+        while len(self._url_digests) > self.max_url_digests:
+            self._url_digests.popitem(last=False)
+        return digest
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.download_timeout)
+            )
+        return self._session
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        caption, created = entry
+        if self.ttl and time.time() - created > self.ttl:
+            del self._entries[key]
+            # 数据库中的条目在下一次写入时一并删除
+            self._expired.append(key)
+            return None
+        self._entries.move_to_end(key)
+        # 最近使用时间在下一次写入时一并落盘，命中路径上不做 I/O
+        self._touched[key] = time.time()
+        return caption
+
+    async def _put(self, key: str, caption: str):
+        now = time.time()
+        self._entries[key] = (caption, now)
+        self._entries.move_to_end(key)
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            evicted.append(self._entries.popitem(last=False)[0])
+        evicted += self._expired
+        self._expired = []
+        if self._conn is not None:
+            touched, self._touched = self._touched, {}
+            try:
+                await asyncio.to_thread(self._write, key, caption, now, evicted, touched)
+            except Exception as e:
+                logger.error(f"写入图片描述缓存失败: {e}")
+
+    def _write(
+        self,
+        key: str,
+        caption: str,
+        now: float,
+        evicted: list[str],
+        touched: dict[str, float],
+    ):
+        with self._db_lock:
+            if self._conn is None:
+                return
+            with self._conn:
+                if touched:
+                    self._conn.executemany(
+                        "UPDATE captions SET used = ? WHERE key = ?",
+                        [(used, k) for k, used in touched.items()],
+                    )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO captions (key, caption, created, used) VALUES (?, ?, ?, ?)",
+                    (key, caption, now, now),
+                )
+                if evicted:
+                    self._conn.executemany(
+                        "DELETE FROM captions WHERE key = ?", [(k,) for k in evicted]
+                    )
+                # 同一个数据库可能被之前的实例(插件重载)写入过，按最近使用时间兜底淘汰
+                self._prune()
+
+    def _prune(self):
+        """删除数据库中最近使用时间排在 max_entries 之后的条目，调用方持有锁和事务"""
+        self._conn.execute(
+            "DELETE FROM captions WHERE key NOT IN "
+            "(SELECT key FROM captions ORDER BY used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+
+def _provider_key(provider: Provider) -> str:
+    """区分提供商和模型，换了模型的描述不复用"""
+    provider_id = (getattr(provider, "provider_config", None) or {}).get("id", "")
+    get_model = getattr(provider, "get_model", None)
+    model = get_model() if callable(get_model) else ""
+    return f"{provider_id or type(provider).__name__}/{model}"
+
+
+def _url_key(url: str) -> bytes:
+    return b"url:" + url.encode()
+
+
+def _file_digest(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.digest()
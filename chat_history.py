@@ -0,0 +1,465 @@
+import bisect
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Iterator, Optional
+
+"""
+群聊记录存储
+
+每个会话一个 SessionHistory，用 deque(maxlen) 作为有界环形结构，追加和淘汰都是 O(1)。
+消息以 ChatRecord(发送者、时间戳、文本) 紧凑存储，只在拼接 prompt 时才格式化。
+"""
+
+def estimate_tokens(text: str) -> int:
+    """
+    快速估算 token 数: 中日韩字符约 1 个 token，其他字符约 4 个一个 token。
+    利用 UTF-8 编码长度在 C 层完成统计，不逐字符遍历。
+    """
+    n = len(text)
+    wide = (len(text.encode("utf-8", "surrogatepass")) - n) // 2
+    return wide + (n - wide + 3) // 4
+
+
+_last_ts = 0
+
+
+def now_ts() -> int:
+    """当前时间戳(秒)。同一秒内返回同一个 int 对象，同一秒写入的记录共用它"""
+    global _last_ts
+    ts = int(time.time())
+    if ts != _last_ts:
+        _last_ts = ts
+    return _last_ts
+
+
+IMAGE_MARK = "\ufffc"
+"""文本中尚未描述的图片的占位符，按出现顺序对应 ChatRecord.images"""
+
+
+class ChatRecord:
+    __slots__ = ("sender", "timestamp", "text", "tokens", "images")
+
+    def __init__(
+        self,
+        sender: str,
+        timestamp: int,
+        text: str,
+        tokens: int = 0,
+        images: Optional[tuple[str, ...]] = None,
+    ):
+        # 同一个群里昵称大量重复，驻留后所有记录共用一个字符串对象
+        self.sender = sys.intern(sender)
+        self.timestamp = timestamp
+        self.text = text
+        self.tokens = tokens
+        """写入时估算的 token 数(含格式开销)"""
+        self.images = images
+        """尚未描述的图片 URL，与文本中的 IMAGE_MARK 一一对应；None 表示没有待描述的图片"""
+
+    @property
+    def display_text(self) -> str:
+        """用于展示的文本，尚未描述的图片显示为 [Image]"""
+        if IMAGE_MARK not in self.text:
+            return self.text
+        return self.text.replace(IMAGE_MARK, "[Image]")
+
+    def resolve(self, captions: list[Optional[str]]):
+        """
+        用图片描述替换占位符。
+
+        Args:
+            captions: 与 images 一一对应，None 表示描述失败，显示为 [Image]
+        """
+        it = iter(captions)
+        pieces = self.text.split(IMAGE_MARK)
+        out = [pieces[0]]
+        for piece in pieces[1:]:
+            caption = next(it, None)
+            out.append(f"[Image: {caption}]" if caption else "[Image]")
+            out.append(piece)
+        self.text = "".join(out)
+        self.images = None
+
+    def render(self) -> str:
+        """格式化为 `[昵称/HH:MM:SS]: 内容`"""
+        return f"[{self.sender}/{time.strftime('%H:%M:%S', time.localtime(self.timestamp))}]: {self.display_text}"
+
+    def __repr__(self):
+        return f"ChatRecord({self.render()!r})"
+
+    @property
+    def nbytes(self) -> int:
+        """常驻内存的估算值: 记录对象本身 + 文本。昵称和时间戳是共享对象，不计入"""
+        size = _RECORD_SIZE + sys.getsizeof(self.text)
+        if self.images:
+            size += sys.getsizeof(self.images) + sum(map(sys.getsizeof, self.images))
+        return size
+
+
+_RECORD_SIZE = sys.getsizeof(ChatRecord("", 0, ""))
+
+
+class SessionHistory:
+    """
+    一个会话的聊天记录，附带增量维护的渲染缓存。
+
+    渲染缓存在第一次 render() 时建立，之后追加只把新记录渲染一次放入待拼接列表，
+    淘汰只移动起始偏移，下一次 render() 时一次性拼接；没有变化时 render() 直接返回缓存的字符串。
+    偏移都是在一个只增不减的"虚拟文本流"中的绝对位置。
+    """
+
+    SEP = "\n---\n"
+
+    __slots__ = (
+        "records", "_rendered", "_base", "_mat_end", "_pending", "_starts", "_end",
+        "_tok_before", "_tok_head", "_tok_total", "nbytes", "appended", "summary", "summary_end",
+        "summary_tokens", "index",
+    )
+
+    def __init__(self, max_len: int):
+        self.records: deque[ChatRecord] = deque(maxlen=max_len)
+        self._rendered: Optional[str] = None
+        """已拼接的文本，None 表示缓存未建立"""
+        self._base = 0
+        """_rendered[0] 对应的绝对偏移"""
+        self._mat_end = 0
+        """_rendered 末尾对应的绝对偏移"""
+        self._pending: deque[str] = deque()
+        """已渲染但还没拼接进 _rendered 的记录"""
+        self._starts: deque[int] = deque()
+        """每条记录在文本流中的起始偏移，与 records 一一对应"""
+        self._end = 0
+        """最后一条记录的结束偏移"""
+        self._tok_before: list[int] = []
+        """每条记录之前所有记录(含已淘汰的)的 token 累计，单调递增，用于前缀和二分。
+        淘汰只移动 _tok_head，已淘汰的前缀在积累到一半时一次性丢弃，list 上的下标访问是 O(1)"""
+        self._tok_head = 0
+        """records[0] 在 _tok_before 中的下标"""
+        self._tok_total = 0
+        self.nbytes = 0
+        """所有记录和摘要的常驻内存估算(不含渲染缓存)"""
+        self.appended = 0
+        """追加过的记录总数(含已淘汰的)，records[0] 的绝对序号是 appended - len(records)"""
+        self.summary: Optional[str] = None
+        """较早记录的滚动摘要"""
+        self.summary_end = 0
+        """摘要覆盖了绝对序号小于它的记录"""
+        self.summary_tokens = 0
+        self.index = None
+        """可选的检索索引(add(序号, 文本) / remove(序号) / nbytes)，随记录的追加和淘汰同步更新"""
+
+    @property
+    def max_len(self) -> int:
+        return self.records.maxlen
+
+    def set_max_len(self, max_len: int):
+        """配置的最大条数变化时调整上限，缩小时丢弃最旧的记录"""
+        if max_len != self.records.maxlen:
+            first = self.appended - len(self.records)
+            self.records = deque(self.records, maxlen=max_len)
+            if self.index is not None:
+                for seq in range(first, self.appended - len(self.records)):
+                    self.index.remove(seq)
+            self.refresh()
+
+    def refresh(self):
+        """记录的内容被修改(比如补上了图片描述)后，重新统计 token 和内存并丢弃渲染缓存"""
+        self.invalidate()
+        self._tok_before = []
+        self._tok_head = 0
+        self._tok_total = 0
+        self.nbytes = sys.getsizeof(self.summary) if self.summary else 0
+        if self.index is not None:
+            self.nbytes += self.index.nbytes
+        for record in self.records:
+            self._tok_before.append(self._tok_total)
+            self._tok_total += record.tokens
+            self.nbytes += record.nbytes
+
+    def invalidate(self):
+        """丢弃渲染缓存，下次 render() 时重新建立"""
+        self._rendered = None
+        self._pending.clear()
+        self._starts.clear()
+
+    def append(self, record: ChatRecord) -> Optional[ChatRecord]:
+        """追加一条记录，超出上限时返回被淘汰的最旧记录"""
+        if self.records.maxlen == 0:
+            # 上限为 0 时不保存任何记录，新记录立即被淘汰
+            self.appended += 1
+            return record
+        evicted = None
+        if len(self.records) == self.records.maxlen:
+            evicted = self.records[0]
+        self.records.append(record)
+        self.appended += 1
+        if evicted is not None:
+            self._tok_head += 1
+            if self._tok_head * 2 > len(self._tok_before):
+                del self._tok_before[:self._tok_head]
+                self._tok_head = 0
+            self.nbytes -= evicted.nbytes
+        self._tok_before.append(self._tok_total)
+        self._tok_total += record.tokens
+        self.nbytes += record.nbytes
+        if self.index is not None:
+            before = self.index.nbytes
+            if evicted is not None:
+                self.index.remove(self.appended - len(self.records) - 1)
+            self.index.add(self.appended - 1, record.text)
+            self.nbytes += self.index.nbytes - before
+        if self._rendered is not None:
+            if evicted is not None:
+                self._drop_front()
+            piece = record.render()
+            start = self._end + len(self.SEP) if self._starts else self._end
+            self._starts.append(start)
+            self._pending.append(piece)
+            self._end = start + len(piece)
+        return evicted
+
+    def set_summary(self, summary: str, end: int, tokens: int):
+        """
+        设置滚动摘要。
+
+        Args:
+            end: 摘要覆盖的记录的绝对序号上界(不含)
+            tokens: 摘要的 token 数
+        """
+        if self.summary:
+            self.nbytes -= sys.getsizeof(self.summary)
+        self.summary = summary
+        self.summary_end = end
+        self.summary_tokens = tokens
+        self.nbytes += sys.getsizeof(summary)
+
+    def enable_index(self, index):
+        """挂上检索索引，并把现有的记录加入索引"""
+        first = self.appended - len(self.records)
+        for i, record in enumerate(self.records):
+            index.add(first + i, record.text)
+        self.index = index
+        self.nbytes += index.nbytes
+
+    def reindex(self, seq: int):
+        """
+        记录的文本被修改后(比如补上了图片描述)，用新的文本替换它在检索索引中的条目。
+        内存统计由之后的 refresh() 重新计算。
+        """
+        i = self.seq_to_index(seq)
+        if self.index is None or not 0 <= i < len(self.records):
+            return
+        self.index.remove(seq)
+        self.index.add(seq, self.records[i].text)
+
+    def seq_to_index(self, seq: int) -> int:
+        """记录的绝对序号转换为当前下标，已经淘汰的返回负数"""
+        return seq - (self.appended - len(self.records))
+
+    def unsummarized_start(self) -> int:
+        """第一条没有被摘要覆盖的记录的下标"""
+        return min(max(self.summary_end - (self.appended - len(self.records)), 0), len(self.records))
+
+    def _drop_front(self):
+        start = self._starts.popleft()
+        if start >= self._mat_end and self._pending:
+            # 被淘汰的记录还没拼接进缓存
+            self._pending.popleft()
+
+    def _materialize(self):
+        if self._rendered is None:
+            self._pending.clear()
+            self._starts.clear()
+            pos = 0
+            pieces = []
+            for record in self.records:
+                piece = record.render()
+                self._starts.append(pos)
+                pieces.append(piece)
+                pos += len(piece) + len(self.SEP)
+            self._rendered = self.SEP.join(pieces)
+            self._base = 0
+            self._mat_end = self._end = len(self._rendered)
+            return
+        if not self._starts:
+            self._rendered = ""
+            self._base = self._mat_end = self._end
+            return
+        first = self._starts[0]
+        if first == self._base and not self._pending:
+            return
+        head = self._rendered[first - self._base:] if first < self._mat_end else ""
+        if head:
+            self._pending.appendleft(head)
+        self._rendered = self.SEP.join(self._pending)
+        self._pending.clear()
+        self._base = first
+        self._mat_end = self._end
+
+    def render(self, start: int = 0) -> str:
+        """
+        渲染从第 start 条开始的记录，记录之间以 SEP 分隔。没有变化时 O(1) 返回缓存。
+
+        Args:
+            start: 起始记录下标，用于只渲染最近的若干条
+        """
+        self._materialize()
+        if start <= 0:
+            return self._rendered
+        if start >= len(self.records):
+            return ""
+        return self._rendered[self._starts[start] - self._base:]
+
+    def token_count(self, start: int = 0) -> int:
+        """第 start 条及之后的记录的 token 总数，O(1)"""
+        start = max(start, 0)
+        if start >= len(self.records):
+            return 0
+        return self._tok_total - self._tok_before[self._tok_head + start]
+
+    def window_start(self, token_budget: int) -> int:
+        """
+        在 token 预算内能容纳的最早一条记录的下标(保留最新的记录)，在前缀和 list 上二分查找 O(log n)。
+        返回 len(self) 表示连最新的一条都放不下。
+        """
+        # 需要满足 total - before[i] <= budget，before 单调递增
+        return (
+            bisect.bisect_left(
+                self._tok_before, self._tok_total - token_budget, lo=self._tok_head
+            )
+            - self._tok_head
+        )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[ChatRecord]:
+        return iter(self.records)
+
+
+class SessionPool:
+    """
+    所有会话的聊天记录，带全局内存上限。
+
+    按最近访问排序(LRU)，超出总字节数或会话数上限、或者空闲超过 idle_ttl 时，整个会话被淘汰。
+    常驻字节数在追加和调整上限时增量统计，检查上限是 O(1)，淘汰是 O(被淘汰的会话数)。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 0,
+        max_sessions: int = 0,
+        idle_ttl: float = 0,
+        on_evict: Optional[Callable[[str, SessionHistory], None]] = None,
+    ):
+        """
+        Args:
+            max_bytes: 所有会话常驻字节数上限，0 表示不限制
+            max_sessions: 常驻会话数上限，0 表示不限制
+            idle_ttl: 会话空闲多久(秒)后淘汰，0 表示不按空闲时间淘汰
+            on_evict: 会话被淘汰时的回调
+        """
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self.on_evict = on_evict
+        self.evictions = 0
+        self._sessions: OrderedDict[str, SessionHistory] = OrderedDict()
+        self._touched: dict[str, float] = {}
+        self._bytes = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._bytes
+
+    def get(self, umo: str) -> Optional[SessionHistory]:
+        """获取会话并标记为最近使用"""
+        history = self._sessions.get(umo)
+        if history is not None:
+            self._sessions.move_to_end(umo)
+            self._touched[umo] = time.monotonic()
+        return history
+
+    def create(self, umo: str, max_len: int) -> SessionHistory:
+        history = SessionHistory(max_len)
+        self._sessions[umo] = history
+        self._touched[umo] = time.monotonic()
+        return history
+
+    def append(self, umo: str, history: SessionHistory, record: ChatRecord):
+        """向会话追加一条记录，然后按上限淘汰其他会话"""
+        before = history.nbytes
+        history.append(record)
+        if self._sessions.get(umo) is history:
+            self._bytes += history.nbytes - before
+        self.evict()
+
+    def set_max_len(self, umo: str, history: SessionHistory, max_len: int):
+        before = history.nbytes
+        history.set_max_len(max_len)
+        if self._sessions.get(umo) is history:
+            self._bytes += history.nbytes - before
+
+    def enable_index(self, umo: str, history: SessionHistory, index):
+        before = history.nbytes
+        history.enable_index(index)
+        if self._sessions.get(umo) is history:
+            self._bytes += history.nbytes - before
+        self.evict()
+
+    def set_summary(self, umo: str, history: SessionHistory, summary: str, end: int, tokens: int):
+        before = history.nbytes
+        history.set_summary(summary, end, tokens)
+        if self._sessions.get(umo) is history:
+            self._bytes += history.nbytes - before
+        self.evict()
+
+    def refresh(self, umo: str, history: SessionHistory):
+        """会话中的记录被修改后调用，同步常驻字节数"""
+        before = history.nbytes
+        history.refresh()
+        if self._sessions.get(umo) is history:
+            self._bytes += history.nbytes - before
+
+    def add(self, umo: str, history: SessionHistory):
+        """放入一个已有记录的会话(比如从磁盘加载的)"""
+        self.pop(umo)
+        self._sessions[umo] = history
+        self._touched[umo] = time.monotonic()
+        self._bytes += history.nbytes
+        self.evict()
+
+    def pop(self, umo: str) -> Optional[SessionHistory]:
+        history = self._sessions.pop(umo, None)
+        if history is not None:
+            self._touched.pop(umo, None)
+            self._bytes -= history.nbytes
+        return history
+
+    def evict(self) -> list[str]:
+        """按上限淘汰最久未使用的会话，最近使用的一个会话始终保留。返回被淘汰的会话"""
+        evicted = []
+        deadline = time.monotonic() - self.idle_ttl if self.idle_ttl > 0 else None
+        while len(self._sessions) > 1:
+            umo = next(iter(self._sessions))
+            if not (
+                (self.max_bytes and self._bytes > self.max_bytes)
+                or (self.max_sessions and len(self._sessions) > self.max_sessions)
+                or (deadline is not None and self._touched[umo] < deadline)
+            ):
+                break
+            history = self.pop(umo)
+            # 可能仍有进行中的请求持有该对象，先释放渲染缓存
+            history.invalidate()
+            evicted.append(umo)
+            self.evictions += 1
+            if self.on_evict:
+                self.on_evict(umo, history)
+        return evicted
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, umo: str) -> bool:
+        return umo in self._sessions
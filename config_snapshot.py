@@ -0,0 +1,199 @@
+import time
+import weakref
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
+
+from astrbot.api import logger, star
+from astrbot.api.event import AstrMessageEvent
+
+"""
+会话配置快照
+
+context.get_config(umo) 返回的是可变的嵌套 dict，各个处理函数分别查找、解析同样的字段。
+这里每个 unified_msg_origin 解析一次，得到不可变的快照，同一个事件的所有处理函数共用一个快照对象。
+
+快照在以下情况失效:
+- 配置被保存(包装了配置对象的 save_config，保存时递增全局版本号)
+- 缓存超过 ttl 秒(兜底，覆盖会话改用另一份配置等不经过 save_config 的变化)
+- 调用 invalidate()
+"""
+
+_EVENT_KEY = "_config_snapshot"
+_EVENT_STATS_KEY = "_config_stats"
+
+
+def freeze(value: Any) -> Any:
+    """递归转换为只读结构: dict -> MappingProxyType，list -> tuple"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+@dataclass(frozen=True, slots=True)
+class LTMSettings:
+    """provider_ltm_settings 中群聊记忆相关的配置"""
+
+    group_icl_enable: bool = False
+    max_cnt: int = 300
+    image_caption: bool = False
+    image_caption_prompt: str = ""
+    image_caption_provider_id: Optional[str] = None
+    enable_active_reply: bool = False
+    ar_method: str = "possibility_reply"
+    ar_possibility: float = 0.0
+    ar_prompt: str = ""
+    ar_whitelist: frozenset = frozenset()
+
+    @property
+    def enabled(self) -> bool:
+        return self.group_icl_enable or self.enable_active_reply
+
+    @classmethod
+    def from_config(cls, cfg: Mapping) -> "LTMSettings":
+        ltmse = cfg["provider_ltm_settings"]
+        try:
+            max_cnt = int(ltmse["group_message_max_cnt"])
+        except BaseException as e:
+            logger.error(e)
+            max_cnt = 300
+        image_caption_provider_id = ltmse.get("image_caption_provider_id")
+        active_reply = ltmse["active_reply"]
+        return cls(
+            group_icl_enable=bool(ltmse.get("group_icl_enable", False)),
+            max_cnt=max_cnt,
+            image_caption=bool(ltmse["image_caption"] and image_caption_provider_id),
+            image_caption_prompt=cfg["provider_settings"]["image_caption_prompt"],
+            image_caption_provider_id=image_caption_provider_id,
+            enable_active_reply=bool(active_reply.get("enable", False)),
+            ar_method=active_reply["method"],
+            ar_possibility=active_reply["possibility_reply"],
+            ar_prompt=active_reply.get("prompt", ""),
+            ar_whitelist=frozenset(active_reply.get("whitelist", [])),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ConfigSnapshot:
+    umo: str
+    version: int
+    provider_settings: Mapping[str, Any]
+    """只读的 provider_settings"""
+    ltm: LTMSettings
+    resolved_at: float
+
+
+@dataclass(slots=True)
+class ConfigStats:
+    """配置解析次数统计。lookups 是获取快照的次数，resolutions 是真正读取并解析配置的次数"""
+
+    lookups: int = 0
+    resolutions: int = 0
+
+    def to_dict(self) -> dict:
+        return {"lookups": self.lookups, "resolutions": self.resolutions}
+
+
+class ConfigSnapshotCache:
+    def __init__(self, context: star.Context, ttl: float = 30.0):
+        """
+        Args:
+            ttl: 快照的最长缓存时间(秒)，0 表示只依赖保存通知和 invalidate()
+        """
+        self.context = context
+        self.ttl = ttl
+        self.version = 0
+        self.stats = ConfigStats()
+        self._snapshots: dict[str, ConfigSnapshot] = {}
+        self._listeners: list[weakref.WeakSet] = []
+        """注册了本缓存的 save_config 包装的监听集合，close() 时注销"""
+
+    def invalidate(self, umo: Optional[str] = None):
+        """丢弃快照，umo 为 None 时丢弃全部"""
+        if umo is None:
+            self.version += 1
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(umo, None)
+
+    def get(self, umo: str) -> ConfigSnapshot:
+        self.stats.lookups += 1
+        snapshot = self._snapshots.get(umo)
+        if snapshot is not None and snapshot.version == self.version and (
+            not self.ttl or time.monotonic() - snapshot.resolved_at < self.ttl
+        ):
+            return snapshot
+        return self._resolve(umo)
+
+    def for_event(self, event: AstrMessageEvent) -> ConfigSnapshot:
+        """获取事件所属会话的快照。同一个事件只解析一次，之后的处理函数直接复用"""
+        stats: Optional[ConfigStats] = event.get_extra(_EVENT_STATS_KEY)
+        if stats is None:
+            stats = ConfigStats()
+            event.set_extra(_EVENT_STATS_KEY, stats)
+        stats.lookups += 1
+        snapshot = event.get_extra(_EVENT_KEY)
+        if snapshot is None:
+            resolutions = self.stats.resolutions
+            snapshot = self.get(event.unified_msg_origin)
+            stats.resolutions += self.stats.resolutions - resolutions
+            event.set_extra(_EVENT_KEY, snapshot)
+        return snapshot
+
+    @staticmethod
+    def event_stats(event: AstrMessageEvent) -> dict:
+        """事件处理过程中获取快照和解析配置的次数"""
+        stats: Optional[ConfigStats] = event.get_extra(_EVENT_STATS_KEY)
+        return stats.to_dict() if stats else ConfigStats().to_dict()
+
+    def _resolve(self, umo: str) -> ConfigSnapshot:
+        self.stats.resolutions += 1
+        cfg = self.context.get_config(umo=umo)
+        self._watch(cfg)
+        snapshot = ConfigSnapshot(
+            umo=umo,
+            version=self.version,
+            provider_settings=freeze(cfg["provider_settings"]),
+            ltm=LTMSettings.from_config(cfg),
+            resolved_at=time.monotonic(),
+        )
+        self._snapshots[umo] = snapshot
+        return snapshot
+
+    def close(self):
+        """从配置对象的保存通知中注销(插件卸载时调用)"""
+        for listeners in self._listeners:
+            listeners.discard(self)
+        self._listeners.clear()
+
+    def _watch(self, cfg):
+        """
+        包装配置对象的 save_config，配置被保存时让快照失效。配置对象是全局共享的，每个对象只包装一次，
+        之后创建的缓存(比如插件重载后)注册到同一个包装的监听集合上；集合只持有弱引用，包装不会让旧的缓存常驻。
+        """
+        save_config = getattr(cfg, "save_config", None)
+        if save_config is None:
+            return
+        listeners = getattr(save_config, "_listeners", None)
+        if listeners is None:
+            listeners = weakref.WeakSet()
+
+            def wrapped(*args, **kwargs):
+                try:
+                    return save_config(*args, **kwargs)
+                finally:
+                    for cache in list(listeners):
+                        cache.invalidate()
+
+            wrapped._listeners = listeners
+            try:
+                # AstrBotConfig 的 __setattr__ 会把属性写进配置内容，这里绕过它
+                object.__setattr__(cfg, "save_config", wrapped)
+            except (AttributeError, TypeError):
+                # 不允许设置属性的配置对象只能依赖 ttl
+                return
+        if self not in listeners:
+            listeners.add(self)
+            self._listeners.append(listeners)
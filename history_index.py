@@ -0,0 +1,125 @@
+import heapq
+import math
+import re
+from collections import Counter
+from operator import itemgetter
+
+"""
+会话聊天记录的词法检索索引
+
+每个会话一个增量维护的倒排索引，用 BM25 给记录打分，请求时选出与当前消息最相关的较早记录，
+不必把整个聊天记录都放进 prompt。
+- 分词: 拉丁字母和数字按词切分并转小写，中日韩文字按字切成相邻两字的二元组(单字的片段保留单字)，不需要词典
+- 记录以会话内的绝对序号为键，追加和淘汰只涉及该记录自己的词项，与会话的记录数无关
+"""
+
+_TOKEN_RE = re.compile(
+    r"[a-z0-9_]+"
+    r"|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+"
+)
+"""拉丁字母和数字组成的词，或者连续的中日韩文字(假名、汉字、谚文)"""
+
+# 内存估算按 tracemalloc 实测校准: 一万条中文消息约 25MB，每条约 2.5KB
+POSTING_BYTES = 95
+"""倒排表中每一项(字典槽位，含扩容余量)"""
+TERM_BYTES = 300
+"""每个词项(字符串 + 倒排表字典)"""
+DOC_BYTES = 250
+"""每条记录(词项元组 + 长度)"""
+
+
+def tokenize(text: str) -> list[str]:
+    """切分为检索用的词项，可能有重复"""
+    out = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if run[0] < "\u3040" or len(run) == 1:
+            out.append(run)
+        else:
+            out.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return out
+
+
+class BM25Index:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: dict[str, dict[int, int]] = {}
+        """词项 -> {记录序号: 词频}"""
+        self._docs: dict[int, tuple[str, ...]] = {}
+        """记录序号 -> 去重后的词项，淘汰时按它删除倒排项"""
+        self._lens: dict[int, int] = {}
+        self._total_len = 0
+        self._entries = 0
+
+    @property
+    def nbytes(self) -> int:
+        """常驻内存的估算值"""
+        return (
+            self._entries * POSTING_BYTES
+            + len(self._postings) * TERM_BYTES
+            + len(self._docs) * DOC_BYTES
+        )
+
+    def add(self, seq: int, text: str):
+        """加入一条记录，耗时与记录的词项数成正比"""
+        counts = Counter(tokenize(text))
+        if not counts:
+            return
+        postings = self._postings
+        for term, tf in counts.items():
+            p = postings.get(term)
+            if p is None:
+                p = postings[term] = {}
+            p[seq] = tf
+        self._docs[seq] = tuple(counts)
+        length = sum(counts.values())
+        self._lens[seq] = length
+        self._total_len += length
+        self._entries += len(counts)
+
+    def remove(self, seq: int):
+        """移除一条记录，不存在时忽略"""
+        terms = self._docs.pop(seq, None)
+        if terms is None:
+            return
+        postings = self._postings
+        for term in terms:
+            p = postings[term]
+            del p[seq]
+            if not p:
+                del postings[term]
+        self._total_len -= self._lens.pop(seq)
+        self._entries -= len(terms)
+
+    def search(self, query: str, k: int, before: int | None = None) -> list[int]:
+        """
+        按 BM25 得分返回最相关的至多 k 条记录的序号，得分从高到低。
+
+        Args:
+            before: 只考虑序号小于它的记录(比如最近几条已经会原样注入)
+        """
+        n = len(self._docs)
+        if not n or k <= 0:
+            return []
+        avgdl = self._total_len / n
+        k1 = self.k1
+        norm = k1 * (1 - self.b)
+        slope = k1 * self.b / avgdl
+        lens = self._lens
+        scores: dict[int, float] = {}
+        for term in set(tokenize(query)):
+            p = self._postings.get(term)
+            if not p:
+                continue
+            df = len(p)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5)) * (k1 + 1)
+            for seq, tf in p.items():
+                if before is not None and seq >= before:
+                    continue
+                scores[seq] = scores.get(seq, 0.0) + idf * tf / (tf + norm + slope * lens[seq])
+        if not scores:
+            return []
+        return [seq for seq, _ in heapq.nlargest(k, scores.items(), key=itemgetter(1))]
+
+    def __len__(self) -> int:
+        return len(self._docs)
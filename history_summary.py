@@ -0,0 +1,205 @@
+import asyncio
+import itertools
+import time
+import uuid
+from typing import Callable, Optional
+
+from astrbot.api import logger, star
+from astrbot.api.provider import Provider
+
+from .chat_history import SessionHistory, SessionPool, estimate_tokens
+
+"""
+群聊记录滚动摘要
+
+每次请求都注入全部聊天记录时，prompt 随群聊活跃度增长到 max_cnt 条。
+会话中没有被摘要覆盖、又不在最近 keep_recent 条之内的记录达到 threshold 条时，在后台用一个提供商
+把旧摘要和这些记录合并成新的摘要，不占用请求路径。请求时注入摘要和它之后的记录。
+
+- 每个会话同时只有一个摘要任务，全局并发数有上限
+- 摘要失败后 RETRY_AFTER 秒内不重试，期间照常注入原始记录
+- 摘要保存在内存中的会话对象上；开启持久化时通过 on_summary 与会话一起写入磁盘，
+  会话被淘汰后重新加载时连同摘要一起恢复，不需要重新生成
+"""
+
+DEFAULT_PROMPT = (
+    "You maintain a running summary of a group chat. Below are the previous summary (may be empty) "
+    "and the messages that came after it. Write an updated summary that keeps who said what about which "
+    "topics, open questions, decisions and anything the group may refer back to. "
+    "Use the SAME language as the chat, at most {max_words} words, and output only the summary.\n\n"
+    "Previous summary:\n{summary}\n\nMessages:\n{messages}"
+)
+
+RETRY_AFTER = 60.0
+
+
+class HistorySummarizer:
+    def __init__(
+        self,
+        context: star.Context,
+        pool: SessionPool,
+        provider_id: str = "",
+        threshold: int = 100,
+        keep_recent: int = 50,
+        concurrency: int = 2,
+        max_words: int = 200,
+        prompt: str = DEFAULT_PROMPT,
+        token_estimator: Callable[[str], int] = estimate_tokens,
+        on_summary: Optional[Callable[[str, SessionHistory], None]] = None,
+    ):
+        """
+        Args:
+            pool: 聊天记录所在的会话池，用于同步摘要占用的内存
+            provider_id: 生成摘要的提供商 ID，为空时使用当前默认提供商
+            threshold: 待摘要的记录达到该条数时触发
+            keep_recent: 最近的若干条记录始终保持原文，不参与摘要
+            concurrency: 同时进行的摘要任务数上限
+            max_words: 摘要的长度上限(写在提示词中)
+            prompt: 提示词模板，可用 {summary} {messages} {max_words}
+            on_summary: 摘要更新后的回调(会话, 聊天记录)，用于持久化
+        """
+        self.context = context
+        self.pool = pool
+        self.provider_id = provider_id
+        self.threshold = max(1, threshold)
+        self.keep_recent = max(0, keep_recent)
+        self.concurrency = max(1, concurrency)
+        self.max_words = max_words
+        self.prompt = prompt
+        self.token_estimator = token_estimator
+        self.on_summary = on_summary
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._failed: dict[str, float] = {}
+        """摘要失败的会话 -> 失败时间"""
+        self.runs = 0
+        self.failures = 0
+        self.summarized_records = 0
+        self.busy_seconds = 0.0
+
+    @classmethod
+    def from_config(
+        cls,
+        context: star.Context,
+        pool: SessionPool,
+        cfg: dict,
+        token_estimator: Callable[[str], int] = estimate_tokens,
+        on_summary: Optional[Callable[[str, SessionHistory], None]] = None,
+    ) -> "HistorySummarizer":
+        """从插件配置的 ltm 部分创建"""
+        return cls(
+            context,
+            pool,
+            provider_id=cfg.get("summary_provider_id", ""),
+            threshold=int(cfg.get("summary_threshold", 100)),
+            keep_recent=int(cfg.get("summary_keep_recent", 50)),
+            concurrency=int(cfg.get("summary_concurrency", 2)),
+            max_words=int(cfg.get("summary_max_words", 200)),
+            token_estimator=token_estimator,
+            on_summary=on_summary,
+        )
+
+    def pending(self, history: SessionHistory) -> tuple[int, int]:
+        """待摘要的记录下标范围 [start, end)"""
+        start = history.unsummarized_start()
+        end = max(len(history) - self.keep_recent, start)
+        return start, end
+
+    def maybe_schedule(self, umo: str, history: SessionHistory):
+        """追加记录后调用，待摘要的记录足够多时启动后台摘要任务。O(1)"""
+        if umo in self._tasks:
+            return
+        start, end = self.pending(history)
+        if end - start < self.threshold:
+            return
+        failed = self._failed.get(umo)
+        if failed is not None:
+            if time.monotonic() - failed < RETRY_AFTER:
+                return
+            del self._failed[umo]
+        task = self._tasks[umo] = asyncio.create_task(self._summarize(umo, history))
+        task.add_done_callback(lambda t: self._forget(umo, t))
+
+    def _forget(self, umo: str, task: asyncio.Task):
+        if self._tasks.get(umo) is task:
+            del self._tasks[umo]
+
+    def discard(self, umo: str):
+        """会话被删除时取消进行中的摘要"""
+        task = self._tasks.pop(umo, None)
+        if task is not None:
+            task.cancel()
+        self._failed.pop(umo, None)
+
+    def _provider(self):
+        if not self.provider_id:
+            provider = self.context.get_using_provider()
+        else:
+            provider = self.context.get_provider_by_id(self.provider_id)
+            if not provider:
+                raise Exception(f"没有找到 ID 为 {self.provider_id} 的提供商")
+        if not isinstance(provider, Provider):
+            raise Exception(f"提供商类型错误({type(provider)})，无法生成摘要")
+        return provider
+
+    async def _summarize(self, umo: str, history: SessionHistory):
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+        async with self._sem:
+            # 等待期间可能追加了更多记录，按开始时的状态取
+            start, end = self.pending(history)
+            if end <= start:
+                return
+            first = history.appended - len(history)
+            records = list(itertools.islice(history, start, end))
+            prompt = self.prompt.format(
+                summary=history.summary or "",
+                messages=history.SEP.join(r.render() for r in records),
+                max_words=self.max_words,
+            )
+            started = time.perf_counter()
+            try:
+                resp = await self._provider().text_chat(
+                    prompt=prompt, session_id=uuid.uuid4().hex, persist=False
+                )
+                summary = (resp.completion_text or "").strip()
+                if not summary:
+                    raise Exception("提供商返回了空的摘要")
+            except Exception as e:
+                self.failures += 1
+                self._failed[umo] = time.monotonic()
+                logger.error(f"ltm | {umo} | 生成聊天记录摘要失败: {e}")
+                return
+            finally:
+                self.busy_seconds += time.perf_counter() - started
+        self.runs += 1
+        self.summarized_records += len(records)
+        self.pool.set_summary(
+            umo, history, summary, first + end, self.token_estimator(summary)
+        )
+        if self.on_summary is not None:
+            self.on_summary(umo, history)
+        logger.debug(
+            f"ltm | {umo} | 摘要了 {len(records)} 条聊天记录，摘要约 {history.summary_tokens} tokens"
+        )
+
+    async def join(self):
+        """等待进行中的摘要任务完成"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> dict:
+        return {
+            "running": len(self._tasks),
+            "runs": self.runs,
+            "failures": self.failures,
+            "summarized_records": self.summarized_records,
+            "busy_seconds": self.busy_seconds,
+        }
@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Generic, Optional, TypeVar
+
+from astrbot.api import logger
+
+"""
+群聊消息写入队列
+
+群消息钩子只做解析和入队，图片描述和写入聊天记录由后台 worker 完成，钩子的耗时不受描述提供商速度影响。
+- 按会话哈希分片，每个分片一个 worker，同一个会话的消息按到达顺序写入
+- worker 一次取出一批消息交给处理函数，处理函数可以合并同一会话的写入、批量描述图片
+- 队列有上限，写满时按溢出策略处理:
+  - drop_oldest: 丢弃分片中最早的消息
+  - drop_images: 分片超过一半时新消息的图片不再描述(由 degrade 处理)，写满时仍丢弃最早的消息
+"""
+
+T = TypeVar("T")
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_images")
+
+
+class IngestQueue(Generic[T]):
+    def __init__(
+        self,
+        handler: Callable[[list[T]], Awaitable[None]],
+        key: Callable[[T], str],
+        maxsize: int = 10000,
+        workers: int = 4,
+        batch_size: int = 32,
+        overflow: str = "drop_oldest",
+        degrade: Optional[Callable[[T], Optional[T]]] = None,
+    ):
+        """
+        Args:
+            handler: 处理一批消息的协程函数，同一批中同一会话的消息保持到达顺序
+            key: 取消息所属会话的函数，用于分片
+            maxsize: 所有分片合计的最大排队消息数
+            workers: worker 数量(分片数)
+            batch_size: 每批最多处理的消息数
+            overflow: 溢出策略，见 OVERFLOW_POLICIES
+            degrade: drop_images 策略下降级一条消息的函数，返回 None 表示消息没有可以去掉的图片
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            logger.warning(f"未知的溢出策略 {overflow}，使用 drop_oldest")
+            overflow = "drop_oldest"
+        self.handler = handler
+        self.key = key
+        self.workers = max(1, workers)
+        self.capacity = max(1, -(-maxsize // self.workers))
+        """每个分片的上限"""
+        self.batch_size = max(1, batch_size)
+        self.overflow = overflow
+        self.degrade = degrade
+        self._shards: list[deque[T]] = [deque() for _ in range(self.workers)]
+        self._wakeups: list[asyncio.Event] = []
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+        self._active = 0
+        """正在处理的批数"""
+        self.submitted = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.images_dropped = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def depth(self) -> int:
+        """当前排队的消息数"""
+        return sum(len(shard) for shard in self._shards)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def start(self):
+        """启动 worker，需要在事件循环中调用"""
+        if self._tasks:
+            return
+        self._closing = False
+        self._wakeups = [asyncio.Event() for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(i)) for i in range(self.workers)
+        ]
+
+    def submit(self, item: T) -> bool:
+        """
+        入队，不等待处理。返回消息是否被接受(关闭后不再接受)。
+        队列满时按溢出策略丢弃，入队本身总是成功。
+        """
+        if self._closing:
+            return False
+        i = hash(self.key(item)) % self.workers
+        shard = self._shards[i]
+        if (
+            self.overflow == "drop_images"
+            and self.degrade is not None
+            and len(shard) >= self.capacity // 2
+        ):
+            degraded = self.degrade(item)
+            if degraded is not None:
+                item = degraded
+                self.images_dropped += 1
+        if len(shard) >= self.capacity:
+            shard.popleft()
+            self.dropped += 1
+        shard.append(item)
+        self.submitted += 1
+        depth = self.depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self._wakeups:
+            self._wakeups[i].set()
+        return True
+
+    async def _worker(self, i: int):
+        shard = self._shards[i]
+        wakeup = self._wakeups[i]
+        while True:
+            if not shard:
+                if self._closing:
+                    return
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            batch = [shard.popleft() for _ in range(min(self.batch_size, len(shard)))]
+            start = time.perf_counter()
+            self._active += 1
+            try:
+                await self.handler(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += len(batch)
+                logger.error(f"ltm | 写入 {len(batch)} 条群聊消息失败: {e}")
+            finally:
+                self._active -= 1
+            self.busy_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.processed += len(batch)
+
+    async def join(self):
+        """等待当前排队的消息全部处理完"""
+        while self.depth or self._active:
+            await asyncio.sleep(0.01)
+
+    async def close(self, timeout: float = 5.0):
+        """停止接受新消息，在 timeout 秒内处理完剩余消息，超时的丢弃"""
+        if not self._tasks:
+            return
+        self._closing = True
+        for wakeup in self._wakeups:
+            wakeup.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            left = self.depth
+            for shard in self._shards:
+                shard.clear()
+            logger.warning(f"ltm | 关闭时丢弃了 {left} 条未写入的群聊消息")
+        self._tasks = []
+        self._wakeups = []
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "images_dropped": self.images_dropped,
+            "batches": self.batches,
+            "busy_seconds": self.busy_seconds,
+        }
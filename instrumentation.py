@@ -0,0 +1,174 @@
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from astrbot.api import logger
+
+"""
+耗时统计
+
+MetricsRegistry 按阶段以及按 (会话, 阶段) 记录耗时直方图(最近 window 个样本，计算 p50/p95/p99)，
+可以随时 dump() 出来；每个 span 同时通过 event.trace 导出。用法:
+
+    with metrics.span("after_req_llm", event):
+        ...
+
+关闭时 span() 直接返回一个共享的空上下文管理器，不读时钟也不分配对象。
+"""
+
+
+def percentile(values: list[float], p: float) -> float:
+    """最近秩法计算百分位数，p 取值 0~100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(max(math.ceil(p / 100 * len(ordered)) - 1, 0), len(ordered) - 1)
+    return ordered[k]
+
+
+class Histogram:
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.samples.append(seconds)
+
+    def to_dict(self) -> dict:
+        """单位毫秒；百分位数只统计最近 window 个样本"""
+        samples = list(self.samples)
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+        }
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("registry", "stage", "umo", "event", "start", "elapsed")
+
+    def __init__(self, registry: "MetricsRegistry", stage: str, umo: Optional[str], event):
+        self.registry = registry
+        self.stage = stage
+        self.umo = umo
+        self.event = event
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        self.registry.observe(self.stage, self.elapsed, self.umo, self.event)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(
+        self,
+        enabled: bool = False,
+        trace: bool = True,
+        window: int = 1024,
+        max_sessions: int = 200,
+    ):
+        """
+        Args:
+            enabled: 是否记录，关闭时所有方法几乎没有开销
+            trace: 是否同时通过 event.trace 导出每个 span
+            window: 每个直方图保留的最近样本数
+            max_sessions: 按会话统计的会话数上限，超出时丢弃最久没有更新的会话
+        """
+        self.enabled = enabled
+        self.trace = trace
+        self.window = window
+        self.max_sessions = max_sessions
+        self._stages: dict[str, Histogram] = {}
+        self._sessions: OrderedDict[str, dict[str, Histogram]] = OrderedDict()
+
+    def span(self, stage: str, event=None, umo: Optional[str] = None):
+        """
+        记录 with 块的耗时。
+
+        Args:
+            event: 事件，用于导出到 event.trace；没有传 umo 时也从事件获取会话
+            umo: 按会话统计时使用的会话
+        """
+        if not self.enabled:
+            return _NOOP
+        if umo is None and event is not None:
+            umo = event.unified_msg_origin
+        return Span(self, stage, umo, event)
+
+    def observe(self, stage: str, seconds: float, umo: Optional[str] = None, event=None):
+        """记录一次已经测得的耗时(秒)"""
+        if not self.enabled:
+            return
+        hist = self._stages.get(stage)
+        if hist is None:
+            hist = self._stages[stage] = Histogram(self.window)
+        hist.observe(seconds)
+        if umo is not None and self.max_sessions > 0:
+            per_umo = self._sessions.get(umo)
+            if per_umo is None:
+                per_umo = self._sessions[umo] = {}
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(umo)
+            hist = per_umo.get(stage)
+            if hist is None:
+                hist = per_umo[stage] = Histogram(self.window)
+            hist.observe(seconds)
+        if self.trace and event is not None:
+            try:
+                event.trace.record("span", stage=stage, ms=round(seconds * 1000, 3))
+            except Exception as e:
+                logger.debug(f"导出 span 失败: {e}")
+
+    def dump(self, umo: Optional[str] = None) -> dict:
+        """
+        当前统计。
+
+        Args:
+            umo: 只输出该会话的统计，None 时输出所有阶段和所有会话
+        """
+        if umo is not None:
+            per_umo = self._sessions.get(umo, {})
+            return {stage: hist.to_dict() for stage, hist in per_umo.items()}
+        return {
+            "stages": {stage: hist.to_dict() for stage, hist in self._stages.items()},
+            "sessions": {
+                umo: {stage: hist.to_dict() for stage, hist in per_umo.items()}
+                for umo, per_umo in self._sessions.items()
+            },
+        }
+
+    def reset(self):
+        self._stages.clear()
+        self._sessions.clear()
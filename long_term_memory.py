@@ -1,7 +1,9 @@
-import datetime
-import random
+import asyncio
+import itertools
 import uuid
-from collections import defaultdict
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Callable
 
 from astrbot import logger
 from astrbot.api import star
@@ -11,64 +13,252 @@ from astrbot.api.platform import MessageType
 from astrbot.api.provider import LLMResponse, Provider, ProviderRequest
 from astrbot.core.astrbot_config_mgr import AstrBotConfigManager
 
+from .active_reply import REPLY, ActiveReplyScheduler
+from .chat_history import (
+    IMAGE_MARK,
+    ChatRecord,
+    SessionHistory,
+    SessionPool,
+    estimate_tokens,
+    now_ts,
+)
+from .captioning import CaptionService
+from .config_snapshot import ConfigSnapshotCache, LTMSettings
+from .history_index import BM25Index
+from .history_summary import HistorySummarizer
+from .ingest_queue import IngestQueue
+from .ltm_store import HistoryStore
+
 """
 聊天记忆增强
 """
 
+# 每条记录格式化后的额外 token 开销: `[昵称/HH:MM:SS]: ` 和分隔符
+RECORD_TOKEN_OVERHEAD = 8
+
+
+@dataclass(slots=True)
+class PendingMessage:
+    """已解析、等待写入的群聊消息"""
+
+    umo: str
+    sender: str
+    timestamp: int
+    """消息到达的时间，排队不影响记录的时间"""
+    parts: list[str]
+    images: list[tuple[int, str]]
+    """写入前需要描述的图片: (在 parts 中的位置, URL)"""
+    lazy: tuple[str, ...] | None
+    """延迟描述的图片 URL，与 parts 中的 IMAGE_MARK 一一对应"""
+    cfg: LTMSettings
+
 
 class LongTermMemory:
-    def __init__(self, acm: AstrBotConfigManager, context: star.Context):
+    def __init__(
+        self,
+        acm: AstrBotConfigManager,
+        context: star.Context,
+        config: dict | None = None,
+        token_estimator: Callable[[str], int] = estimate_tokens,
+        store: HistoryStore | None = None,
+        configs: ConfigSnapshotCache | None = None,
+        captions: CaptionService | None = None,
+    ):
+        """
+        Args:
+            config: 插件配置中的 ltm 部分
+            token_estimator: 估算文本 token 数的函数，每条消息写入时调用一次
+            store: 持久化存储，为 None 时聊天记录只保存在内存中
+            configs: 会话配置快照缓存，与插件的其他部分共用
+            captions: 图片描述服务，与插件的其他部分共用
+        """
         self.acm = acm
         self.context = context
-        self.session_chats = defaultdict(list)
-        """记录群成员的群聊记录"""
-
-    def cfg(self, event: AstrMessageEvent):
-        cfg = self.context.get_config(umo=event.unified_msg_origin)
+        self.config = config or {}
+        self.configs = configs or ConfigSnapshotCache(context)
+        self.captions = captions or CaptionService()
+        self.lazy_caption = bool(self.config.get("lazy_caption", True))
+        """图片只在聊天记录被注入请求时才描述"""
         try:
-            max_cnt = int(cfg["provider_ltm_settings"]["group_message_max_cnt"])
-        except BaseException as e:
-            logger.error(e)
-            max_cnt = 300
-        image_caption_prompt = cfg["provider_settings"]["image_caption_prompt"]
-        image_caption_provider_id = cfg["provider_ltm_settings"].get(
-            "image_caption_provider_id"
+            self.token_budget = int(self.config.get("token_budget", 0))
+        except (TypeError, ValueError):
+            self.token_budget = 0
+        self.token_estimator = token_estimator
+        self.store = store
+        self.session_chats = SessionPool(
+            max_bytes=int(self.config.get("max_resident_mb", 128) * 1024 * 1024),
+            max_sessions=int(self.config.get("max_sessions", 0)),
+            idle_ttl=float(self.config.get("idle_ttl_minutes", 0)) * 60,
+            on_evict=self._on_evict,
+        )
+        """记录群成员的群聊记录(常驻内存的部分)"""
+        self._loading: dict[str, asyncio.Task] = {}
+        """正在从磁盘加载的会话，同一个会话的并发访问共用一次加载"""
+        self.ingest_queue: IngestQueue[PendingMessage] = IngestQueue(
+            self.ingest,
+            key=lambda msg: msg.umo,
+            maxsize=int(self.config.get("ingest_queue_size", 10000)),
+            workers=int(self.config.get("ingest_workers", 4)),
+            batch_size=int(self.config.get("ingest_batch_size", 32)),
+            overflow=self.config.get("ingest_overflow", "drop_oldest"),
+            degrade=self._drop_images,
         )
-        image_caption = cfg["provider_ltm_settings"]["image_caption"] and bool(
-            image_caption_provider_id
+        """群聊消息写入队列，消息钩子只负责入队"""
+        self.active_reply = ActiveReplyScheduler.from_config(self.config)
+        """主动回复调度: 冷却、负载和速率上限"""
+        self._inflight_keys = itertools.count()
+        self.retrieval = bool(self.config.get("retrieval_enable", False))
+        """按与当前消息的相关度选取较早的记录，而不是注入全部记录"""
+        self.retrieval_top_k = int(self.config.get("retrieval_top_k", 20))
+        self.retrieval_recent = int(self.config.get("retrieval_recent", 30))
+        self.summarizer: HistorySummarizer | None = None
+        """较早聊天记录的后台滚动摘要，关闭时为 None"""
+        if self.config.get("summary_enable", False):
+            self.summarizer = HistorySummarizer.from_config(
+                context, self.session_chats, self.config, token_estimator,
+                on_summary=self._save_summary if self.store else None,
+            )
+
+    def start(self):
+        """启动后台任务，需要在事件循环中调用"""
+        self.ingest_queue.start()
+        if self.store:
+            self.store.start()
+
+    async def close(self):
+        # 先把排队的消息写完，再关闭存储
+        await self.ingest_queue.close()
+        if self.summarizer:
+            await self.summarizer.close()
+        if self.store:
+            await self.store.close()
+
+    def _on_evict(self, umo: str, history: SessionHistory):
+        # 开启持久化时记录已经写入磁盘，下次访问会重新加载；否则直接丢弃
+        logger.debug(
+            f"ltm | {umo} | 会话被淘汰({len(history)} 条记录, "
+            f"{'已持久化' if self.store else '已丢弃'})"
         )
-        active_reply = cfg["provider_ltm_settings"]["active_reply"]
-        enable_active_reply = active_reply.get("enable", False)
-        ar_method = active_reply["method"]
-        ar_possibility = active_reply["possibility_reply"]
-        ar_prompt = active_reply.get("prompt", "")
-        ar_whitelist = active_reply.get("whitelist", [])
-        ret = {
-            "max_cnt": max_cnt,
-            "image_caption": image_caption,
-            "image_caption_prompt": image_caption_prompt,
-            "image_caption_provider_id": image_caption_provider_id,
-            "enable_active_reply": enable_active_reply,
-            "ar_method": ar_method,
-            "ar_possibility": ar_possibility,
-            "ar_prompt": ar_prompt,
-            "ar_whitelist": ar_whitelist,
+
+    def metrics(self) -> dict:
+        """内存占用、写入队列和主动回复指标"""
+        return {
+            "resident_bytes": self.session_chats.resident_bytes,
+            "resident_sessions": len(self.session_chats),
+            "evictions": self.session_chats.evictions,
+            "persisted_sessions": len(self.store.sessions) if self.store else 0,
+            "ingest": self.ingest_queue.stats(),
+            "active_reply": self.active_reply.stats(),
+            "summary": self.summarizer.stats() if self.summarizer else None,
         }
-        return ret
+
+    async def _get_history(
+        self, umo: str, max_cnt: int | None = None, create: bool = False
+    ) -> SessionHistory | None:
+        """
+        获取会话的聊天记录。内存中没有但磁盘上有时，在第一次访问时加载。
+
+        Args:
+            max_cnt: 配置的最大条数，变化时同步调整上限；为 None 时不调整
+            create: 会话不存在时是否创建
+        """
+        history = self.session_chats.get(umo)
+        if history is None and self.store is not None and umo in self.store.sessions:
+            task = self._loading.get(umo)
+            if task is None:
+                task = self._loading[umo] = asyncio.create_task(
+                    self._load_history(umo, max_cnt or self.store.sessions[umo])
+                )
+                task.add_done_callback(
+                    lambda t: self._loading.pop(umo) if self._loading.get(umo) is t else None
+                )
+            history = await asyncio.shield(task)
+        if history is None:
+            if not create:
+                return None
+            history = self.session_chats.create(umo, max_cnt)
+        elif max_cnt is not None:
+            self.session_chats.set_max_len(umo, history, max_cnt)
+        if self.retrieval and history.index is None:
+            # 新建或从磁盘加载的会话在第一次访问时建立索引
+            self.session_chats.enable_index(umo, history, BM25Index())
+        return history
+
+    async def _load_history(self, umo: str, max_cnt: int) -> SessionHistory | None:
+        stored = await self.store.load_session(umo, max_cnt)
+        records = stored.records
+        if self._loading.get(umo) is not asyncio.current_task():
+            # 加载期间会话被清空，读到的是清空前的记录，不能再放回内存
+            logger.debug(f"ltm | {umo} | 加载期间会话被清空，丢弃读到的 {len(records)} 条聊天记录")
+            return self.session_chats.get(umo)
+        history = self.session_chats.get(umo)
+        if history is None:
+            history = SessionHistory(max_cnt)
+            for record in records:
+                history.append(record)
+            # 沿用磁盘上的序号，摘要覆盖的范围(summary_end)才对得上
+            history.appended = max(stored.appended, history.appended)
+            if self.summarizer and stored.summary:
+                history.set_summary(stored.summary, stored.summary_end, stored.summary_tokens)
+            self.session_chats.add(umo, history)
+            logger.debug(
+                f"ltm | {umo} | 从磁盘加载了 {len(records)} 条聊天记录"
+                f"{'和摘要' if history.summary else ''}"
+            )
+        return history
+
+    def _save_summary(self, umo: str, history: SessionHistory):
+        self.store.set_summary(umo, history.summary, history.summary_end, history.summary_tokens)
+
+    async def _append_many(self, umo: str, records: list[ChatRecord], max_cnt: int):
+        """同一会话的多条记录只查找(加载)一次会话"""
+        history = await self._get_history(umo, max_cnt, create=True)
+        for record in records:
+            self.session_chats.append(umo, history, record)
+            if self.store:
+                self.store.append(umo, record, max_cnt)
+        if self.summarizer:
+            self.summarizer.maybe_schedule(umo, history)
+
+    def _new_record(
+        self, sender: str, text: str, images: tuple[str, ...] | None = None
+    ) -> ChatRecord:
+        record = ChatRecord(sender, now_ts(), text, images=images)
+        self._estimate(record)
+        return record
+
+    def _estimate(self, record: ChatRecord):
+        record.tokens = (
+            self.token_estimator(record.sender)
+            + self.token_estimator(record.display_text)
+            + RECORD_TOKEN_OVERHEAD
+        )
+
+    def cfg(self, event: AstrMessageEvent) -> LTMSettings:
+        return self.configs.for_event(event).ltm
 
     async def remove_session(self, event: AstrMessageEvent) -> int:
         cnt = 0
-        if event.unified_msg_origin in self.session_chats:
-            cnt = len(self.session_chats[event.unified_msg_origin])
-            del self.session_chats[event.unified_msg_origin]
+        # 正在进行的加载完成后不再把旧记录放回内存
+        self._loading.pop(event.unified_msg_origin, None)
+        if self.store:
+            self.store.delete_session(event.unified_msg_origin)
+        if self.summarizer:
+            self.summarizer.discard(event.unified_msg_origin)
+        history = self.session_chats.pop(event.unified_msg_origin)
+        if history is not None:
+            cnt = len(history)
+            # 可能仍有进行中的请求持有该对象，先释放渲染缓存
+            history.invalidate()
         return cnt
 
-    async def get_image_caption(
+    async def get_image_captions(
         self,
-        image_url: str,
+        image_urls: list[str],
         image_caption_provider_id: str,
         image_caption_prompt: str,
-    ) -> str:
+    ) -> list:
+        """并发获取每张图片的描述，按输入顺序返回，失败的位置是异常对象"""
         if not image_caption_provider_id:
             provider = self.context.get_using_provider()
         else:
@@ -77,17 +267,21 @@ class LongTermMemory:
                 raise Exception(f"没有找到 ID 为 {image_caption_provider_id} 的提供商")
         if not isinstance(provider, Provider):
             raise Exception(f"提供商类型错误({type(provider)})，无法获取图片描述")
-        response = await provider.text_chat(
-            prompt=image_caption_prompt,
+        return await self.captions.caption_each(
+            provider,
+            image_urls,
+            image_caption_prompt,
             session_id=uuid.uuid4().hex,
-            image_urls=[image_url],
             persist=False,
         )
-        return response.completion_text
 
     async def need_active_reply(self, event: AstrMessageEvent) -> bool:
+        """
+        是否主动回复这条群消息，由 ActiveReplyScheduler 按冷却、负载和速率上限决定。
+        决定回复时这次回复立即计为进行中的请求，LLM 请求结束时调用 active_reply.end(inflight_key(event))。
+        """
         cfg = self.cfg(event)
-        if not cfg["enable_active_reply"]:
+        if not cfg.enable_active_reply:
             return False
         if event.get_message_type() != MessageType.GROUP_MESSAGE:
             return False
@@ -96,67 +290,301 @@ class LongTermMemory:
             # if the message is a command, let it pass
             return False
 
-        if cfg["ar_whitelist"] and (
-            event.unified_msg_origin not in cfg["ar_whitelist"]
+        if cfg.ar_whitelist and (
+            event.unified_msg_origin not in cfg.ar_whitelist
             and (
-                event.get_group_id() and event.get_group_id() not in cfg["ar_whitelist"]
+                event.get_group_id() and event.get_group_id() not in cfg.ar_whitelist
             )
         ):
             return False
 
-        match cfg["ar_method"]:
+        match cfg.ar_method:
             case "possibility_reply":
-                trig = random.random() < cfg["ar_possibility"]
-                return trig
+                outcome = self.active_reply.decide(
+                    event.unified_msg_origin,
+                    event.message_str,
+                    cfg.ar_possibility,
+                    key=self.inflight_key(event),
+                )
+                if outcome != REPLY:
+                    logger.debug(f"ltm | {event.unified_msg_origin} | 不主动回复: {outcome}")
+                return outcome == REPLY
 
         return False
 
-    async def handle_message(self, event: AstrMessageEvent):
-        """仅支持群聊"""
-        if event.get_message_type() == MessageType.GROUP_MESSAGE:
-            datetime_str = datetime.datetime.now().strftime("%H:%M:%S")
-
-            parts = [f"[{event.message_obj.sender.nickname}/{datetime_str}]: "]
-
-            cfg = self.cfg(event)
-
-            for comp in event.get_messages():
-                if isinstance(comp, Plain):
-                    parts.append(f" {comp.text}")
-                elif isinstance(comp, Image):
-                    if cfg["image_caption"]:
-                        try:
-                            url = comp.url if comp.url else comp.file
-                            if not url:
-                                raise Exception("图片 URL 为空")
-                            caption = await self.get_image_caption(
-                                url,
-                                cfg["image_caption_provider_id"],
-                                cfg["image_caption_prompt"],
-                            )
-                            parts.append(f" [Image: {caption}]")
-                        except Exception as e:
-                            logger.error(f"获取图片描述失败: {e}")
+    def inflight_key(self, event: AstrMessageEvent) -> int:
+        """
+        事件对应的进行中请求在 active_reply 中的 key，第一次使用时生成并保存在事件的 extra 中。
+        不使用 id(event): 没有结束的请求会保留到超时，期间 id 可能被新的事件复用。
+        """
+        key = event.get_extra("_ltm_inflight_key")
+        if key is None:
+            key = next(self._inflight_keys)
+            event.set_extra("_ltm_inflight_key", key)
+        return key
+
+    def parse_message(self, event: AstrMessageEvent) -> PendingMessage | None:
+        """
+        把群聊消息解析为待写入的消息，不做任何 IO，可以在消息钩子中直接调用。
+        非群聊消息返回 None。
+        """
+        if event.get_message_type() != MessageType.GROUP_MESSAGE:
+            return None
+        parts = []
+        images: list[tuple[int, str]] = []
+        """需要描述的图片: (在 parts 中的位置, URL)"""
+        lazy: list[str] = []
+        """延迟描述的图片 URL，文本中先放占位符"""
+
+        cfg = self.cfg(event)
+
+        for comp in event.get_messages():
+            if isinstance(comp, Plain):
+                parts.append(f" {comp.text}")
+            elif isinstance(comp, Image):
+                if cfg.image_caption:
+                    url = comp.url if comp.url else comp.file
+                    if not url:
+                        logger.error("获取图片描述失败: 图片 URL 为空")
+                        continue
+                    if self.lazy_caption:
+                        lazy.append(url)
+                        parts.append(f" {IMAGE_MARK}")
                     else:
-                        parts.append(" [Image]")
-                elif isinstance(comp, At):
-                    parts.append(f" [At: {comp.name}]")
+                        images.append((len(parts), url))
+                        parts.append("")
+                else:
+                    parts.append(" [Image]")
+            elif isinstance(comp, At):
+                parts.append(f" [At: {comp.name}]")
+
+        return PendingMessage(
+            event.unified_msg_origin,
+            event.message_obj.sender.nickname,
+            now_ts(),
+            parts,
+            images,
+            tuple(lazy) or None,
+            cfg,
+        )
 
-            final_message = "".join(parts)
-            logger.debug(f"ltm | {event.unified_msg_origin} | {final_message}")
-            self.session_chats[event.unified_msg_origin].append(final_message)
-            if len(self.session_chats[event.unified_msg_origin]) > cfg["max_cnt"]:
-                self.session_chats[event.unified_msg_origin].pop(0)
+    @staticmethod
+    def _drop_images(msg: PendingMessage) -> PendingMessage | None:
+        """写入队列积压时去掉消息中待描述的图片，只记为 [Image]"""
+        if not msg.images and not msg.lazy:
+            return None
+        for i, _ in msg.images:
+            msg.parts[i] = " [Image]"
+        msg.images = []
+        if msg.lazy:
+            msg.parts = [p.replace(IMAGE_MARK, "[Image]") for p in msg.parts]
+            msg.lazy = None
+        return msg
+
+    async def ingest(self, batch: list[PendingMessage]):
+        """
+        写入一批已解析的消息: 整批消息中需要描述的图片按描述配置分组并发请求，
+        然后按会话合并写入，同一会话的消息保持原有顺序。
+        """
+        groups: dict[tuple[str, str], list[PendingMessage]] = {}
+        for msg in batch:
+            if msg.images:
+                key = (msg.cfg.image_caption_provider_id, msg.cfg.image_caption_prompt)
+                groups.setdefault(key, []).append(msg)
+        if groups:
+            await asyncio.gather(
+                *(self._caption_batch(msgs, *key) for key, msgs in groups.items())
+            )
+
+        sessions: dict[str, list[PendingMessage]] = {}
+        for msg in batch:
+            sessions.setdefault(msg.umo, []).append(msg)
+        for umo, msgs in sessions.items():
+            records = []
+            for msg in msgs:
+                record = ChatRecord(msg.sender, msg.timestamp, "".join(msg.parts), images=msg.lazy)
+                self._estimate(record)
+                logger.debug(f"ltm | {umo} | {record.render()}")
+                records.append(record)
+            # 同一批中同一会话的配置可能在中途变化，以最后一条为准
+            await self._append_many(umo, records, msgs[-1].cfg.max_cnt)
+
+    async def _caption_batch(
+        self, msgs: list[PendingMessage], provider_id: str, prompt: str
+    ):
+        # 一批消息中的所有图片并发描述，相同的图片直接复用缓存
+        urls = [url for msg in msgs for _, url in msg.images]
+        try:
+            captions = await self.get_image_captions(urls, provider_id, prompt)
+        except Exception as e:
+            captions = [e] * len(urls)
+        it = iter(captions)
+        for msg in msgs:
+            for i, _ in msg.images:
+                caption = next(it)
+                if isinstance(caption, BaseException):
+                    logger.error(f"获取图片描述失败: {caption}")
+                else:
+                    msg.parts[i] = f" [Image: {caption}]"
+        logger.debug(f"ltm | 图片描述统计: {self.captions.stats.to_dict()}")
+
+    def enqueue(self, event: AstrMessageEvent) -> bool:
+        """解析群聊消息并交给写入队列，不等待写入。返回消息是否入队"""
+        msg = self.parse_message(event)
+        if msg is None:
+            return False
+        return self.ingest_queue.submit(msg)
+
+    async def handle_message(self, event: AstrMessageEvent):
+        """仅支持群聊。直接写入，不经过写入队列"""
+        msg = self.parse_message(event)
+        if msg is not None:
+            await self.ingest([msg])
+
+    async def _resolve_captions(
+        self, umo: str, history: SessionHistory, start: int, cfg: LTMSettings
+    ) -> bool:
+        """
+        为将要注入的记录中尚未描述的图片批量获取描述，结果写回记录，之后不再重复请求。
+        返回是否有记录被修改。
+        """
+        first = history.appended - len(history) + start
+        pending = [
+            (first + i, r, r.images)
+            for i, r in enumerate(itertools.islice(history, start, None))
+            if r.images
+        ]
+        if not pending:
+            return False
+        urls = [url for _, _, images in pending for url in images]
+        try:
+            captions = await self.get_image_captions(
+                urls, cfg.image_caption_provider_id, cfg.image_caption_prompt
+            )
+        except Exception as e:
+            captions = [e] * len(urls)
+        failed = 0
+        it = iter(captions)
+        for seq, record, images in pending:
+            resolved = []
+            for _ in images:
+                caption = next(it)
+                if isinstance(caption, BaseException):
+                    # 失败的图片显示为 [Image]，不在每次请求时重试
+                    logger.error(f"获取图片描述失败: {caption}")
+                    failed += 1
+                    caption = None
+                resolved.append(caption)
+            if record.images is images:
+                # 并发的请求可能已经先一步写回了
+                text = record.text
+                record.resolve(resolved)
+                self._estimate(record)
+                # 索引中是带占位符的文本，换成带描述的文本后图片内容才能被检索到
+                history.reindex(seq)
+                if self.store:
+                    self.store.update(umo, record, text, images)
+        # 会话可能在等待期间被淘汰，此时只修改了记录对象本身
+        self.session_chats.refresh(umo, history)
+        logger.debug(
+            f"ltm | {umo} | 延迟描述了 {len(urls)} 张图片(失败 {failed})，"
+            f"统计: {self.captions.stats.to_dict()}"
+        )
+        return True
+
+    def _window_start(self, history: SessionHistory) -> int:
+        """
+        要注入的第一条记录的下标。有摘要时从摘要之后开始；
+        token 预算模式下只保留预算内(扣除摘要)最新的若干条；检索模式下至多保留最近 retrieval_recent 条。
+        """
+        start = 0
+        budget = self.token_budget
+        if self.summarizer and history.summary:
+            start = history.unsummarized_start()
+            budget -= history.summary_tokens
+        if self.token_budget > 0:
+            start = max(start, history.window_start(max(budget, 0)))
+        if self.retrieval:
+            # 检索模式: 原样注入最近的若干条，更早的按相关度选取
+            start = max(start, len(history) - self.retrieval_recent)
+        return start
+
+    def _retrieve(
+        self, history: SessionHistory, query: str, start: int, budget: int | None
+    ) -> list[ChatRecord]:
+        """
+        从第 start 条之前的记录中选出与 query 最相关的至多 retrieval_top_k 条，按时间顺序返回。
+
+        Args:
+            budget: 可用的 token 数，放不下的记录跳过；None 表示不限
+        """
+        if history.index is None or start <= 0 or not query:
+            return []
+        seqs = history.index.search(
+            query, self.retrieval_top_k, before=history.appended - len(history) + start
+        )
+        picked = []
+        for seq in seqs:
+            record = history.records[history.seq_to_index(seq)]
+            if budget is not None:
+                if record.tokens > budget:
+                    continue
+                budget -= record.tokens
+            picked.append((seq, record))
+        picked.sort(key=itemgetter(0))
+        return [record for _, record in picked]
 
     async def on_req_llm(self, event: AstrMessageEvent, req: ProviderRequest):
         """当触发 LLM 请求前，调用此方法修改 req"""
-        if event.unified_msg_origin not in self.session_chats:
+        cfg = self.cfg(event)
+        history = await self._get_history(event.unified_msg_origin, cfg.max_cnt)
+        if history is None:
             return
 
-        chats_str = "\n---\n".join(self.session_chats[event.unified_msg_origin])
-
-        cfg = self.cfg(event)
-        if cfg["enable_active_reply"]:
+        start = self._window_start(history)
+        if cfg.image_caption and await self._resolve_captions(
+            event.unified_msg_origin, history, start, cfg
+        ):
+            # 描述替换占位符后 token 数变了
+            start = self._window_start(history)
+        # 渲染缓存随消息的追加和淘汰增量更新，历史没有变化时直接复用
+        chats_str = history.render(start)
+        tokens_used = history.token_count(start)
+        summary = history.summary if self.summarizer else None
+        if summary:
+            tokens_used += history.summary_tokens
+        relevant = []
+        if self.retrieval:
+            relevant = self._retrieve(
+                history,
+                req.prompt,
+                start,
+                self.token_budget - tokens_used if self.token_budget > 0 else None,
+            )
+        if relevant:
+            tokens_used += sum(r.tokens for r in relevant)
+            chats_str = (
+                f"[Earlier messages related to the new message]:\n"
+                f"{history.SEP.join(r.render() for r in relevant)}"
+                f"{history.SEP}[Recent messages]:\n{chats_str}"
+            )
+        if summary:
+            chats_str = f"[Summary of earlier messages]: {summary}{history.SEP}{chats_str}"
+        event.trace.record(
+            "ltm_history",
+            messages=len(history) - start,
+            tokens=tokens_used,
+            token_budget=self.token_budget,
+            summary_tokens=history.summary_tokens if summary else 0,
+            retrieved=len(relevant),
+            resident_bytes=self.session_chats.resident_bytes,
+            resident_sessions=len(self.session_chats),
+        )
+        logger.debug(
+            f"ltm | {event.unified_msg_origin} | 注入 {len(history) - start + len(relevant)}/{len(history)} 条聊天记录"
+            f"{'和摘要' if summary else ''}，约 {tokens_used} tokens (预算: {self.token_budget or '不限'})"
+        )
+        if cfg.enable_active_reply:
             prompt = req.prompt
             req.prompt = (
                 f"You are now in a chatroom. The chat history is as follows:\n{chats_str}"
@@ -167,20 +595,25 @@ class LongTermMemory:
             req.contexts = []  # 清空上下文，当使用了主动回复，所有聊天记录都在一个prompt中。
         else:
             req.system_prompt += (
-                "You are now in a chatroom. The chat history is as follows: \n"
+                f"You are now in a chatroom. The chat history is as follows: \n{chats_str}"
             )
-            req.system_prompt += chats_str
 
     async def after_req_llm(self, event: AstrMessageEvent, llm_resp: LLMResponse):
-        if event.unified_msg_origin not in self.session_chats:
+        if not llm_resp.completion_text:
+            return
+        umo = event.unified_msg_origin
+        if (
+            event.get_message_type() != MessageType.GROUP_MESSAGE
+            and await self._get_history(umo) is None
+        ):
             return
 
-        if llm_resp.completion_text:
-            final_message = f"[You/{datetime.datetime.now().strftime('%H:%M:%S')}]: {llm_resp.completion_text}"
-            logger.debug(
-                f"Recorded AI response: {event.unified_msg_origin} | {final_message}"
-            )
-            self.session_chats[event.unified_msg_origin].append(final_message)
-            cfg = self.cfg(event)
-            if len(self.session_chats[event.unified_msg_origin]) > cfg["max_cnt"]:
-                self.session_chats[event.unified_msg_origin].pop(0)
+        msg = PendingMessage(
+            umo, "You", now_ts(), [llm_resp.completion_text], [], None, self.cfg(event)
+        )
+        logger.debug(f"Recorded AI response: {umo} | {llm_resp.completion_text}")
+        # 触发回复的群消息可能还在写入队列中(积压或者正在描述图片)，
+        # 回复走同一个会话分片，保证记录在它之后
+        if self.ingest_queue.running and self.ingest_queue.submit(msg):
+            return
+        await self.ingest([msg])
@@ -0,0 +1,331 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+
+from astrbot.api import logger
+
+from .chat_history import ChatRecord
+
+"""
+群聊记录持久化
+
+使用 SQLite(WAL 模式)。写入只在内存中排队，由后台任务按批次在线程中提交，不占用消息处理路径；
+定期压缩，删除每个会话超出上限的旧记录。启动时只读取会话列表，会话的记录在第一次访问时才加载。
+尚未描述的图片连同 URL 一起保存(images 列)，描述完成后再更新对应的记录。
+会话行记录追加过的记录总数和滚动摘要，重新加载后记录的绝对序号不变，摘要覆盖的范围仍然有效。
+"""
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    umo TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    tokens INTEGER NOT NULL DEFAULT 0,
+    images TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_umo_id ON messages (umo, id);
+CREATE TABLE IF NOT EXISTS sessions (
+    umo TEXT PRIMARY KEY,
+    max_len INTEGER NOT NULL,
+    appended INTEGER NOT NULL DEFAULT 0,
+    summary TEXT,
+    summary_end INTEGER NOT NULL DEFAULT 0,
+    summary_tokens INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_SESSION_COLUMNS = {
+    "appended": "INTEGER NOT NULL DEFAULT 0",
+    "summary": "TEXT",
+    "summary_end": "INTEGER NOT NULL DEFAULT 0",
+    "summary_tokens": "INTEGER NOT NULL DEFAULT 0",
+}
+"""旧版本创建的 sessions 表缺少的列"""
+
+
+@dataclass
+class StoredSession:
+    records: list[ChatRecord]
+    """最近的记录，按时间顺序"""
+    appended: int
+    """追加过的记录总数(含已经压缩删除的)"""
+    summary: Optional[str] = None
+    summary_end: int = 0
+    """摘要覆盖了绝对序号小于它的记录"""
+    summary_tokens: int = 0
+
+
+class HistoryStore:
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 1.0,
+        batch_size: int = 500,
+        compact_interval: float = 600.0,
+        max_retries: int = 5,
+        max_backoff: float = 60.0,
+    ):
+        """
+        Args:
+            path: 数据库文件路径
+            flush_interval: 后台提交的间隔(秒)
+            batch_size: 排队的写入达到该数量时提前提交
+            compact_interval: 压缩的间隔(秒)
+            max_retries: 提交失败后的最多重试次数，超过后丢弃这批写入
+            max_backoff: 重试间隔的上限(秒)，间隔从 flush_interval 开始每次翻倍
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.compact_interval = compact_interval
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(messages)")}
+        if "images" not in columns:
+            # 旧版本创建的数据库
+            self._conn.execute("ALTER TABLE messages ADD COLUMN images TEXT")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(sessions)")}
+        with self._conn:
+            for name, decl in _SESSION_COLUMNS.items():
+                if name not in columns:
+                    self._conn.execute(f"ALTER TABLE sessions ADD COLUMN {name} {decl}")
+            if "appended" not in columns:
+                # 压缩删掉的记录已经无从统计，从现有的条数开始计数
+                self._conn.execute(
+                    "UPDATE sessions SET appended = "
+                    "(SELECT COUNT(*) FROM messages WHERE messages.umo = sessions.umo)"
+                )
+        self._db_lock = threading.Lock()
+        """连接会在不同的工作线程中使用，所有数据库操作串行执行"""
+        self.sessions: dict[str, int] = dict(
+            self._conn.execute("SELECT umo, max_len FROM sessions").fetchall()
+        )
+        """磁盘上有记录的会话及其上限"""
+        self._ops: list[tuple] = []
+        """排队中的写操作，按顺序提交"""
+        self._dirty: set[str] = set()
+        """上次压缩后有新写入的会话"""
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_compact = time.monotonic()
+        self._failures = 0
+        """连续提交失败的次数"""
+        self._retry_at = 0.0
+        """后台任务在这个时间点(time.monotonic())之前不再重试"""
+
+    def start(self):
+        """启动后台提交任务，需要在事件循环中调用"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """停止后台任务，提交剩余的写入并压缩"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.compact()
+        except Exception as e:
+            logger.error(f"ltm 持久化压缩失败: {e}")
+        with self._db_lock:
+            self._conn.close()
+
+    def append(self, umo: str, record: ChatRecord, max_len: int):
+        """记录一条消息(只入队，不做 I/O)"""
+        if self.sessions.get(umo) != max_len:
+            self.sessions[umo] = max_len
+            self._ops.append(("session", umo, max_len))
+        self._ops.append(("insert", umo, record))
+        self._dirty.add(umo)
+        if len(self._ops) >= self.batch_size:
+            self._wakeup.set()
+
+    def update(self, umo: str, record: ChatRecord, text: str, images: tuple[str, ...]):
+        """
+        记录中的图片描述完成后更新磁盘上的记录(只入队，不做 I/O)。
+
+        Args:
+            text: 描述之前的文本(含占位符)
+            images: 描述之前的图片 URL
+        """
+        if umo in self.sessions:
+            self._ops.append(("update", umo, record, text, images))
+
+    def set_summary(self, umo: str, summary: str, end: int, tokens: int):
+        """保存会话的滚动摘要(只入队，不做 I/O)"""
+        if umo in self.sessions:
+            self._ops.append(("summary", umo, summary, end, tokens))
+
+    def delete_session(self, umo: str):
+        if self.sessions.pop(umo, None) is not None:
+            self._ops.append(("delete", umo))
+
+    async def load(self, umo: str, limit: int) -> list[ChatRecord]:
+        """读取会话最近的 limit 条记录，按时间顺序返回"""
+        return (await self.load_session(umo, limit)).records
+
+    async def load_session(self, umo: str, limit: int) -> StoredSession:
+        """读取会话最近的 limit 条记录，以及追加过的记录总数和摘要"""
+        if umo not in self.sessions:
+            return StoredSession([], 0)
+        # 先提交排队中的写入，保证读到的数据完整
+        await self.flush()
+        return await asyncio.to_thread(self._load, umo, limit)
+
+    def _load(self, umo: str, limit: int) -> StoredSession:
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT sender, ts, text, tokens, images FROM messages WHERE umo = ? ORDER BY id DESC LIMIT ?",
+                (umo, max(limit, 0)),
+            ).fetchall()
+            session = self._conn.execute(
+                "SELECT appended, summary, summary_end, summary_tokens FROM sessions WHERE umo = ?",
+                (umo,),
+            ).fetchone()
+        records = [
+            ChatRecord(sender, ts, text, tokens, _decode_images(images))
+            for sender, ts, text, tokens, images in reversed(rows)
+        ]
+        if session is None:
+            return StoredSession(records, len(records))
+        appended, summary, summary_end, summary_tokens = session
+        return StoredSession(
+            records, max(appended, len(records)), summary, summary_end, summary_tokens
+        )
+
+    async def flush(self):
+        # 串行提交，保证批次之间的先后顺序
+        async with self._flush_lock:
+            if not self._ops:
+                return
+            ops, self._ops = self._ops, []
+            try:
+                await asyncio.to_thread(self._write, ops)
+            except Exception as e:
+                # 一批写入在同一个事务中，失败时整批回滚，可以原样重试
+                self._failures += 1
+                if self._failures > self.max_retries:
+                    logger.error(f"ltm 持久化写入连续失败 {self._failures} 次，丢弃 {len(ops)} 条写入: {e}")
+                    self._failures = 0
+                    # 会话行只在上限变化时写入，丢掉后之后的记录重启时就找不到了，保留下来继续重试
+                    self._ops[:0] = [op for op in ops if op[0] == "session"]
+                    return
+                # 放回队首，保持与之后排队的写入的先后顺序
+                self._ops[:0] = ops
+                delay = min(self.flush_interval * 2 ** (self._failures - 1), self.max_backoff)
+                self._retry_at = time.monotonic() + delay
+                logger.warning(f"ltm 持久化写入失败，{delay:.1f} 秒后重试({self._failures}/{self.max_retries}): {e}")
+            else:
+                self._failures = 0
+
+    def _write(self, ops: list[tuple]):
+        with self._db_lock, self._conn:
+            inserts = []
+            for op in ops:
+                if op[0] == "insert":
+                    _, umo, r = op
+                    inserts.append(
+                        (umo, r.sender, r.timestamp, r.text, r.tokens, _encode_images(r.images))
+                    )
+                    continue
+                # 其他操作需要与前面的插入保持先后顺序
+                if inserts:
+                    self._insert(inserts)
+                    inserts = []
+                if op[0] == "session":
+                    self._conn.execute(
+                        "INSERT INTO sessions (umo, max_len) VALUES (?, ?) "
+                        "ON CONFLICT(umo) DO UPDATE SET max_len = excluded.max_len",
+                        (op[1], op[2]),
+                    )
+                elif op[0] == "update":
+                    # 记录没有保存行号，按会话、发送者、时间和描述前的内容定位；完全相同的记录描述也相同
+                    _, umo, r, text, images = op
+                    self._conn.execute(
+                        "UPDATE messages SET text = ?, tokens = ?, images = ? "
+                        "WHERE umo = ? AND ts = ? AND sender = ? AND text = ? AND images = ?",
+                        (
+                            r.text, r.tokens, _encode_images(r.images),
+                            umo, r.timestamp, r.sender, text, _encode_images(images),
+                        ),
+                    )
+                elif op[0] == "summary":
+                    self._conn.execute(
+                        "UPDATE sessions SET summary = ?, summary_end = ?, summary_tokens = ? WHERE umo = ?",
+                        (op[2], op[3], op[4], op[1]),
+                    )
+                elif op[0] == "delete":
+                    self._conn.execute("DELETE FROM messages WHERE umo = ?", (op[1],))
+                    self._conn.execute("DELETE FROM sessions WHERE umo = ?", (op[1],))
+            if inserts:
+                self._insert(inserts)
+
+    def _insert(self, rows: list[tuple]):
+        self._conn.executemany(
+            "INSERT INTO messages (umo, sender, ts, text, tokens, images) VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        self._conn.executemany(
+            "UPDATE sessions SET appended = appended + ? WHERE umo = ?",
+            [(n, umo) for umo, n in Counter(row[0] for row in rows).items()],
+        )
+
+    def _compact(self, sessions: dict[str, int]):
+        """删除每个会话超出上限的旧记录，并截断 WAL 文件"""
+        with self._db_lock:
+            with self._conn:
+                for umo, max_len in sessions.items():
+                    self._conn.execute(
+                        "DELETE FROM messages WHERE umo = ? AND id <= ("
+                        "SELECT id FROM messages WHERE umo = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        (umo, umo, max_len),
+                    )
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    async def compact(self):
+        await self.flush()
+        dirty, self._dirty = self._dirty, set()
+        sessions = {umo: self.sessions[umo] for umo in dirty if umo in self.sessions}
+        await asyncio.to_thread(self._compact, sessions)
+        self._last_compact = time.monotonic()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if time.monotonic() < self._retry_at:
+                # 上次提交失败，等待退避时间结束
+                continue
+            await self.flush()
+            if time.monotonic() - self._last_compact >= self.compact_interval:
+                try:
+                    await self.compact()
+                except Exception as e:
+                    logger.error(f"ltm 持久化压缩失败: {e}")
+
+
+def _encode_images(images: Optional[tuple[str, ...]]) -> Optional[str]:
+    return json.dumps(images) if images else None
+
+
+def _decode_images(images: Optional[str]) -> Optional[tuple[str, ...]]:
+    return tuple(json.loads(images)) if images else None
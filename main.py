@@ -1,32 +1,106 @@
+import asyncio
+import json
+
 from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
-from astrbot.api.star import Context, Star, register
-from astrbot.api import logger
+from astrbot.api.star import Context, Star, StarTools, register
+from astrbot.api import AstrBotConfig, logger
+from .tts.audio_cache import AudioCache
+from .tts.pipeline import IncrementalSpeech
 from .tts.tts_api import TTSClient
 from astrbot.api.provider import LLMResponse, ProviderRequest
 from .process_llm_request import ProcessLLMRequest
 from .long_term_memory import LongTermMemory
+from .ltm_store import HistoryStore
+from .config_snapshot import ConfigSnapshotCache
+from .captioning import CaptionService
+from .request_pipeline import Stage
+from .instrumentation import MetricsRegistry
 
 
 @register("helloworld", "YourName", "一个简单的 Hello World 插件", "1.0.0")
 class MyPlugin(Star):
-    def __init__(self, context: Context):
+    def __init__(self, context: Context, config: AstrBotConfig | None = None):
         super().__init__(context)
         self.context = context
-        self.proc_llm_req = ProcessLLMRequest(self.context)
+        self.config = config or {}
+        tts_cfg = self.config.get("tts", {})
+        tts_cache = None
+        if tts_cfg.get("cache_enable", True):
+            try:
+                tts_cache = AudioCache(
+                    str(StarTools.get_data_dir() / "tts_cache"),
+                    max_bytes=int(tts_cfg.get("cache_max_mb", 256)) * 1024 * 1024,
+                    max_entries=int(tts_cfg.get("cache_max_entries", 2000)),
+                )
+            except BaseException as e:
+                logger.error(f"TTS 缓存初始化失败: {e}")
+        # 一个插件实例共用一个 TTS 客户端(连接池)
+        self.tts_client = TTSClient(
+            base_url=tts_cfg.get("base_url", "http://127.0.0.1:9880"),
+            timeout=tts_cfg.get("timeout", 60.0),
+            pool_size=tts_cfg.get("pool_size", 4),
+            cache=tts_cache,
+            segment_concurrency=int(tts_cfg.get("segment_concurrency", 2)),
+            segment_lookahead=int(tts_cfg.get("segment_lookahead", 4)),
+            **{k: tts_cfg[k] for k in ("ref_audio_path", "prompt_text") if tts_cfg.get(k)},
+        )
+        self.tts_incremental = tts_cfg.get("incremental", True)
+        self._tts_tasks: dict[str, asyncio.Task] = {}
+        """每个会话正在进行的语音合成/播放任务"""
+        metrics_cfg = self.config.get("metrics", {})
+        self.metrics = MetricsRegistry(
+            enabled=metrics_cfg.get("enable", False),
+            trace=metrics_cfg.get("trace", True),
+            window=int(metrics_cfg.get("window", 1024)),
+            max_sessions=int(metrics_cfg.get("max_sessions", 200)),
+        )
+        """各阶段耗时统计，关闭时几乎没有开销"""
+        self.configs = ConfigSnapshotCache(self.context)
+        """会话配置快照，插件各部分共用"""
+        caption_cfg = self.config.get("caption", {})
+        cache_path = None
+        if caption_cfg.get("cache_enable", True):
+            cache_path = str(StarTools.get_data_dir() / "captions.db")
+        try:
+            self.captions = CaptionService(
+                cache_path,
+                concurrency=int(caption_cfg.get("concurrency", 4)),
+                ttl=float(caption_cfg.get("cache_ttl_hours", 168)) * 3600,
+                max_entries=int(caption_cfg.get("cache_max_entries", 5000)),
+                max_download_bytes=int(caption_cfg.get("max_download_mb", 20)) * 1024 * 1024,
+            )
+        except Exception as e:
+            logger.error(f"图片描述缓存初始化失败，不使用持久化缓存: {e}")
+            self.captions = CaptionService()
+        """图片描述服务，群聊记忆和请求处理共用"""
+        self.proc_llm_req = ProcessLLMRequest(
+            self.context, self.configs, self.captions, self.metrics
+        )
         self.ltm = None
         try:
-            self.ltm = LongTermMemory(self.context.astrbot_config_mgr, self.context)
+            ltm_cfg = self.config.get("ltm", {})
+            store = None
+            if ltm_cfg.get("persist", False):
+                store = HistoryStore(str(StarTools.get_data_dir() / "ltm_history.db"))
+            self.ltm = LongTermMemory(
+                self.context.astrbot_config_mgr,
+                self.context,
+                ltm_cfg,
+                store=store,
+                configs=self.configs,
+                captions=self.captions,
+            )
         except BaseException as e:
             logger.error(f"聊天增强 err: {e}")
 
     def ltm_enabled(self, event: AstrMessageEvent):
-        ltmse = self.context.get_config(umo=event.unified_msg_origin)[
-            "provider_ltm_settings"
-        ]
-        return ltmse["group_icl_enable"] or ltmse["active_reply"]["enable"]
+        return self.configs.for_event(event).ltm.enabled
 
     async def initialize(self):
         """可选择实现异步的插件初始化方法，当实例化该插件类之后会自动调用该方法。"""
+        if self.ltm:
+            self.ltm.start()
+
     # 注册指令的装饰器。指令名为 helloworld。注册成功后，发送 `/helloworld` 就会触发这个指令，并回复 `你好, {user_name}!`
     @filter.command("luo")
     async def yuyin(self, event: AstrMessageEvent):
@@ -58,32 +132,133 @@ class MyPlugin(Star):
 
 
 
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("metrics")
+    async def dump_metrics(self, event: AstrMessageEvent):
+        """输出各阶段耗时统计(p50/p95/p99，毫秒)。/metrics 输出全部阶段，/metrics session 输出当前会话"""
+        if not self.metrics.enabled:
+            yield event.plain_result("耗时统计未开启，请在插件配置中开启 metrics.enable")
+            return
+        if event.message_str.strip().endswith("session"):
+            data = self.metrics.dump(event.unified_msg_origin)
+        else:
+            data = self.metrics.dump()["stages"]
+        lines = [
+            f"{stage}: n={h['count']} p50={h['p50_ms']:.1f} p95={h['p95_ms']:.1f} p99={h['p99_ms']:.1f}"
+            for stage, h in sorted(data.items())
+        ]
+        if self.tts_client.cache is not None:
+            c = self.tts_client.cache.stats
+            lines.append(
+                f"tts_cache: hits={c.hits} misses={c.misses} hit_rate={c.hit_rate:.1%} "
+                f"saved={c.bytes_saved / 1024 / 1024:.1f}MB"
+            )
+        yield event.plain_result("\n".join(lines) or "暂无数据")
+
     async def terminate(self):
         """可选择实现异步的插件销毁方法，当插件被卸载/停用时会调用。"""
+        for task in self._tts_tasks.values():
+            task.cancel()
+        await self.tts_client.close()
+        if self.ltm:
+            await self.ltm.close()
+        logger.info(f"图片描述统计: {self.captions.stats.to_dict()}")
+        if self.tts_client.cache is not None:
+            logger.info(f"TTS 缓存统计: {self.tts_client.cache.stats.to_dict()}")
+        if self.metrics.enabled:
+            logger.info(f"耗时统计: {json.dumps(self.metrics.dump()['stages'], ensure_ascii=False)}")
+        await self.captions.close()
+        self.configs.close()
+
+    @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
+    async def on_group_message(self, event: AstrMessageEvent):
+        """
+        记录群聊消息，并决定是否主动回复。
+        记录只解析和入队，图片描述和写入由写入队列在后台完成；主动回复由调度器按冷却、负载和速率上限决定。
+        """
+        if not self.ltm:
+            return
+        cfg = self.configs.for_event(event).ltm
+        if cfg.group_icl_enable:
+            try:
+                with self.metrics.span("ltm_enqueue", event):
+                    self.ltm.enqueue(event)
+            except Exception as e:
+                logger.error(f"ltm: {e}")
+        if cfg.enable_active_reply and await self.ltm.need_active_reply(event):
+            async for result in self._active_reply(event):
+                yield result
+
+    async def _active_reply(self, event: AstrMessageEvent):
+        conv = None
+        try:
+            if not self.context.get_using_provider(event.unified_msg_origin):
+                logger.error("未找到任何 LLM 提供商，无法主动回复")
+            elif not (
+                session_curr_cid := await self.context.conversation_manager.get_curr_conversation_id(
+                    event.unified_msg_origin,
+                )
+            ):
+                logger.error("当前未处于对话状态，无法主动回复")
+            else:
+                conv = await self.context.conversation_manager.get_conversation(
+                    event.unified_msg_origin,
+                    session_curr_cid,
+                )
+                if not conv:
+                    logger.error("未找到对话，无法主动回复")
+        except Exception as e:
+            logger.error(f"主动回复失败: {e}")
+        if not conv:
+            # 没有发起请求，释放调度器为这次回复预留的名额
+            self.ltm.active_reply.end(self.ltm.inflight_key(event))
+            return
+        yield event.request_llm(
+            prompt=event.message_str,
+            func_tool_manager=self.context.get_llm_tool_manager(),
+            session_id=event.session_id,
+            conversation=conv,
+        )
 
     @filter.on_llm_request()
     async def decorate_llm_req(self, event: AstrMessageEvent, req: ProviderRequest):
         """在请求 LLM 前注入人格信息、Identifier、时间、回复内容等 System Prompt"""
-        await self.proc_llm_req.process_llm_request(event, req)
-
-        if self.ltm and self.ltm_enabled(event):
-            try:
-                await self.ltm.on_req_llm(event, req)
-            except BaseException as e:
-                logger.error(f"ltm: {e}")
+        if self.tts_incremental:
+            self._tap_streaming_reply(event)
+        if self.ltm:
+            # 进行中的 LLM 请求，主动回复调度据此判断会话是否正在回复、提供商是否繁忙
+            self.ltm.active_reply.begin(
+                self.ltm.inflight_key(event), event.unified_msg_origin
+            )
+        with self.metrics.span("decorate_llm_req", event):
+            stages = []
+            if self.ltm and self.ltm_enabled(event):
+                # 聊天记录追加到人格的系统提示词之后(主动回复时会清空人格的预设对话)，所以依赖人格阶段；
+                # 与图片描述、引用消息并发执行
+                stages.append(
+                    Stage("ltm", lambda: self.ltm.on_req_llm(event, req), after=("persona",))
+                )
+            await self.proc_llm_req.process_llm_request(event, req, stages)
 
     @filter.on_llm_response()
     async def record_llm_resp_to_ltm(self, event: AstrMessageEvent, resp: LLMResponse):
         """在 LLM 响应后记录对话"""
+        if self.ltm:
+            self.ltm.active_reply.end(self.ltm.inflight_key(event))
         if self.ltm and self.ltm_enabled(event):
             try:
-                await self.ltm.after_req_llm(event, resp)
+                with self.metrics.span("after_req_llm", event):
+                    await self.ltm.after_req_llm(event, resp)
             except Exception as e:
                 logger.error(f"ltm: {e}")
 
     @filter.after_message_sent()
     async def after_message_sent(self, event: AstrMessageEvent):
         """消息发送后处理"""
+        event.trace.record("config_snapshot", **self.configs.event_stats(event))
+        if self.ltm:
+            # 请求失败时没有响应钩子，在这里兜底结束
+            self.ltm.active_reply.end(self.ltm.inflight_key(event))
         if self.ltm and self.ltm_enabled(event):
             try:
                 clean_session = event.get_extra("_clean_ltm_session", False)
@@ -95,5 +270,66 @@ class MyPlugin(Star):
     @filter.on_llm_response()
     async def handle_message(self, event: AstrMessageEvent, resp: LLMResponse):
         logger.info(resp.completion_text)
-        client = TTSClient()
-        client.synthesize_and_play_realtime(resp.completion_text)  # 调用 TTSClient 将文本转换为语音并发送
\ No newline at end of file
+        if not resp.completion_text or event.get_extra("_tts_streamed", False):
+            # 流式输出时已经边接收边播放了
+            return
+        self._start_tts(
+            event.unified_msg_origin,
+            self.tts_client.synthesize_and_play_realtime(resp.completion_text),
+        )
+
+    def _tap_streaming_reply(self, event: AstrMessageEvent):
+        """
+        LLM 以流式输出时，AstrBot 会把结果生成器交给 event.send_streaming 发送。
+        这里替换该事件的 send_streaming，在转发给平台的同时把文本增量送入 TTS，句子一结束就开始合成。
+        工具调用后同一个事件会再次请求 LLM，已经替换过的事件不再重复包装。
+        """
+        if event.get_extra("_tts_tapped", False):
+            return
+        event.set_extra("_tts_tapped", True)
+        send_streaming = event.send_streaming
+
+        async def tapped(generator, use_fallback: bool = False):
+            speech = IncrementalSpeech()
+            event.set_extra("_tts_streamed", True)
+            self._start_tts(event.unified_msg_origin, self._play_incremental(event, speech))
+
+            async def tee():
+                try:
+                    async for chain in generator:
+                        if chain.type == "break":
+                            speech.section_break()
+                        elif chain.type not in ("reasoning", "tool_call"):
+                            speech.feed(chain.get_plain_text())
+                        yield chain
+                finally:
+                    speech.close()
+
+            return await send_streaming(tee(), use_fallback)
+
+        event.send_streaming = tapped
+
+    async def _play_incremental(self, event: AstrMessageEvent, speech: IncrementalSpeech):
+        await self.tts_client.play_incremental(speech)
+        if (latency := speech.latency.token_to_speech) is not None:
+            # 首个 LLM token 到开始播放，/metrics 中的 token_to_speech 阶段
+            self.metrics.observe("token_to_speech", latency, umo=event.unified_msg_origin)
+
+    def _start_tts(self, umo: str, coro):
+        """在后台合成并播放，不阻塞事件处理。会话已经有了新的回复时，上一段还没播完的语音直接取消"""
+        if (prev := self._tts_tasks.get(umo)) and not prev.done():
+            prev.cancel()
+        if self.metrics.enabled:
+            coro = self._timed_tts(umo, coro)
+        task = asyncio.create_task(coro)
+        self._tts_tasks[umo] = task
+        task.add_done_callback(lambda t: self._forget_tts_task(umo, t))
+
+    async def _timed_tts(self, umo: str, coro):
+        # 语音在后台播放，事件的 trace 此时可能已经结束，只记入直方图
+        with self.metrics.span("tts", umo=umo):
+            return await coro
+
+    def _forget_tts_task(self, umo: str, task: asyncio.Task):
+        if self._tts_tasks.get(umo) is task:
+            del self._tts_tasks[umo]
@@ -0,0 +1,164 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from astrbot.api import logger, star
+
+from .tool_resolver import ToolSetResolver, ToolSetView
+
+"""
+人格索引
+
+persona_manager.personas_v3 按名称建立索引，每个人格预先计算好不可变的 PersonaBundle:
+系统提示词、预设对话(只读对象，注入请求时每条消息浅拷贝一份)、允许的技能和指定的工具名。
+人格列表被替换(人格管理器重新加载)或者人格的内容被原地修改时重建。
+工具由 ToolSetResolver 按工具管理器的版本解析和缓存。
+"""
+
+
+class FrozenDict(dict):
+    """
+    只读 dict。仍然是 dict 的子类，可以直接交给提供商序列化；
+    多个请求共用同一个对象，任何修改都会抛出 TypeError，避免一个请求改坏其他请求的上下文。
+    """
+
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("FrozenDict is read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    __ior__ = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+def freeze_message(value: Any) -> Any:
+    """递归转换为只读结构: dict -> FrozenDict，list -> tuple"""
+    if isinstance(value, dict):
+        return FrozenDict({k: freeze_message(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_message(v) for v in value)
+    return value
+
+
+def copy_message(msg: FrozenDict) -> dict:
+    """
+    消息的浅拷贝: 顶层是普通 dict，tuple 字段(比如多模态的 content)转换为 list，
+    嵌套的内容片段仍然是共享的只读对象，不逐层复制。
+    """
+    return {k: list(v) if isinstance(v, tuple) else v for k, v in msg.items()}
+
+
+@dataclass(frozen=True, slots=True)
+class PersonaBundle:
+    name: str
+    system_prompt: str
+    begin_dialogs: tuple
+    """预设对话，元素是 FrozenDict"""
+    skills: Optional[frozenset]
+    """允许使用的技能，None 表示不限制，空集合表示不使用技能"""
+    tool_names: Optional[tuple]
+    """人格指定的工具名，None 表示使用全局工具"""
+
+    def contexts(self) -> list[dict]:
+        """
+        注入请求的预设对话。每条消息是新的普通 dict，其他插件可以增删改字段、
+        往多模态内容的 list 里追加片段；已有的片段是共享的 FrozenDict，原地修改会抛出 TypeError。
+        """
+        return [copy_message(msg) for msg in self.begin_dialogs]
+
+
+class PersonaRegistry:
+    def __init__(
+        self,
+        context: star.Context,
+        tools: Optional[ToolSetResolver] = None,
+        check_interval: float = 1.0,
+    ):
+        """
+        Args:
+            check_interval: 检查人格内容是否被原地修改的最短间隔(秒)，0 表示每次查询都检查；
+                人格列表被替换总是立即生效
+        """
+        self.ctx = context
+        self.tools = tools or ToolSetResolver(context)
+        self.check_interval = check_interval
+        self.version = 0
+        """每次重建递增"""
+        self._bundles: dict[str, PersonaBundle] = {}
+        self._personas_src: Optional[list] = None
+        self._fingerprint: Optional[tuple] = None
+        self._checked_at = float("-inf")
+
+    def invalidate(self):
+        self._personas_src = None
+        self._fingerprint = None
+
+    def get(self, name: Optional[str]) -> Optional[PersonaBundle]:
+        self._check()
+        return self._bundles.get(name) if name else None
+
+    def toolset_for(self, bundle: Optional[PersonaBundle]) -> ToolSetView:
+        """
+        人格可用的工具集，是缓存的写时复制视图，请求可以随意修改。
+        有人格但是没指定工具或者没有人格时，使用全局工具。
+        """
+        return self.tools.resolve(bundle.tool_names if bundle is not None else None)
+
+    def _check(self):
+        personas = self.ctx.persona_manager.personas_v3
+        now = time.monotonic()
+        if personas is self._personas_src and now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        # 人格管理器可能原地修改列表或其中的人格，所以同时比较列表身份和每个人格用到的字段
+        fingerprint = (id(personas), tuple(_fingerprint(p) for p in personas))
+        self._personas_src = personas
+        if fingerprint == self._fingerprint:
+            return
+        self._fingerprint = fingerprint
+        self._rebuild(personas)
+
+    def _rebuild(self, personas: list):
+        bundles = {}
+        for persona in personas:
+            name = persona["name"]
+            if name in bundles:
+                # 与逐个查找时一样，同名人格取第一个
+                continue
+            tools = persona.get("tools")
+            skills = persona.get("skills")
+            bundles[name] = PersonaBundle(
+                name=name,
+                system_prompt=persona.get("prompt") or "",
+                begin_dialogs=freeze_message(persona.get("_begin_dialogs_processed") or []),
+                skills=frozenset(skills) if skills is not None else None,
+                tool_names=tuple(tools) if tools is not None else None,
+            )
+        self._bundles = bundles
+        self.version += 1
+        logger.debug(f"人格索引已重建(v{self.version}): {len(bundles)} 个人格")
+
+
+def _fingerprint(persona: dict) -> tuple:
+    dialogs = persona.get("_begin_dialogs_processed")
+    tools = persona.get("tools")
+    skills = persona.get("skills")
+    return (
+        id(persona),
+        persona.get("name"),
+        persona.get("prompt"),
+        id(dialogs),
+        len(dialogs) if dialogs is not None else -1,
+        tuple(tools) if tools is not None else None,
+        tuple(skills) if skills is not None else None,
+    )
@@ -1,5 +1,3 @@
-import builtins
-import copy
 import datetime
 import zoneinfo
 
@@ -14,19 +12,39 @@ from astrbot.core.pipeline.process_stage.utils import (
     LOCAL_PYTHON_TOOL,
 )
 from astrbot.core.provider.func_tool_manager import ToolSet
-from astrbot.core.skills.skill_manager import SkillManager, build_skills_prompt
+from astrbot.core.skills.skill_manager import SkillManager
+
+from .captioning import CaptionService
+from .config_snapshot import ConfigSnapshotCache
+from .instrumentation import MetricsRegistry
+from .persona_registry import PersonaRegistry
+from .request_pipeline import Stage, run_stages
+from .session_config import SessionServiceConfigCache
+from .skills_cache import SkillsPromptCache
 
 
 class ProcessLLMRequest:
 
-    def __init__(self, context: star.Context):
+    def __init__(
+        self,
+        context: star.Context,
+        configs: ConfigSnapshotCache | None = None,
+        captions: CaptionService | None = None,
+        metrics: MetricsRegistry | None = None,
+    ):
         self.ctx = context
+        self.metrics = metrics or MetricsRegistry()
+        self.configs = configs or ConfigSnapshotCache(context)
+        self.captions = captions or CaptionService()
+        self.personas = PersonaRegistry(context)
+        self.session_configs = SessionServiceConfigCache(sp)
         cfg = context.get_config()
         self.timezone = cfg.get("timezone", None)
         if not self.timezone:
             self.timezone = None
 
         self.skill_manager = SkillManager()
+        self.skills_prompts = SkillsPromptCache(self.skill_manager)
 
     def _apply_local_env_tools(self, req: ProviderRequest):
         """Add local environment tools to the provider request."""
@@ -58,11 +76,8 @@ class ProcessLLMRequest:
         if not req.conversation:
             return
         # persona inject
-        persona_id = (
-            await sp.get_async(
-                scope="umo", scope_id=umo, key="session_service_config", default={}
-            )
-        ).get("persona_id", None)
+        # 读穿透缓存，同一会话的并发请求只读取一次存储
+        persona_id = (await self.session_configs.get(umo)).get("persona_id", None)
 
         if not persona_id:
             persona_id = req.conversation.persona_id or cfg.get("default_persona_id")
@@ -73,21 +88,19 @@ class ProcessLLMRequest:
                     logger.info(
                         f"Using globally selected default persona {persona_id} for conversation {umo}"
                     )
-        persona = next(
-            builtins.filter(
-                lambda persona: persona['name'] == persona_id, self.ctx.persona_manager.personas_v3
-            ),
-            None
-        )
+        persona = self.personas.get(persona_id)
 
         if persona:
-            if prompt := persona["prompt"]:
+            if prompt := persona.system_prompt:
                 req.system_prompt = prompt
-            if begin_dialogs := copy.deepcopy(persona["_begin_dialogs_processed"]):
-                req.contexts[:0] = begin_dialogs
+            if persona.begin_dialogs:
+                # 共享的预设对话是只读的，注入的是每个请求各自的副本
+                req.contexts[:0] = persona.contexts()
 
         runtime = self.skills_cfg.get("runtime", "local")
-        skills = self.skill_manager.list_skills(active_only=True, runtime=runtime)
+        # 技能列表和提示词都有缓存，命中时不读取技能目录
+        skills = self.skills_prompts.skills(runtime)
+        local_env_tools = False
         
         if runtime == "sandbox" and not self.sandbox_cfg.get("enabled", False):
             logger.warning(
@@ -95,64 +108,58 @@ class ProcessLLMRequest:
             )
             req.system_prompt += "\n[Background: User added some skills, and skills runtime is set to sandbox, but sandbox mode is disabled. So skills will be unavailable.]\n"
         elif skills:
-            if persona and persona.get("skills") is not None:
-                if not persona["skills"]:
+            if persona and persona.skills is not None:
+                if not persona.skills:
                     return  # 用户明确设置了 persona.skills 为空列表，表示不使用技能
-                allowed = set(persona["skills"])
-                skills = [skill for skill in skills if skill.name in allowed]
-            if skills:
-                req.system_prompt += build_skills_prompt(skills)
+            skills_prompt = self.skills_prompts.prompt(
+                runtime, persona.skills if persona else None
+            )
+            if skills_prompt:
+                req.system_prompt += skills_prompt
                 # 是否开启了沙盒模式, 沙盒环境貌似还没有
                 sandbox_enabled = self.sandbox_cfg.get("enable", False)
-                if runtime == "local" and not sandbox_enabled:
-                    self._apply_local_env_tools(req)
-        tmgr = self.ctx.get_llm_tool_manager()
-        if (persona and persona.get("tools") is None) or not persona:
-            # 有人格但是没工具或者没有人格，才注入全局工具，否则使用人格指定的工具
-            toolset = tmgr.get_full_tool_set()
-            for tool in toolset:
-                if not tool.active:
-                    toolset.remove_tool(tool.name)
-
-        else:
-            toolset = ToolSet()
-            if persona["tools"]:
-                for tool_name in persona["tools"]:
-                    tool = tmgr.get_func(tool_name)
-                    if tool and tool.active:
-                        toolset.add_tool(tool)
+                local_env_tools = runtime == "local" and not sandbox_enabled
+        # 有人格但是没工具或者没有人格，才注入全局工具，否则使用人格指定的工具
+        # toolset 是缓存的写时复制视图，之后加入本地工具时才会复制
+        toolset = self.personas.toolset_for(persona)
+        toolset_names = toolset.names()
         if not req.func_tool:
             req.func_tool = toolset
         else:
             req.func_tool.get_full_tool_set().merge(toolset)
+        if local_env_tools:
+            self._apply_local_env_tools(req)
         # 记录工具。暂时不知道有没有其他作用
         event.trace.record(
-            "sel_persona", persona_id=persona_id, persona_toolset=toolset.names()
+            "sel_persona", persona_id=persona_id, persona_toolset=toolset_names
         )
-        logger.debug(f"Tool set for persona {persona_id}: {toolset.names()}")
+        logger.debug(f"Tool set for persona {persona_id}: {toolset_names}")
 
-        """获取使用img_cap_prov_id指定的图片描述服务，并将其注入到请求中"""
-    async def _ensure_img_caption(
+        """获取使用img_cap_prov_id指定的图片描述服务，返回要加入请求的图片描述"""
+    async def _img_caption_part(
         self,
-        req: ProviderRequest,
+        image_urls: list[str],
         cfg: dict,
         img_cap_prov_id: str,
-    ):
+    ) -> TextPart | None:
         try:
             # 这里返回的是服务处理后对于图片的描述文本
             caption = await self._request_img_caption(
                 img_cap_prov_id,
                 cfg,
-                req.image_urls,
+                image_urls,
             )
             if caption:
-                # 处理后的文本加入额外的用户消息内容部分列表，用于在用户消息后添加额外的内容块
-                req.extra_user_content_parts.append(
-                    TextPart(text=f"<image_caption>{caption}</image_caption>")
-                )
-                req.image_urls = []
+                return TextPart(text=f"<image_caption>{caption}</image_caption>")
         except Exception as e:
             logger.error(f"处理图片描述失败: {e}")
+        return None
+
+    def _apply_img_caption(self, req: ProviderRequest, part: TextPart | None):
+        if part is not None:
+            # 处理后的文本加入额外的用户消息内容部分列表，用于在用户消息后添加额外的内容块
+            req.extra_user_content_parts.append(part)
+            req.image_urls = []
 
     """
     传入的是图片链接（以qq为例，应该是qq存起来后返回一个链接），
@@ -171,11 +178,7 @@ class ProcessLLMRequest:
                     "Please describe the image.",
                 )
                 logger.debug(f"Processing image caption with provider: {provider_id}")
-                llm_resp = await prov.text_chat(
-                    prompt=img_cap_prompt,
-                    image_urls=image_urls,
-                )
-                return llm_resp.completion_text
+                return await self.captions.caption(prov, image_urls, img_cap_prompt)
             raise ValueError(
                 f"Cannot get image caption because provider `{provider_id}` is not a valid Provider, it is {type(prov)}.",
             )
@@ -183,13 +186,20 @@ class ProcessLLMRequest:
             f"Cannot get image caption because provider `{provider_id}` is not exist.",
         )
     
-    async def process_llm_request(self, event: AstrMessageEvent, req: ProviderRequest):
+    async def process_llm_request(
+        self,
+        event: AstrMessageEvent,
+        req: ProviderRequest,
+        extra_stages: list[Stage] = (),
+    ):
         """在请求 LLM 前注入人格信息、Identifier、时间、回复内容等 System Prompt
         umo: unified_message_origin 值，用于获取特定会话的配置。
+
+        Args:
+            extra_stages: 调用方追加的阶段，与内置阶段一起并发执行，在内置阶段之后合并
         """
-        cfg: dict = self.ctx.get_config(umo=event.unified_msg_origin)[
-            "provider_settings"
-        ]
+        # 只读快照，同一个事件的其他处理函数共用
+        cfg = self.configs.for_event(event).provider_settings
         self.skills_cfg = cfg.get("skills", {})
         self.sandbox_cfg = self.skills_cfg.get("sandbox", {})
 
@@ -215,6 +225,9 @@ class ProcessLLMRequest:
                 logger.error(
                     f"Group name display enabled but group object is None. Group ID: {event.message_obj.group_id}"
                 )
+                # 跳过内置阶段，调用方的阶段照常执行
+                if extra_stages:
+                    await run_stages(list(extra_stages))
                 return
             group_name = event.message_obj.group.group_name
             if group_name:
@@ -237,21 +250,34 @@ class ProcessLLMRequest:
 
         # 从配置中获取图片处理服务id
         img_cap_prov_id: str = cfg.get("default_image_caption_provider_id")
+        # 各阶段互不依赖的部分并发执行，结果在合并步骤中按下面的声明顺序写入请求:
+        # 人格 -> 图片描述 -> 引用消息 -> 调用方追加的阶段，最后是系统提醒
+        stages = []
         if req.conversation:
-            # 给这个对话加入人格
+            # 给这个对话加入人格。人格直接修改 system_prompt、contexts 和 func_tool，
+            # 其他要修改这些字段的阶段需要声明 after=("persona",)
             platform_type = event.get_platform_name()
-            await self._ensure_persona(
-                req, cfg, event.unified_msg_origin, platform_type, event
+            stages.append(
+                Stage(
+                    "persona",
+                    lambda: self._ensure_persona(
+                        req, cfg, event.unified_msg_origin, platform_type, event
+                    ),
+                )
             )
-
-                        # image caption
+            # image caption
             if img_cap_prov_id and req.image_urls:
-                await self._ensure_img_caption(req, cfg, img_cap_prov_id)
-            
+                image_urls = list(req.image_urls)
+                stages.append(
+                    Stage(
+                        "img_caption",
+                        lambda: self._img_caption_part(image_urls, cfg, img_cap_prov_id),
+                        apply=lambda part: self._apply_img_caption(req, part),
+                    )
+                )
 
-            # 用户可能会@, 引用信息，因此需要处理
-        quote= None
-            
+        # 用户可能会@, 引用信息，因此需要处理
+        quote = None
         for comp in event.message_obj.message:
             # 判断是引用消息(todo: 了解一下用什么方式判断是文本消息还是图片消息，或者二者皆有)
             # 这块应该和消息链解析有关
@@ -259,56 +285,33 @@ class ProcessLLMRequest:
                 quote = comp
                 break
         if quote:
-            content_parts = []
-            # 处理引用文本 图片 
-            sender_info = (
-                f"({quote.sender_nickname}): " if quote.sender_nickname else ""
+            stages.append(
+                Stage(
+                    "quote",
+                    lambda: self._quote_part(event, quote, img_cap_prov_id),
+                    apply=req.extra_user_content_parts.append,
+                )
             )
-            message_str = quote.message_str or "[Empty Text]"
-            content_parts.append(f"{sender_info}{message_str}")
-
-            image_seg = None
-            if quote.chain:
-                for comp in quote.chain:
-                    if isinstance(comp, Image):
-                        image_seg = comp
-                        break
-
-            if image_seg:
-                try:
-                    # 找到可以生成图片描述的 provider
-                    prov = None
-                    if img_cap_prov_id:
-                        prov = self.ctx.get_provider_by_id(img_cap_prov_id)
-                    if prov is None:
-                        # 如果没有配置专门的图片描述服务，就使用当前对话使用的聊天模型来生成图片描述
-                        prov = self.ctx.get_using_provider(event.unified_msg_origin)
+        stages.extend(extra_stages)
 
-                    # 调用 provider 生成图片描述
-                    if prov and isinstance(prov, Provider):
-                        llm_resp = await prov.text_chat(
-                            prompt="Please describe the image content.",
-                            image_urls=[await image_seg.convert_to_file_path()],
-                        )
-                        if llm_resp.completion_text:
-                            # 将图片描述作为文本添加到 content_parts
-                            content_parts.append(
-                                f"[Image Caption in quoted message]: {llm_resp.completion_text}"
-                            )
-                    else:
-                        logger.warning(
-                            "No provider found for image captioning in quote."
-                        )
-                except BaseException as e:
-                    logger.error(f"处理引用图片失败: {e}")
-
-            # 3. 将所有部分组合成文本并添加到 extra_user_content_parts 中
-            # 确保引用内容被正确的标签包裹
-            quoted_content = "\n".join(content_parts)
-            # 确保所有内容都在<Quoted Message>标签内
-            quoted_text = f"<Quoted Message>\n{quoted_content}\n</Quoted Message>"
-
-            req.extra_user_content_parts.append(TextPart(text=quoted_text))
+        if stages:
+            result = await run_stages(stages)
+            timings = result.timings_ms()
+            event.trace.record(
+                "llm_req_stages",
+                total_ms=round(result.elapsed * 1000, 3),
+                slowest=result.slowest,
+                **timings,
+            )
+            logger.debug(
+                f"LLM 请求装饰耗时 {result.elapsed * 1000:.1f}ms，最慢的阶段: {result.slowest}，"
+                f"各阶段: {timings}"
+            )
+            if self.metrics.enabled:
+                # 各阶段已经作为 llm_req_stages 导出到 trace，这里只记入直方图
+                umo = event.unified_msg_origin
+                for name, r in result.stages.items():
+                    self.metrics.observe(f"stage.{name}", r.elapsed, umo)
 
         # 统一包裹所有系统提醒
         if system_parts:
@@ -316,3 +319,56 @@ class ProcessLLMRequest:
                 "<system_reminder>" + "\n".join(system_parts) + "</system_reminder>"
             )
             req.extra_user_content_parts.append(TextPart(text=system_content))
+
+    async def _quote_part(
+        self, event: AstrMessageEvent, quote: Reply, img_cap_prov_id: str
+    ) -> TextPart:
+        """引用消息的文本和图片描述，包裹在 <Quoted Message> 标签内"""
+        content_parts = []
+        # 处理引用文本 图片
+        sender_info = (
+            f"({quote.sender_nickname}): " if quote.sender_nickname else ""
+        )
+        message_str = quote.message_str or "[Empty Text]"
+        content_parts.append(f"{sender_info}{message_str}")
+
+        image_seg = None
+        if quote.chain:
+            for comp in quote.chain:
+                if isinstance(comp, Image):
+                    image_seg = comp
+                    break
+
+        if image_seg:
+            try:
+                # 找到可以生成图片描述的 provider
+                prov = None
+                if img_cap_prov_id:
+                    prov = self.ctx.get_provider_by_id(img_cap_prov_id)
+                if prov is None:
+                    # 如果没有配置专门的图片描述服务，就使用当前对话使用的聊天模型来生成图片描述
+                    prov = self.ctx.get_using_provider(event.unified_msg_origin)
+
+                # 调用 provider 生成图片描述
+                if prov and isinstance(prov, Provider):
+                    caption = await self.captions.caption(
+                        prov,
+                        [await image_seg.convert_to_file_path()],
+                        "Please describe the image content.",
+                    )
+                    if caption:
+                        # 将图片描述作为文本添加到 content_parts
+                        content_parts.append(
+                            f"[Image Caption in quoted message]: {caption}"
+                        )
+                else:
+                    logger.warning(
+                        "No provider found for image captioning in quote."
+                    )
+            except Exception as e:
+                logger.error(f"处理引用图片失败: {e}")
+
+        # 将所有部分组合成文本，确保所有内容都在<Quoted Message>标签内
+        quoted_content = "\n".join(content_parts)
+        quoted_text = f"<Quoted Message>\n{quoted_content}\n</Quoted Message>"
+        return TextPart(text=quoted_text)
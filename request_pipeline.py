@@ -0,0 +1,110 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from astrbot.api import logger
+
+"""
+分阶段的请求装饰流水线
+
+每个阶段声明依赖的阶段(after)，没有依赖关系的阶段用 asyncio.gather 并发执行。
+阶段的返回值由 apply 在合并步骤中按阶段的声明顺序依次写入请求，
+所以无论各阶段完成的先后，system_prompt、extra_user_content_parts 的拼接顺序都是固定的。
+"""
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], Awaitable[Any]]
+    after: tuple[str, ...] = ()
+    """依赖的阶段，这些阶段完成(无论成功与否)后才开始执行"""
+    apply: Optional[Callable[[Any], None]] = None
+    """合并步骤中以 run 的返回值调用；run 失败时不调用"""
+
+
+@dataclass
+class StageResult:
+    name: str
+    value: Any = None
+    error: Optional[BaseException] = None
+    elapsed: float = 0.0
+    """run 本身的耗时(秒)，不含等待依赖的时间"""
+    waited: float = 0.0
+    """等待依赖的时间(秒)"""
+
+
+@dataclass
+class PipelineResult:
+    stages: dict[str, StageResult] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def timings_ms(self) -> dict[str, float]:
+        return {name: round(r.elapsed * 1000, 3) for name, r in self.stages.items()}
+
+    @property
+    def slowest(self) -> Optional[str]:
+        if not self.stages:
+            return None
+        return max(self.stages.values(), key=lambda r: r.elapsed).name
+
+
+async def run_stages(stages: list[Stage]) -> PipelineResult:
+    """
+    执行所有阶段并按声明顺序合并结果。
+
+    依赖了未声明的阶段视为没有该依赖；单个阶段失败只记录日志，不影响其他阶段。
+    """
+    names = {stage.name for stage in stages}
+    if len(names) != len(stages):
+        raise ValueError("阶段名称重复")
+    result = PipelineResult()
+    tasks: dict[str, asyncio.Future] = {}
+    start = time.perf_counter()
+
+    async def execute(stage: Stage) -> StageResult:
+        t0 = time.perf_counter()
+        deps = [tasks[name] for name in stage.after if name in tasks]
+        if deps:
+            await asyncio.wait(deps)
+        t1 = time.perf_counter()
+        r = StageResult(stage.name, waited=t1 - t0)
+        try:
+            r.value = await stage.run()
+        except Exception as e:
+            r.error = e
+            logger.error(f"{stage.name}: {e}")
+        r.elapsed = time.perf_counter() - t1
+        return r
+
+    # 按拓扑顺序创建任务，保证依赖的任务已经存在
+    pending = list(stages)
+    while pending:
+        ready = [s for s in pending if all(n in tasks or n not in names for n in s.after)]
+        if not ready:
+            raise ValueError(f"阶段之间存在循环依赖: {[s.name for s in pending]}")
+        for stage in ready:
+            tasks[stage.name] = asyncio.ensure_future(execute(stage))
+            pending.remove(stage)
+
+    try:
+        done = await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    for r in done:
+        result.stages[r.name] = r
+    result.elapsed = time.perf_counter() - start
+
+    # 合并: 严格按声明顺序
+    for stage in stages:
+        r = result.stages[stage.name]
+        if stage.apply is not None and r.error is None:
+            try:
+                stage.apply(r.value)
+            except Exception as e:
+                r.error = e
+                logger.error(f"{stage.name}: {e}")
+    return result
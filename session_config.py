@@ -0,0 +1,137 @@
+import asyncio
+import time
+import weakref
+from typing import Any, Mapping, Optional
+
+from astrbot.api import logger
+
+from .config_snapshot import freeze
+
+"""
+会话服务配置缓存
+
+每次 LLM 请求都要从 sp 读取会话的 session_service_config(只为了拿到 persona_id)，这是热路径上的一次存储往返。
+这里做一层读穿透缓存:
+- 按 TTL 过期，也可以显式 invalidate()
+- 同一个会话的并发读取合并为一次
+- 包装 sp 的 put_async/remove_async，写入该键时立即让对应会话的缓存失效
+"""
+
+KEY = "session_service_config"
+
+
+class SessionServiceConfigCache:
+    def __init__(self, sp, ttl: float = 10.0, watch: bool = True):
+        """
+        Args:
+            sp: 共享偏好存储(astrbot.api.sp)
+            ttl: 缓存有效期(秒)
+            watch: 是否包装 sp 的写入方法，写入时立即失效
+        """
+        self.sp = sp
+        self.ttl = ttl
+        self.hits = 0
+        self.fetches = 0
+        self.coalesced = 0
+        self._entries: dict[str, tuple[Mapping[str, Any], float]] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._stale: set[str] = set()
+        """读取期间被写入的会话，这次读到的旧值不写进缓存"""
+        if watch:
+            self._watch()
+
+    def invalidate(self, umo: Optional[str] = None):
+        """丢弃缓存，umo 为 None 时丢弃全部"""
+        if umo is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(umo, None)
+
+    async def get(self, umo: str) -> Mapping[str, Any]:
+        """会话的 session_service_config(只读)"""
+        while True:
+            entry = self._entries.get(umo)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl:
+                self.hits += 1
+                return entry[0]
+            if (fut := self._inflight.get(umo)) is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(fut)
+            except asyncio.CancelledError:
+                # 发起读取的一方被取消不代表自己被取消，重新检查后自己读取
+                if not fut.cancelled():
+                    raise
+                self.coalesced -= 1
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[umo] = fut
+        try:
+            self.fetches += 1
+            started = time.monotonic()
+            value = await self.sp.get_async(
+                scope="umo", scope_id=umo, key=KEY, default={}
+            )
+            value = freeze(value or {})
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except Exception as e:
+            fut.set_exception(e)
+            fut.exception()
+            raise
+        finally:
+            self._inflight.pop(umo, None)
+            # 读取失败或被取消时也要清除，否则下一次成功的读取不会写进缓存
+            stale = umo in self._stale
+            self._stale.discard(umo)
+        if not stale:
+            self._entries[umo] = (value, started)
+        fut.set_result(value)
+        return value
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "fetches": self.fetches, "coalesced": self.coalesced}
+
+    def _on_write(self, args: tuple, kwargs: dict):
+        key = kwargs.get("key", args[2] if len(args) > 2 else None)
+        if key is not None and key != KEY:
+            return
+        umo = kwargs.get("scope_id", args[1] if len(args) > 1 else None)
+        if umo is None:
+            self.invalidate()
+            return
+        self._entries.pop(umo, None)
+        if umo in self._inflight:
+            self._stale.add(umo)
+
+    def _watch(self):
+        """
+        包装 sp 的写入方法。sp 是全局对象，只包装一次，之后创建的缓存(比如插件重载后)注册到同一个包装上。
+        """
+        for name in ("put_async", "remove_async"):
+            method = getattr(self.sp, name, None)
+            if method is None:
+                continue
+            listeners = getattr(method, "_listeners", None)
+            if listeners is None:
+                listeners = weakref.WeakSet()
+
+                def make(method, listeners):
+                    async def wrapped(*args, **kwargs):
+                        try:
+                            return await method(*args, **kwargs)
+                        finally:
+                            for cache in list(listeners):
+                                cache._on_write(args, kwargs)
+
+                    wrapped._listeners = listeners
+                    return wrapped
+
+                try:
+                    setattr(self.sp, name, make(method, listeners))
+                except (AttributeError, TypeError) as e:
+                    logger.debug(f"无法监听 sp.{name}，会话配置只按 TTL 过期: {e}")
+                    continue
+            listeners.add(self)
@@ -0,0 +1,130 @@
+import os
+import time
+from typing import Callable, Optional
+
+from astrbot.api import logger
+from astrbot.core.skills.skill_manager import SkillManager, build_skills_prompt
+
+"""
+技能提示词缓存
+
+list_skills 会扫描技能目录、读取每个技能的说明文件，build_skills_prompt 每次生成同样的大段文本。
+这里按 (runtime, 允许的技能集合) 缓存技能列表和提示词，技能目录的指纹变化时整体失效。
+指纹是技能目录、每个技能说明文件和技能配置文件的 mtime，最多每 check_interval 秒检查一次，
+缓存命中时不做任何 I/O。技能管理器没有提供目录或配置文件路径时无法检测变化，退化为每 fallback_ttl 秒失效。
+"""
+
+SKILL_FILE = "SKILL.md"
+
+
+class SkillsPromptCache:
+    def __init__(
+        self,
+        skill_manager: SkillManager,
+        check_interval: float = 5.0,
+        build_prompt: Callable[[list], str] = build_skills_prompt,
+        fallback_ttl: float = 60.0,
+    ):
+        """
+        Args:
+            check_interval: 检查技能目录是否变化的最短间隔(秒)，0 表示每次都检查
+            build_prompt: 由技能列表生成提示词的函数
+            fallback_ttl: 无法检测技能目录变化时缓存的有效期(秒)
+        """
+        self.manager = skill_manager
+        self.check_interval = check_interval
+        self.build_prompt = build_prompt
+        self.fallback_ttl = fallback_ttl
+        self._warned = False
+        self.version = 0
+        self._fingerprint: Optional[tuple] = None
+        self._checked_at = float("-inf")
+        self._skills: dict[str, tuple] = {}
+        self._prompts: dict[tuple, str] = {}
+
+    def invalidate(self):
+        self._fingerprint = None
+        self._checked_at = float("-inf")
+
+    def skills(self, runtime: str) -> tuple:
+        """已启用的技能"""
+        self._check()
+        skills = self._skills.get(runtime)
+        if skills is None:
+            skills = self._skills[runtime] = tuple(
+                self.manager.list_skills(active_only=True, runtime=runtime)
+            )
+        return skills
+
+    def prompt(self, runtime: str, allowed: Optional[frozenset] = None) -> str:
+        """
+        技能提示词，没有可用技能时返回空字符串。
+
+        Args:
+            allowed: 人格允许使用的技能，None 表示不限制
+        """
+        key = (runtime, allowed)
+        prompt = self._prompts.get(key)
+        if prompt is not None and not self._check():
+            return prompt
+        skills = self.skills(runtime)
+        if allowed is not None:
+            skills = [skill for skill in skills if skill.name in allowed]
+        prompt = self._prompts[key] = self.build_prompt(list(skills)) if skills else ""
+        return prompt
+
+    def _check(self) -> bool:
+        """检查技能目录是否变化，变化时清空缓存并返回 True"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        fingerprint = self._compute_fingerprint()
+        if fingerprint == self._fingerprint:
+            return False
+        if self._fingerprint is not None:
+            logger.debug("技能目录有变化，重新生成技能提示词")
+        self._fingerprint = fingerprint
+        self._skills.clear()
+        self._prompts.clear()
+        self.version += 1
+        return True
+
+    def _compute_fingerprint(self) -> tuple:
+        root = getattr(self.manager, "skills_root", None)
+        config_path = getattr(self.manager, "config_path", None)
+        ttl_bucket = None
+        if not root or not config_path:
+            if not self._warned:
+                self._warned = True
+                logger.warning(
+                    f"技能管理器没有 skills_root 或 config_path，无法检测技能变化，"
+                    f"技能提示词缓存每 {self.fallback_ttl:g} 秒失效"
+                )
+            ttl_bucket = int(time.monotonic() // self.fallback_ttl) if self.fallback_ttl > 0 else None
+        entries = []
+        if root:
+            try:
+                with os.scandir(root) as it:
+                    for entry in it:
+                        if entry.is_dir():
+                            # 修改说明文件不会改变目录的 mtime，需要逐个检查
+                            entries.append(
+                                (entry.name, _mtime(os.path.join(entry.path, SKILL_FILE)) or 0)
+                            )
+            except OSError:
+                pass
+        entries.sort()
+        return (
+            ttl_bucket,
+            _mtime(root) if root else None,
+            _mtime(config_path) if config_path else None,
+            tuple(entries),
+        )
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
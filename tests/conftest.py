@@ -0,0 +1,17 @@
+import pytest
+
+from benchmarks._harness import import_plugin
+
+"""
+插件模块之间使用相对导入，测试与基准测试一样把仓库根目录注册为包后再导入，例如:
+
+    def test_x(plugin):
+        chat_history = plugin("chat_history")
+
+在仓库根目录运行: python -m pytest tests
+"""
+
+
+@pytest.fixture
+def plugin():
+    return import_plugin
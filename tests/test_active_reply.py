@@ -0,0 +1,35 @@
+import random
+
+import pytest
+
+
+@pytest.fixture
+def active_reply(plugin):
+    return plugin("active_reply")
+
+
+def test_defaults_do_not_throttle(active_reply):
+    """未配置限流时只按概率决定，与原来的主动回复一致"""
+    now = [0.0]
+    scheduler = active_reply.ActiveReplyScheduler.from_config({})
+    scheduler.clock = lambda: now[0]
+    scheduler.rng = random.Random(0)
+    for i in range(1000):
+        now[0] += 0.001
+        # 不传 key，不计入进行中的请求
+        assert scheduler.decide("group:1", "hello", 1.0) == active_reply.REPLY
+    for i in range(50):
+        scheduler.begin(i, f"group:{i + 100}")
+    assert scheduler.decide("group:1", "hello", 1.0) == active_reply.REPLY
+
+
+def test_configured_limits_apply(active_reply):
+    now = [0.0]
+    scheduler = active_reply.ActiveReplyScheduler.from_config(
+        {"ar_cooldown_seconds": 30, "ar_max_inflight": 1}
+    )
+    scheduler.clock = lambda: now[0]
+    assert scheduler.decide("group:1", "hello", 1.0) == active_reply.REPLY
+    assert scheduler.decide("group:1", "hello", 1.0) == "cooldown"
+    scheduler.begin("req", "group:2")
+    assert scheduler.decide("group:3", "hello", 1.0) == "busy"
@@ -0,0 +1,53 @@
+import asyncio
+import os
+
+import pytest
+
+
+@pytest.fixture
+def audio_cache(plugin):
+    return plugin("tts.audio_cache")
+
+
+def test_key_ignores_streaming_mode(audio_cache):
+    payload = {"text": "你好", "ref_audio_path": "a.wav", "temperature": 1.0}
+    key = audio_cache.AudioCache.key_for(payload)
+    assert audio_cache.AudioCache.key_for({**payload, "streaming_mode": True}) == key
+    assert audio_cache.AudioCache.key_for({**payload, "streaming_mode": False}) == key
+    assert audio_cache.AudioCache.key_for({**payload, "text": "再见"}) != key
+
+
+def test_put_get_and_stats(audio_cache, tmp_path):
+    cache = audio_cache.AudioCache(str(tmp_path))
+
+    async def run():
+        assert cache.get("k") is None
+        await cache.put("k", b"RIFF" + b"\0" * 60)
+
+    asyncio.run(run())
+    assert os.listdir(tmp_path) == ["k.wav"]
+    assert bytes(cache.get("k")[:4]) == b"RIFF"
+    assert cache.stats.to_dict() == {
+        "hits": 1, "misses": 1, "hit_rate": 0.5, "bytes_saved": 64
+    }
+
+
+def test_concurrent_puts_same_key(audio_cache, tmp_path):
+    cache = audio_cache.AudioCache(str(tmp_path))
+    data = b"x" * 100_000
+
+    async def run():
+        await asyncio.gather(*(cache.put("k", data) for _ in range(8)))
+
+    asyncio.run(run())
+    assert os.listdir(tmp_path) == ["k.wav"]
+    assert len(cache) == 1 and cache.total_bytes == len(data)
+    assert bytes(cache.get("k")) == data
+
+
+def test_load_index_drops_leftovers(audio_cache, tmp_path):
+    for name in ("a.wav", "b.pcm", "tmpabc.tmp"):
+        (tmp_path / name).write_bytes(b"data")
+    cache = audio_cache.AudioCache(str(tmp_path))
+    assert "a" in cache and "b" not in cache
+    assert os.listdir(tmp_path) == ["a.wav"]
@@ -0,0 +1,84 @@
+import asyncio
+import base64
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import web
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4
+
+
+@pytest.fixture
+def captioning(plugin):
+    return plugin("captioning")
+
+
+class RecordingProvider:
+    def __init__(self):
+        self.image_urls = []
+
+    def get_model(self) -> str:
+        return "fake-vision"
+
+    async def text_chat(self, prompt: str = "", image_urls=None, **kwargs):
+        self.image_urls.append(list(image_urls))
+        return SimpleNamespace(completion_text=f"描述 {len(self.image_urls)}")
+
+
+def test_first_seen_url_downloaded_once(captioning):
+    downloads = []
+
+    async def image(request):
+        downloads.append(request.path)
+        return web.Response(body=PNG, content_type="image/png")
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/{name}.png", image)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        service = captioning.CaptionService()
+        provider = RecordingProvider()
+        try:
+            first = await service.caption(provider, [f"{base}/a.png"], "描述")
+            # 内容相同的另一个 URL 命中缓存，已知的 URL 不再下载
+            assert await service.caption(provider, [f"{base}/b.png"], "描述") == first
+            assert await service.caption(provider, [f"{base}/a.png"], "描述") == first
+        finally:
+            await service.close()
+            await runner.cleanup()
+        return provider
+
+    provider = asyncio.run(run())
+    assert downloads == ["/a.png", "/b.png"]
+    assert provider.image_urls == [["base64://" + base64.b64encode(PNG).decode()]]
+
+
+def test_persisted_cache_is_pruned(captioning, tmp_path):
+    path = str(tmp_path / "captions.db")
+
+    def rows() -> int:
+        with sqlite3.connect(path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM captions").fetchone()[0]
+
+    async def fill(max_entries: int, count: int):
+        service = captioning.CaptionService(path, max_entries=max_entries)
+        provider = RecordingProvider()
+        try:
+            for i in range(count):
+                image = "base64://" + base64.b64encode(PNG + bytes([i])).decode()
+                await service.caption(provider, [image], "描述")
+        finally:
+            await service.close()
+
+    asyncio.run(fill(10, 6))
+    assert rows() == 6
+    # 上限调小后重新打开，数据库中多出的条目被删除
+    asyncio.run(fill(3, 0))
+    assert rows() == 3
+    asyncio.run(fill(3, 5))
+    assert rows() == 3
@@ -0,0 +1,56 @@
+import pytest
+
+
+@pytest.fixture
+def chat_history(plugin):
+    return plugin("chat_history")
+
+
+def _record(chat_history, i: int, tokens: int = 10):
+    return chat_history.ChatRecord(f"user{i % 3}", 1700000000 + i, f"message {i}", tokens)
+
+
+def test_zero_max_len_keeps_nothing(chat_history):
+    history = chat_history.SessionHistory(0)
+    for i in range(1000):
+        record = _record(chat_history, i)
+        assert history.append(record) is record
+    assert len(history) == 0
+    assert history.appended == 1000
+    assert history.nbytes == 0
+    assert history.token_count() == 0
+    assert history.render() == ""
+
+
+def test_token_count_on_empty_history(chat_history):
+    history = chat_history.SessionHistory(10)
+    assert history.token_count() == 0
+    assert history.token_count(-1) == 0
+    assert history.window_start(100) == 0
+
+
+def test_eviction_keeps_token_accounting(chat_history):
+    history = chat_history.SessionHistory(5)
+    for i in range(20):
+        history.append(_record(chat_history, i, tokens=i))
+    assert len(history) == 5
+    assert history.token_count() == sum(range(15, 20))
+    assert history.token_count(3) == 18 + 19
+    # 预算只够最新的两条
+    assert history.window_start(18 + 19) == 3
+    assert history.window_start(18 + 19 - 1) == 4
+    assert history.window_start(0) == 5
+
+
+def test_window_start_matches_linear_scan_across_evictions(chat_history):
+    history = chat_history.SessionHistory(50)
+    for i in range(500):
+        history.append(_record(chat_history, i, tokens=1 + i % 7))
+        tokens = [r.tokens for r in history]
+        for budget in (0, 5, 40, 1000):
+            expected = len(tokens)
+            while expected > 0 and sum(tokens[expected - 1:]) <= budget:
+                expected -= 1
+            assert history.window_start(budget) == expected
+        assert history.token_count(len(tokens) // 2) == sum(tokens[len(tokens) // 2:])
+    assert len(history._tok_before) <= 2 * len(history) + 1
@@ -0,0 +1,43 @@
+import gc
+
+import pytest
+
+from benchmarks.fakes import FakeContext
+
+UMO = "aiocqhttp:GroupMessage:1"
+
+
+@pytest.fixture
+def cache_cls(plugin):
+    return plugin("config_snapshot").ConfigSnapshotCache
+
+
+def test_save_config_wrapped_once_across_reloads(cache_cls):
+    context = FakeContext()
+    cfg = context.config
+    first = cache_cls(context)
+    first.get(UMO)
+    wrapper = cfg.save_config
+    first.close()
+    del first
+    gc.collect()
+
+    # 插件重载: 新的缓存注册到同一个包装上，旧的缓存已经被回收
+    second = cache_cls(context)
+    snapshot = second.get(UMO)
+    assert cfg.save_config is wrapper
+    assert list(wrapper._listeners) == [second]
+
+    cfg.save_config()
+    assert cfg.saves == 1
+    assert second.get(UMO) is not snapshot
+
+
+def test_closed_cache_no_longer_notified(cache_cls):
+    context = FakeContext()
+    cache = cache_cls(context)
+    cache.get(UMO)
+    cache.close()
+    version = cache.version
+    context.config.save_config()
+    assert cache.version == version
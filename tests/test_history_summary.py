@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeContext, FakeSummaryProvider, allow_fake_providers
+
+UMO = "aiocqhttp:GroupMessage:1"
+
+SUMMARY_CONFIG = {
+    "summary_enable": True,
+    "summary_provider_id": "fake_summary",
+    "summary_threshold": 3,
+    "summary_keep_recent": 2,
+}
+
+
+@pytest.fixture
+def summary_mod(plugin):
+    module = plugin("history_summary")
+    allow_fake_providers(module, fakes=(FakeSummaryProvider,))
+    return module
+
+
+@pytest.fixture
+def chat_history(plugin):
+    return plugin("chat_history")
+
+
+def _summarizer(summary_mod, chat_history, **kwargs):
+    pool = chat_history.SessionPool()
+    summarizer = summary_mod.HistorySummarizer(
+        FakeContext(), pool, provider_id="fake_summary", **kwargs
+    )
+    return pool, summarizer
+
+
+def _append(pool, chat_history, history, start: int, count: int):
+    for i in range(start, start + count):
+        pool.append(UMO, history, chat_history.ChatRecord("a", i, f"msg {i}", 1))
+
+
+def test_summary_triggers_at_threshold(summary_mod, chat_history):
+    async def run():
+        pool, summarizer = _summarizer(summary_mod, chat_history, threshold=3, keep_recent=2)
+        history = pool.create(UMO, 100)
+        _append(pool, chat_history, history, 0, 4)
+        summarizer.maybe_schedule(UMO, history)
+        # 最近 2 条不参与摘要，待摘要的只有 2 条
+        assert summarizer.stats()["running"] == 0
+        _append(pool, chat_history, history, 4, 1)
+        summarizer.maybe_schedule(UMO, history)
+        assert summarizer.stats()["running"] == 1
+        await summarizer.join()
+        return summarizer, history
+
+    summarizer, history = asyncio.run(run())
+    assert summarizer.runs == 1 and summarizer.summarized_records == 3
+    assert history.summary.startswith("共 3 条消息")
+    assert history.summary_end == 3
+    assert history.unsummarized_start() == 3
+
+
+def test_summary_end_is_absolute_after_eviction(summary_mod, chat_history):
+    async def run():
+        pool, summarizer = _summarizer(summary_mod, chat_history, threshold=3, keep_recent=1)
+        history = pool.create(UMO, 5)
+        _append(pool, chat_history, history, 0, 8)
+        summarizer.maybe_schedule(UMO, history)
+        await summarizer.join()
+        # 前 3 条已经被淘汰，摘要覆盖了内存中的前 4 条(序号 3..6)
+        assert history.summary_end == 7
+        assert history.unsummarized_start() == 4
+        _append(pool, chat_history, history, 8, 2)
+        assert history.unsummarized_start() == 2
+        assert [r.text for r in history][2:] == ["msg 7", "msg 8", "msg 9"]
+
+    asyncio.run(run())
+
+
+def test_summary_persisted_with_session(summary_mod, plugin, tmp_path):
+    ltm_mod = plugin("long_term_memory")
+    ltm_store = plugin("ltm_store")
+    path = str(tmp_path / "h.db")
+
+    async def write():
+        store = ltm_store.HistoryStore(path)
+        ltm = ltm_mod.LongTermMemory(None, FakeContext(), SUMMARY_CONFIG, store=store)
+        ltm.start()
+        try:
+            records = [ltm._new_record("a", f"msg {i}") for i in range(8)]
+            await ltm._append_many(UMO, records, 6)
+            await ltm.summarizer.join()
+            history = ltm.session_chats.get(UMO)
+            return history.summary, history.summary_end
+        finally:
+            await ltm.close()
+
+    async def read():
+        store = ltm_store.HistoryStore(path)
+        ltm = ltm_mod.LongTermMemory(None, FakeContext(), SUMMARY_CONFIG, store=store)
+        ltm.start()
+        try:
+            history = await ltm._get_history(UMO, 6)
+            assert ltm.summarizer.runs == 0
+            return history
+        finally:
+            await ltm.close()
+
+    summary, end = asyncio.run(write())
+    assert summary and end == 6
+    history = asyncio.run(read())
+    assert history.appended == 8
+    assert (history.summary, history.summary_end) == (summary, end)
+    assert [r.text for r in history][history.unsummarized_start():] == ["msg 6", "msg 7"]
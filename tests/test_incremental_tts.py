@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import FakeContext, FakeEvent, FakeStreamingProvider
+
+REPLY = "好的，我来讲讲。首先明确目标。然后逐个解决。"
+
+
+@pytest.fixture
+def tts(plugin):
+    return plugin("tts.tts_api")
+
+
+@pytest.fixture
+def fast_player(plugin, tts, monkeypatch):
+    """默认播放器换成不限速的 ArraySink，不需要声卡"""
+    ArraySink = plugin("tts.stream_player").ArraySink
+    TTSPlayer = tts.TTSPlayer
+    monkeypatch.setattr(
+        tts, "TTSPlayer",
+        lambda: TTSPlayer(sink_factory=lambda *a: ArraySink(*a, speed=0), prebuffer_ms=50),
+    )
+
+
+def _chain(text: str) -> SimpleNamespace:
+    return SimpleNamespace(type="plain", get_plain_text=lambda: text)
+
+
+def _run_with_server(plugin, body):
+    async def run():
+        server = plugin("tts.stub_server").StubTTSServer(first_byte_delay=0.01, seconds_per_char=0.02)
+        try:
+            await body(await server.start())
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_play_incremental_measures_token_to_speech(plugin, tts, fast_player):
+    speech_mod = plugin("tts.pipeline")
+
+    async def body(base_url):
+        client = tts.TTSClient(base_url, segment_concurrency=2)
+        provider = FakeStreamingProvider(REPLY, first_token_delay=0, token_interval=0.005)
+        speech = speech_mod.IncrementalSpeech()
+
+        async def produce():
+            async for token in provider.stream():
+                speech.feed(token)
+            speech.close()
+
+        try:
+            _, stats = await asyncio.gather(produce(), client.play_incremental(speech))
+        finally:
+            await client.close()
+        assert stats.samples_played > 0
+        assert speech.latency.token_to_speech > 0
+
+    _run_with_server(plugin, body)
+
+
+def test_streaming_reply_tapped_once_and_exported(plugin, tts, fast_player):
+    main_mod = plugin("main")
+    config = {
+        "tts": {"cache_enable": False, "incremental": True},
+        "ltm": {"enable": False, "persist": False},
+        "metrics": {"enable": True},
+    }
+
+    async def body(base_url):
+        bot = main_mod.MyPlugin(FakeContext(), config)
+        await bot.tts_client.close()
+        bot.tts_client = tts.TTSClient(base_url)
+        event = FakeEvent("test:FriendMessage:1", [])
+        forwarded = []
+
+        async def send_streaming(generator, use_fallback=False):
+            async for chain in generator:
+                forwarded.append(chain.get_plain_text())
+
+        event.send_streaming = send_streaming
+        # 工具调用后同一个事件会再次触发 on_llm_request
+        bot._tap_streaming_reply(event)
+        tapped = event.send_streaming
+        bot._tap_streaming_reply(event)
+        assert event.send_streaming is tapped
+
+        async def reply():
+            async for token in FakeStreamingProvider(REPLY, first_token_delay=0, token_interval=0.005).stream():
+                yield _chain(token)
+
+        await event.send_streaming(reply())
+        await bot._tts_tasks[event.unified_msg_origin]
+        assert "".join(forwarded) == REPLY
+        assert bot.metrics.dump()["stages"]["token_to_speech"]["count"] == 1
+        await bot.terminate()
+
+    _run_with_server(plugin, body)
@@ -0,0 +1,66 @@
+import time
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture
+def instrumentation(plugin):
+    return plugin("instrumentation")
+
+
+@pytest.mark.parametrize(
+    ("values", "p", "expected"),
+    [
+        (list(range(1, 11)), 50, 5),
+        ([1, 2], 50, 1),
+        (list(range(1, 101)), 99, 99),
+        (list(range(1, 101)), 95, 95),
+        (list(range(1, 101)), 100, 100),
+        ([3, 1, 2], 0, 1),
+        ([7], 99, 7),
+        ([], 50, 0.0),
+    ],
+)
+def test_percentile_nearest_rank(instrumentation, values, p, expected):
+    assert instrumentation.percentile(values, p) == expected
+
+
+class FakeTrace:
+    def __init__(self):
+        self.records = []
+
+    def record(self, action: str, **fields):
+        self.records.append((action, fields))
+
+
+class FakeEvent:
+    def __init__(self, umo: str):
+        self.unified_msg_origin = umo
+        self.trace = FakeTrace()
+
+
+def test_disabled_registry_is_noop(instrumentation):
+    registry = instrumentation.MetricsRegistry(enabled=False)
+    event = FakeEvent("aiocqhttp:GroupMessage:1")
+    clock = mock.Mock(side_effect=AssertionError("关闭时不应当读取时钟"))
+    with mock.patch.object(time, "perf_counter", clock):
+        span = registry.span("stage", event)
+        assert span is instrumentation._NOOP
+        with span:
+            pass
+        registry.observe("stage", 0.001, event.unified_msg_origin, event)
+    clock.assert_not_called()
+    assert registry.dump() == {"stages": {}, "sessions": {}}
+    assert not event.trace.records
+
+
+def test_enabled_registry_records_stage_session_and_trace(instrumentation):
+    registry = instrumentation.MetricsRegistry(enabled=True)
+    event = FakeEvent("aiocqhttp:GroupMessage:1")
+    with registry.span("stage", event):
+        pass
+    dump = registry.dump()
+    assert dump["stages"]["stage"]["count"] == 1
+    assert dump["sessions"][event.unified_msg_origin]["stage"]["count"] == 1
+    assert event.trace.records[0][0] == "span"
@@ -0,0 +1,72 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import (
+    FakeCaptionProvider,
+    FakeContext,
+    FakeEvent,
+    allow_fake_providers,
+    fake_image_b64,
+)
+
+UMO = "aiocqhttp:GroupMessage:1"
+
+
+@pytest.fixture
+def ltm_mod(plugin):
+    module = plugin("long_term_memory")
+    allow_fake_providers(module)
+    return module
+
+
+def _group_event(text: str, image_seed: int | None = None) -> FakeEvent:
+    from astrbot.api.message_components import Image, Plain
+
+    chain = [Plain(text=text)]
+    if image_seed is not None:
+        chain.append(Image.fromBase64(fake_image_b64(image_seed)))
+    return FakeEvent(UMO, chain, text, group_id="1")
+
+
+def test_reply_recorded_after_queued_message(ltm_mod):
+    async def run():
+        context = FakeContext(caption_provider=FakeCaptionProvider(latency=0.1))
+        ltm = ltm_mod.LongTermMemory(None, context, {"lazy_caption": False})
+        ltm.start()
+        try:
+            event = _group_event("看图", image_seed=1)
+            assert ltm.enqueue(event)
+            # 消息还在队列中描述图片时回复已经返回
+            await ltm.after_req_llm(event, SimpleNamespace(completion_text="好图"))
+            await ltm.ingest_queue.join()
+            history = ltm.session_chats.get(UMO)
+            assert [r.sender for r in history] == ["tester", "You"]
+            assert history.records[1].text == "好图"
+        finally:
+            await ltm.close()
+
+    asyncio.run(run())
+
+
+def test_lazy_caption_reindexes_record(ltm_mod):
+    async def run():
+        context = FakeContext(caption_provider=FakeCaptionProvider(latency=0))
+        ltm = ltm_mod.LongTermMemory(
+            None, context, {"lazy_caption": True, "retrieval_enable": True}
+        )
+        ltm.start()
+        try:
+            event = _group_event("看图", image_seed=1)
+            assert ltm.enqueue(event)
+            await ltm.ingest_queue.join()
+            history = await ltm._get_history(UMO, 100)
+            assert history.index.search("描述", 5) == []
+            assert await ltm._resolve_captions(UMO, history, 0, ltm.cfg(event))
+            assert history.index.search("描述", 5) == [0]
+            assert history.index.search("看图", 5) == [0]
+        finally:
+            await ltm.close()
+
+    asyncio.run(run())
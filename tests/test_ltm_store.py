@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+UMO = "aiocqhttp:GroupMessage:1"
+
+
+@pytest.fixture
+def ltm_store(plugin):
+    return plugin("ltm_store")
+
+
+@pytest.fixture
+def chat_history(plugin):
+    return plugin("chat_history")
+
+
+def _flaky(store, failures: int):
+    """让前 failures 次提交失败"""
+    write = store._write
+    calls = []
+
+    def flaky_write(ops):
+        calls.append(len(ops))
+        if len(calls) <= failures:
+            raise OSError("disk I/O error")
+        write(ops)
+
+    store._write = flaky_write
+    return calls
+
+
+def test_failed_flush_is_retried_in_order(ltm_store, chat_history, tmp_path):
+    async def run():
+        store = ltm_store.HistoryStore(str(tmp_path / "h.db"), max_retries=3)
+        calls = _flaky(store, 2)
+        store.append(UMO, chat_history.ChatRecord("a", 1, "first", 1), 10)
+        await store.flush()
+        store.append(UMO, chat_history.ChatRecord("b", 2, "second", 1), 10)
+        await store.flush()
+        assert store._failures == 2 and store._retry_at > 0
+        await store.flush()
+        assert calls == [2, 3, 3]
+        records = await store.load(UMO, 10)
+        await store.close()
+        return records
+
+    records = asyncio.run(run())
+    assert [r.text for r in records] == ["first", "second"]
+
+
+def test_flush_gives_up_after_max_retries(ltm_store, chat_history, tmp_path):
+    async def run():
+        store = ltm_store.HistoryStore(str(tmp_path / "h.db"), max_retries=2)
+        _flaky(store, 3)
+        store.append(UMO, chat_history.ChatRecord("a", 1, "lost", 1), 10)
+        for _ in range(3):
+            await store.flush()
+        assert store._ops == [("session", UMO, 10)] and store._failures == 0
+        store.append(UMO, chat_history.ChatRecord("a", 2, "kept", 1), 10)
+        records = await store.load(UMO, 10)
+        await store.close()
+        return records
+
+    assert [r.text for r in asyncio.run(run())] == ["kept"]
+
+
+def test_summary_and_sequence_survive_reload(ltm_store, chat_history, tmp_path):
+    path = str(tmp_path / "h.db")
+
+    async def write():
+        store = ltm_store.HistoryStore(path)
+        for i in range(5):
+            store.append(UMO, chat_history.ChatRecord("a", i, f"msg {i}", 1), 3)
+        store.set_summary(UMO, "前两条", 2, 4)
+        await store.close()
+
+    async def read():
+        store = ltm_store.HistoryStore(path)
+        stored = await store.load_session(UMO, 3)
+        await store.close()
+        return stored
+
+    asyncio.run(write())
+    stored = asyncio.run(read())
+    # 压缩后磁盘上只剩 3 条，序号仍从追加过的总数算起
+    assert [r.text for r in stored.records] == ["msg 2", "msg 3", "msg 4"]
+    assert stored.appended == 5
+    assert (stored.summary, stored.summary_end, stored.summary_tokens) == ("前两条", 2, 4)
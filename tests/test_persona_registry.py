@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import FakePersonaManager, make_personas
+
+
+@pytest.fixture
+def persona_registry(plugin):
+    return plugin("persona_registry")
+
+
+def _registry(persona_registry, personas, **kwargs):
+    ctx = SimpleNamespace(persona_manager=FakePersonaManager(personas))
+    return persona_registry.PersonaRegistry(ctx, tools=object(), **kwargs)
+
+
+def test_contexts_are_per_request_copies(persona_registry):
+    personas = make_personas(2)
+    image = {"type": "image_url", "image_url": {"url": "http://example.com/a.png"}}
+    personas[0]["_begin_dialogs_processed"].append(
+        {"role": "user", "content": [{"type": "text", "text": "看图"}, image]}
+    )
+    registry = _registry(persona_registry, personas)
+    bundle = registry.get("persona_0")
+
+    first = bundle.contexts()
+    assert first == personas[0]["_begin_dialogs_processed"]
+    assert all(type(msg) is dict for msg in first)
+    assert type(first[-1]["content"]) is list
+    first[0]["content"] = "modified"
+    first[-1]["content"].append({"type": "text", "text": "追加"})
+    second = bundle.contexts()
+    assert second == personas[0]["_begin_dialogs_processed"]
+    # 内容片段是共享的只读对象
+    assert second[-1]["content"][1] is first[-1]["content"][1]
+    with pytest.raises(TypeError):
+        first[-1]["content"][1]["type"] = "text"
+
+
+def test_rebuilds_when_persona_edited_in_place(persona_registry):
+    personas = make_personas(3)
+    registry = _registry(persona_registry, personas, check_interval=0)
+    assert registry.get("persona_1").system_prompt == personas[1]["prompt"]
+    version = registry.version
+    registry.get("persona_1")
+    assert registry.version == version
+
+    personas[1]["prompt"] = "新的提示词"
+    personas.append({"name": "persona_new", "prompt": "新人格"})
+    assert registry.get("persona_1").system_prompt == "新的提示词"
+    assert registry.get("persona_new").system_prompt == "新人格"
+    assert registry.version == version + 1
+
+
+def test_replaced_list_applies_immediately(persona_registry):
+    manager_personas = make_personas(1)
+    registry = _registry(persona_registry, manager_personas, check_interval=3600)
+    assert registry.get("persona_0") is not None
+    registry.ctx.persona_manager.personas_v3 = [{"name": "other", "prompt": ""}]
+    assert registry.get("persona_0") is None
+    assert registry.get("other") is not None
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import FakeSharedPreferences
+
+KEY = "session_service_config"
+UMO = "aiocqhttp:GroupMessage:1"
+
+
+@pytest.fixture
+def cache_cls(plugin):
+    return plugin("session_config").SessionServiceConfigCache
+
+
+def test_followers_survive_cancelled_leader(cache_cls):
+    async def run():
+        sp = FakeSharedPreferences(latency=0.02, jitter=0)
+        await sp.put_async("umo", UMO, KEY, {"persona_id": "p1"})
+        cache = cache_cls(sp, watch=False)
+        leader = asyncio.create_task(cache.get(UMO))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(cache.get(UMO)) for _ in range(3)]
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        results = await asyncio.gather(*followers)
+        assert [r["persona_id"] for r in results] == ["p1"] * 3
+        assert leader.cancelled()
+
+    asyncio.run(run())
+
+
+def test_failed_fetch_clears_stale_mark(cache_cls):
+    class FlakySP(FakeSharedPreferences):
+        fail = True
+
+        async def get_async(self, *args, **kwargs):
+            value = await super().get_async(*args, **kwargs)
+            if self.fail:
+                raise RuntimeError("storage unavailable")
+            return value
+
+    async def run():
+        sp = FlakySP(latency=0.01, jitter=0)
+        cache = cache_cls(sp)
+        fetch = asyncio.create_task(cache.get(UMO))
+        await asyncio.sleep(0)
+        # 读取期间写入，这次读取被标记为过期，随后读取失败
+        sp.latency = 0
+        await sp.put_async("umo", UMO, KEY, {"persona_id": "p2"})
+        assert not fetch.done()
+        with pytest.raises(RuntimeError):
+            await fetch
+        sp.fail = False
+        assert (await cache.get(UMO))["persona_id"] == "p2"
+        reads = sp.reads
+        assert (await cache.get(UMO))["persona_id"] == "p2"
+        assert sp.reads == reads, "读取失败后下一次成功的读取应当写进缓存"
+
+    asyncio.run(run())
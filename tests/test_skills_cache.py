@@ -0,0 +1,53 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+
+@pytest.fixture
+def skills_cache(plugin):
+    return plugin("skills_cache")
+
+
+class PathlessManager:
+    """没有 skills_root / config_path 的技能管理器"""
+
+    def __init__(self):
+        self.names = ["a"]
+        self.list_calls = 0
+
+    def list_skills(self, active_only: bool = True, runtime: str = "local") -> list:
+        self.list_calls += 1
+        return [SimpleNamespace(name=name) for name in self.names]
+
+
+def _prompt(skills: list) -> str:
+    return ",".join(skill.name for skill in skills)
+
+
+def test_falls_back_to_ttl_without_paths(skills_cache):
+    manager = PathlessManager()
+    cache = skills_cache.SkillsPromptCache(
+        manager, check_interval=0, build_prompt=_prompt, fallback_ttl=0.05
+    )
+    assert cache.prompt("local") == "a"
+    manager.names.append("b")
+    assert cache.prompt("local") == "a"
+    time.sleep(0.06)
+    assert cache.prompt("local") == "a,b"
+    assert manager.list_calls == 2
+
+
+def test_detects_skill_file_change(skills_cache, tmp_path):
+    from benchmarks.fakes import FakeSkillManager
+
+    (tmp_path / "skills" / "a").mkdir(parents=True)
+    (tmp_path / "skills" / "a" / "SKILL.md").write_text("v1")
+    config = tmp_path / "skills.json"
+    config.write_text("{}")
+    manager = FakeSkillManager(str(tmp_path / "skills"), str(config))
+    cache = skills_cache.SkillsPromptCache(manager, check_interval=0, build_prompt=_prompt)
+    assert cache.prompt("local") == "a"
+    (tmp_path / "skills" / "b").mkdir()
+    (tmp_path / "skills" / "b" / "SKILL.md").write_text("v1")
+    assert cache.prompt("local") == "a,b"
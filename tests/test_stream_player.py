@@ -0,0 +1,102 @@
+import threading
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def stream_player(plugin):
+    return plugin("tts.stream_player")
+
+
+@pytest.fixture
+def wav_header(plugin):
+    return plugin("tts.stub_server").wav_header
+
+
+def _pcm(frames: int, channels: int = 1) -> bytes:
+    return (np.arange(frames * channels, dtype="<i2") % 1000).tobytes()
+
+
+class RecordingSink:
+    instances: list["RecordingSink"] = []
+
+    def __init__(self, samplerate, channels, blocksize, callback):
+        self.samplerate = samplerate
+        self.calls = []
+        RecordingSink.instances.append(self)
+
+    def start(self):
+        self.calls.append("start")
+
+    def stop(self):
+        self.calls.append("stop")
+
+    def abort(self):
+        self.calls.append("abort")
+
+    def close(self):
+        self.calls.append("close")
+
+
+@pytest.fixture(autouse=True)
+def _reset_sinks():
+    RecordingSink.instances = []
+
+
+def test_abort_stops_sink_immediately(stream_player, wav_header):
+    playback = stream_player.StreamingPlayback(RecordingSink, prebuffer_ms=10)
+    playback.feed(wav_header(32000) + _pcm(32000))
+    [sink] = RecordingSink.instances
+    playback.abort()
+    assert sink.calls == ["start", "abort", "close"]
+    assert playback._ring.available == 0
+
+
+def test_feed_after_abort_does_not_start_sink(stream_player, wav_header):
+    playback = stream_player.StreamingPlayback(RecordingSink, prebuffer_ms=100)
+    # 不足预缓冲，输出端还没启动
+    playback.feed(wav_header(32000) + _pcm(100))
+    playback.abort()
+    playback.feed(_pcm(32000))
+    playback.finish()
+    assert RecordingSink.instances == []
+
+
+def test_abort_racing_with_blocked_feed(stream_player, wav_header):
+    class SilentSink(RecordingSink):
+        """启动后从不消费，feed 会阻塞在写满的缓冲区上"""
+
+    playback = stream_player.StreamingPlayback(SilentSink, prebuffer_ms=10, buffer_seconds=0.1)
+    playback.feed(wav_header(32000))
+    feeder = threading.Thread(target=playback.feed, args=(_pcm(32000),))
+    feeder.start()
+    feeder.join(0.2)
+    assert feeder.is_alive()
+    playback.abort()
+    feeder.join(1)
+    assert not feeder.is_alive()
+    assert [s.calls for s in SilentSink.instances] == [["start", "abort", "close"]]
+
+
+def test_segment_format_mismatch_raises(stream_player, wav_header):
+    playback = stream_player.StreamingPlayback(RecordingSink, prebuffer_ms=10)
+    playback.feed(wav_header(32000) + _pcm(1000))
+    playback.new_segment()
+    with pytest.raises(ValueError):
+        playback.feed(wav_header(24000) + _pcm(1000))
+    playback.abort()
+
+
+def test_would_block_tracks_free_space(stream_player, wav_header):
+    class SilentSink(RecordingSink):
+        pass
+
+    # 0.1 秒的缓冲区是 3200 个采样
+    playback = stream_player.StreamingPlayback(SilentSink, prebuffer_ms=10, buffer_seconds=0.1)
+    assert not playback.would_block(1 << 20)
+    playback.feed(wav_header(32000) + _pcm(3000))
+    assert not playback.would_block(200 * 2)
+    assert playback.would_block(201 * 2)
+    playback.abort()
+    assert not playback.would_block(1 << 20)
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def tts(plugin):
+    return plugin("tts.tts_api")
+
+
+def _run(stub_server, body):
+    async def run():
+        server = stub_server.StubTTSServer(first_byte_delay=0, seconds_per_char=0.05)
+        try:
+            await body(server, await server.start())
+        finally:
+            await server.stop()
+
+    asyncio.run(run())
+
+
+def test_synthesize_to_file_positional_order(plugin, tts, tmp_path):
+    out = tmp_path / "out.wav"
+
+    async def body(server, base_url):
+        client = tts.TTSClient(base_url)
+        try:
+            # 与改动前的调用方式相同: (text, ref_audio_path, prompt_text, output_path)
+            assert await client.synthesize_to_file("你好", "ref.wav", "提示", str(out)) == str(out)
+        finally:
+            await client.close()
+        [request] = server.requests
+        assert request["ref_audio_path"] == "ref.wav"
+        assert request["prompt_text"] == "提示"
+
+    _run(plugin("tts.stub_server"), body)
+    assert out.read_bytes()[:4] == b"RIFF"
+
+
+def test_file_and_stream_share_cache(plugin, tts, tmp_path):
+    cache = plugin("tts.audio_cache").AudioCache(str(tmp_path / "cache"))
+
+    async def body(server, base_url):
+        client = tts.TTSClient(base_url, cache=cache)
+        try:
+            streamed = b"".join([
+                bytes(c) async for c in client.synthesize_to_stream("你好", "ref.wav", "")
+            ])
+            await client.synthesize_to_file("你好", "ref.wav", "", str(tmp_path / "out.wav"))
+        finally:
+            await client.close()
+        assert len(server.requests) == 1
+        assert (tmp_path / "out.wav").read_bytes() == streamed
+
+    _run(plugin("tts.stub_server"), body)
+    assert cache.stats.hits == 1
+
+
+def test_play_async_stream_plays_everything(plugin, tts):
+    ArraySink = plugin("tts.stream_player").ArraySink
+
+    async def body(server, base_url):
+        client = tts.TTSClient(base_url, segment_concurrency=0)
+        player = tts.TTSPlayer(sink_factory=lambda *a: ArraySink(*a, speed=0), prebuffer_ms=50)
+        try:
+            stats = await player.play_async_stream(client.synthesize_to_stream("你好世界"))
+        finally:
+            await client.close()
+        assert stats.samples_played == int(4 * 0.05 * server.sample_rate)
+
+    _run(plugin("tts.stub_server"), body)
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def pipeline(plugin):
+    return plugin("tts.pipeline")
+
+
+class CountingClient:
+    """每句产出 chunks 块音频，记录每句已经产出的块数"""
+
+    def __init__(self, chunks: int):
+        self.chunks = chunks
+        self.produced: dict[str, int] = {}
+
+    async def synthesize_to_stream(self, text: str, **kwargs):
+        for i in range(self.chunks):
+            self.produced[text] = i + 1
+            yield b"x" * 16
+            await asyncio.sleep(0)
+
+
+def test_lookahead_sentences_are_bounded(pipeline):
+    async def run():
+        client = CountingClient(1000)
+        sp = pipeline.SentencePipeline(client, concurrency=2, lookahead=3, max_buffered_chunks=8)
+        segments = sp.segments(["第一句", "第二句", "第三句"])
+        first = await segments.__anext__()
+        await first.__anext__()
+        # 第一句还在播放，提前合成的句子最多缓冲 max_buffered_chunks 块(加上正在等待放入的一块)
+        for _ in range(100):
+            await asyncio.sleep(0)
+        assert client.produced["第二句"] <= 9
+        total = 1 + len([c async for c in first])
+        for _ in range(2):
+            total += len([c async for c in await segments.__anext__()])
+        await segments.aclose()
+        return total
+
+    assert asyncio.run(run()) == 3000
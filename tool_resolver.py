@@ -0,0 +1,122 @@
+import time
+from typing import Iterator, Optional
+
+from astrbot.api import logger, star
+from astrbot.core.provider.func_tool_manager import ToolSet
+
+"""
+工具集解析
+
+按 (工具名列表, 工具管理器版本) 缓存已启用的工具，每个请求拿到的是共享缓存的写时复制视图:
+只读访问直接使用缓存的元组，请求第一次修改工具集(比如加入本地 Python 工具)时才复制成自己的列表。
+工具管理器的版本由工具列表的对象身份、长度和每个工具的启用状态决定，最多每 check_interval 秒检查一次。
+"""
+
+
+class ToolSetView(ToolSet):
+    """共享工具元组的写时复制视图。修改或直接访问 tools 时复制为私有列表，不影响缓存"""
+
+    def __init__(self, shared: tuple = ()):
+        self._shared = shared
+        self._own: Optional[list] = None
+
+    @property
+    def tools(self) -> list:
+        if self._own is None:
+            self._own = list(self._shared)
+        return self._own
+
+    @tools.setter
+    def tools(self, value: list):
+        self._own = value
+
+    @property
+    def copied(self) -> bool:
+        """是否已经复制为私有列表"""
+        return self._own is not None
+
+    def _view(self):
+        return self._shared if self._own is None else self._own
+
+    def __iter__(self) -> Iterator:
+        return iter(self._view())
+
+    def __len__(self) -> int:
+        return len(self._view())
+
+    def __bool__(self) -> bool:
+        return bool(self._view())
+
+    def empty(self) -> bool:
+        return not self._view()
+
+    def names(self) -> list[str]:
+        return [tool.name for tool in self._view()]
+
+    def get_tool(self, name: str):
+        for tool in self._view():
+            if tool.name == name:
+                return tool
+        return None
+
+
+class ToolSetResolver:
+    def __init__(self, context: star.Context, check_interval: float = 1.0):
+        """
+        Args:
+            check_interval: 检查工具管理器是否变化的最短间隔(秒)，0 表示每次解析都检查
+        """
+        self.ctx = context
+        self.check_interval = check_interval
+        self.version = 0
+        """工具管理器每次变化递增"""
+        self._fingerprint: Optional[tuple] = None
+        self._checked_at = float("-inf")
+        self._global: tuple = ()
+        self._by_name: dict = {}
+        self._cache: dict[Optional[tuple], tuple] = {}
+
+    def invalidate(self):
+        """立即重新读取工具管理器"""
+        self._fingerprint = None
+        self._checked_at = float("-inf")
+
+    def resolve(self, tool_names: Optional[tuple] = None) -> ToolSetView:
+        """
+        Args:
+            tool_names: 人格指定的工具名，None 表示全部已启用的工具
+        """
+        self._check()
+        tools = self._cache.get(tool_names)
+        if tools is None:
+            if tool_names is None:
+                tools = self._global
+            else:
+                tools = tuple(
+                    tool
+                    for name in tool_names
+                    if (tool := self._by_name.get(name)) is not None and tool.active
+                )
+            self._cache[tool_names] = tools
+        return ToolSetView(tools)
+
+    def _check(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        func_list = self.ctx.get_llm_tool_manager().func_list
+        # 工具列表会被原地修改，启用状态也是原地切换的，所以比较对象身份、长度和启用状态
+        fingerprint = (id(func_list), len(func_list), tuple(tool.active for tool in func_list))
+        if fingerprint == self._fingerprint:
+            return
+        self._fingerprint = fingerprint
+        self._global = tuple(tool for tool in func_list if tool.active)
+        # 与 tmgr.get_func 一致，同名工具取第一个
+        by_name = {}
+        for tool in func_list:
+            by_name.setdefault(tool.name, tool)
+        self._by_name = by_name
+        self._cache.clear()
+        self.version += 1
+        logger.debug(f"工具集缓存已更新(v{self.version}): {len(self._global)} 个启用的工具")
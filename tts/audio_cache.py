@@ -0,0 +1,189 @@
+import asyncio
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from astrbot.api import logger
+
+"""
+TTS 音频缓存
+
+以决定音频内容的请求数据(文本、参考音频、提示文本、温度等合成参数)的哈希作为键，
+是否流式返回不影响音频内容，不计入键，保存到文件和流式播放共用缓存。
+每个条目是磁盘上的一个音频文件(服务端返回的原始字节，默认 media_type 下是 WAV)，命中时通过 mmap 直接交给播放器，
+不需要重新合成，也不需要把音频读进内存再拷贝一次。
+内存中保存 LRU 索引和最近使用条目的 mmap 句柄，按字节数和条目数两个上限淘汰。
+"""
+
+
+@dataclass
+class AudioCacheStats:
+    hits: int = 0
+    misses: int = 0
+    bytes_saved: int = 0
+    """命中时没有从 TTS 服务下载的字节数"""
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate,
+            "bytes_saved": self.bytes_saved,
+        }
+
+
+# 只影响传输方式、不影响音频内容的请求字段
+TRANSPORT_FIELDS = ("streaming_mode",)
+
+
+class AudioCache:
+    SUFFIX = ".wav"
+    LEGACY_SUFFIXES = (".pcm",)
+    """旧版本使用的后缀，启动时清理"""
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_entries: int = 2000,
+        max_mapped: int = 64,
+    ):
+        """
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 磁盘缓存总字节数上限
+            max_entries: 缓存条目数上限
+            max_mapped: 内存中保持 mmap 的最近使用条目数
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_mapped = max_mapped
+        self.stats = AudioCacheStats()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        """key -> 文件大小，按最近使用排序"""
+        self._mapped: OrderedDict[str, mmap.mmap] = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key_for(payload: dict) -> str:
+        """根据请求数据计算缓存键，忽略 TRANSPORT_FIELDS"""
+        payload = {k: v for k, v in payload.items() if k not in TRANSPORT_FIELDS}
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + self.SUFFIX)
+
+    def _load_index(self):
+        """启动时扫描缓存目录，按修改时间恢复 LRU 顺序"""
+        files = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith((".tmp", *self.LEGACY_SUFFIXES)):
+                # 上次写入到一半的文件，或者旧版本的条目(键的计算方式不同，不会再命中)
+                os.remove(path)
+                continue
+            if not name.endswith(self.SUFFIX):
+                continue
+            st = os.stat(path)
+            files.append((st.st_mtime, name[: -len(self.SUFFIX)], st.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, key: str) -> Optional[memoryview]:
+        """
+        查询缓存。命中时返回指向 mmap 的只读视图(零拷贝)，未命中返回 None。
+        """
+        size = self._entries.get(key)
+        if size is None:
+            self.stats.misses += 1
+            return None
+        mm = self._mapped.get(key)
+        if mm is None:
+            try:
+                with open(self._path(key), "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError) as e:
+                logger.warning(f"读取 TTS 缓存失败，丢弃条目 {key}: {e}")
+                self._drop(key)
+                self.stats.misses += 1
+                return None
+            self._mapped[key] = mm
+            if len(self._mapped) > self.max_mapped:
+                # 只释放引用，正在播放的视图仍然有效，释放后由 GC 关闭映射
+                self._mapped.popitem(last=False)
+        self._mapped.move_to_end(key)
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        self.stats.bytes_saved += size
+        return memoryview(mm)
+
+    async def put(self, key: str, data: bytes):
+        """写入缓存。先写临时文件再重命名，进程中途退出也不会留下损坏的条目"""
+        if not data or key in self._entries or len(data) > self.max_bytes:
+            return
+        await asyncio.to_thread(_atomic_write, self._path(key), data)
+        if key in self._entries:
+            return
+        self._entries[key] = len(data)
+        self._total_bytes += len(data)
+        self._evict()
+
+    def _evict(self):
+        while self._entries and (
+            self._total_bytes > self.max_bytes or len(self._entries) > self.max_entries
+        ):
+            key = next(iter(self._entries))
+            self._drop(key)
+
+    def _drop(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+        self._mapped.pop(key, None)
+        try:
+            os.remove(self._path(key))
+        except OSError as e:
+            # Windows 下仍被映射的文件无法删除，下次启动时会按 LRU 重新淘汰
+            logger.debug(f"删除 TTS 缓存文件失败: {e}")
+
+    def clear(self):
+        for key in list(self._entries):
+            self._drop(key)
+
+
+def _atomic_write(path: str, data: bytes):
+    # 每次写入使用唯一的临时文件，同一个键的并发写入互不干扰
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
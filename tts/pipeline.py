@@ -0,0 +1,238 @@
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import AsyncGenerator, AsyncIterable, AsyncIterator, Iterable, Optional, Union
+
+from astrbot.api import logger
+
+"""
+分句流水线
+
+把一段回复按中英文标点切成句子，最多 concurrency 句同时向 TTS 服务请求合成，
+结果严格按原顺序交给播放器。第一句可以边合成边播放，后面的句子在播放前一句时已经在合成。
+已开始但还没播放完的句子数不超过 lookahead，用来限制缓冲的内存。
+"""
+
+# 句末标点，后面可以跟若干右引号/右括号。英文句点后面必须是空白或结尾，避免切开 3.14、e.g 之类
+_BOUNDARY = re.compile(r"(?:[。！？!?；;…]+|\.(?=\s|$)|\n+)[”’\"'」』）)]*")
+
+
+def split_sentences(text: str, min_chars: int = 6) -> list[str]:
+    """
+    按中英文标点切分句子。短于 min_chars 的句子并入下一句，减少过短的合成请求。
+    """
+    sentences = []
+    carry = ""
+    start = 0
+    for m in _BOUNDARY.finditer(text):
+        carry = _join(carry, text[start:m.end()].strip())
+        start = m.end()
+        if len(carry) >= min_chars:
+            sentences.append(carry)
+            carry = ""
+    carry = _join(carry, text[start:].strip())
+    if carry:
+        if sentences and len(carry) < min_chars:
+            sentences[-1] = _join(sentences[-1], carry)
+        else:
+            sentences.append(carry)
+    return sentences
+
+
+def _join(a: str, b: str) -> str:
+    """拼接两段句子，英文之间补一个空格"""
+    if not a or not b:
+        return a or b
+    return f"{a} {b}" if a[-1].isascii() and b[0].isascii() else a + b
+
+
+class IncrementalSplitter:
+    """
+    增量切句。LLM 流式输出的 token 逐个输入，一旦出现句子边界就立即切出，不等待整段回复结束。
+    """
+
+    def __init__(self, min_chars: int = 6):
+        self.min_chars = min_chars
+        self._buf = ""
+        self._carry = ""
+
+    def feed(self, text: str) -> list[str]:
+        """输入一段增量文本，返回已经完整的句子"""
+        self._buf += text
+        sentences = []
+        start = 0
+        for m in _BOUNDARY.finditer(self._buf):
+            # 边界在缓冲区末尾时还不能确定(后面可能还有右引号，英文句点也需要看到下一个字符)
+            if m.end() >= len(self._buf):
+                break
+            self._carry = _join(self._carry, self._buf[start:m.end()].strip())
+            start = m.end()
+            if len(self._carry) >= self.min_chars:
+                sentences.append(self._carry)
+                self._carry = ""
+        self._buf = self._buf[start:]
+        return sentences
+
+    def flush(self) -> list[str]:
+        """输入结束(或工具调用等分节处)，把剩余的文本作为最后一句输出"""
+        rest = _join(self._carry, self._buf.strip())
+        self._buf = ""
+        self._carry = ""
+        return [rest] if rest else []
+
+
+@dataclass
+class SpeechLatency:
+    """增量语音的延迟指标，时间点均为 time.monotonic()"""
+
+    first_token_at: Optional[float] = None
+    first_sentence_at: Optional[float] = None
+    first_audio_at: Optional[float] = None
+
+    @property
+    def token_to_speech(self) -> Optional[float]:
+        """从收到第一个 token 到第一个采样被播放的时间(秒)"""
+        if self.first_token_at is None or self.first_audio_at is None:
+            return None
+        return self.first_audio_at - self.first_token_at
+
+    @property
+    def token_to_sentence(self) -> Optional[float]:
+        """从收到第一个 token 到切出第一句的时间(秒)"""
+        if self.first_token_at is None or self.first_sentence_at is None:
+            return None
+        return self.first_sentence_at - self.first_token_at
+
+
+class IncrementalSpeech:
+    """
+    LLM 流式输出 -> 增量切句 -> 句子队列。feed/close 在接收 token 的一侧调用，
+    sentences() 交给 SentencePipeline 消费。
+    """
+
+    def __init__(self, min_chars: int = 6):
+        self.splitter = IncrementalSplitter(min_chars)
+        self.latency = SpeechLatency()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._closed = False
+
+    def _put(self, sentences: list[str]):
+        if sentences and self.latency.first_sentence_at is None:
+            self.latency.first_sentence_at = time.monotonic()
+        for sentence in sentences:
+            self._queue.put_nowait(sentence)
+
+    def feed(self, token: str):
+        if self._closed or not token:
+            return
+        if self.latency.first_token_at is None:
+            self.latency.first_token_at = time.monotonic()
+        self._put(self.splitter.feed(token))
+
+    def section_break(self):
+        """输出被分节(比如中间插入了工具调用)，当前未结束的句子直接切出"""
+        if not self._closed:
+            self._put(self.splitter.flush())
+
+    def close(self):
+        if self._closed:
+            return
+        self._put(self.splitter.flush())
+        self._closed = True
+        self._queue.put_nowait(None)
+
+    async def sentences(self) -> AsyncGenerator[str, None]:
+        while (sentence := await self._queue.get()) is not None:
+            yield sentence
+
+
+class SentencePipeline:
+    def __init__(
+        self, client, concurrency: int = 2, lookahead: int = 4, max_buffered_chunks: int = 256
+    ):
+        """
+        Args:
+            client: TTSClient，使用其 synthesize_to_stream
+            concurrency: 同时进行的合成请求数
+            lookahead: 已开始合成但还没播放完的句子数上限(包含正在播放的一句)
+            max_buffered_chunks: 每一句最多缓冲的音频块数，缓冲满时暂停读取这一句的响应(反压)
+        """
+        self.client = client
+        self.concurrency = max(concurrency, 1)
+        self.lookahead = max(lookahead, 1)
+        self.max_buffered_chunks = max(max_buffered_chunks, 1)
+
+    async def segments(
+        self,
+        sentences: Union[Iterable[str], AsyncIterable[str]],
+        **kwargs,
+    ) -> AsyncGenerator[AsyncIterator[bytes], None]:
+        """
+        按顺序产出每一句的音频流。每个音频流必须消费完(或关闭)后才能取下一句。
+
+        Args:
+            sentences: 句子序列，可以是异步迭代器(比如 LLM 流式输出切出的句子)
+            **kwargs: 透传给 synthesize_to_stream 的参数
+        """
+        sem = asyncio.Semaphore(self.concurrency)
+        slots = asyncio.Semaphore(self.lookahead)
+        order: asyncio.Queue = asyncio.Queue()
+        workers: set[asyncio.Task] = set()
+
+        async def synthesize(text: str, out: asyncio.Queue):
+            try:
+                async with sem:
+                    async for chunk in self.client.synthesize_to_stream(text, **kwargs):
+                        # 提前合成的句子还没轮到播放时，缓冲满了就等待，不会把整句音频都读进内存
+                        await out.put(chunk)
+                await out.put(None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await out.put(e)
+
+        async def produce():
+            try:
+                async for text in _aiter(sentences):
+                    await slots.acquire()
+                    out: asyncio.Queue = asyncio.Queue(self.max_buffered_chunks)
+                    task = asyncio.create_task(synthesize(text, out))
+                    workers.add(task)
+                    task.add_done_callback(workers.discard)
+                    order.put_nowait((text, out))
+            finally:
+                order.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while (item := await order.get()) is not None:
+                text, out = item
+                try:
+                    yield _drain(text, out)
+                finally:
+                    slots.release()
+            # 把句子来源抛出的异常传递出去
+            await producer
+        finally:
+            producer.cancel()
+            for task in list(workers):
+                task.cancel()
+
+
+async def _drain(text: str, out: asyncio.Queue) -> AsyncGenerator[bytes, None]:
+    while (chunk := await out.get()) is not None:
+        if isinstance(chunk, Exception):
+            # 单句合成失败时跳过这一句，不影响后面的句子
+            logger.error(f"分句合成失败({text[:20]}): {chunk}")
+            return
+        yield chunk
+
+
+async def _aiter(items: Union[Iterable[str], AsyncIterable[str]]) -> AsyncIterator[str]:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -0,0 +1,610 @@
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import numpy as np
+from astrbot.api import logger
+
+try:
+    import sounddevice as sd
+    AUDIO_AVAILABLE = True
+except ImportError:
+    sd = None
+    AUDIO_AVAILABLE = False
+
+"""
+流式播放引擎
+
+HTTP 流 -> WavStreamDecoder(解析头部、处理被切开的帧，直接解码到复用的缓冲区) -> PCMRingBuffer -> 输出回调(声卡或测试用 ArraySink)
+"""
+
+# 默认音频参数 (channels, sample_width, sample_rate)，与 GPT-SoVITS 的默认输出一致
+DEFAULT_AUDIO_FORMAT = (1, 2, 32000)
+
+
+# 各采样宽度的 (numpy 类型, 零点偏移, 缩放系数, struct 格式)，WAV 的多字节采样都是小端
+_PCM_FORMATS = {
+    1: (np.dtype(np.uint8), np.float32(128), np.float32(1 / 128), "B"),
+    2: (np.dtype("<i2"), None, np.float32(1 / 32768), "h"),
+    4: (np.dtype("<i4"), None, np.float32(1 / 2147483648), "i"),
+}
+
+
+def _pcm_format(sample_width: int) -> tuple:
+    fmt = _PCM_FORMATS.get(sample_width)
+    if fmt is None:
+        raise ValueError(f"不支持的采样宽度: {sample_width}")
+    return fmt
+
+
+def _convert(fmt: tuple, buf, flat: np.ndarray, offset: int = 0):
+    """从 buf 的 offset 字节处读取 len(flat) 个采样，换算后写入一维的 flat。一次 ufunc，不产生中间数组"""
+    dtype, zero, scale, _ = fmt
+    # 位置参数比关键字参数快，每块都会调用
+    src = np.frombuffer(buf, dtype, len(flat), offset)
+    if zero is not None:
+        np.subtract(src, zero, out=flat, dtype=np.float32)
+        flat *= scale
+    else:
+        np.multiply(src, scale, out=flat, dtype=np.float32)
+
+
+def _convert_frame(fmt: tuple, frame: bytes, flat: np.ndarray):
+    """换算被块边界切开的单独一帧。只有几个采样，逐个赋值比启动一次 ufunc 快"""
+    _, zero, scale, code = fmt
+    values = struct.unpack(f"<{len(flat)}{code}", frame)
+    zero = float(zero) if zero is not None else 0.0
+    scale = float(scale)
+    for i, v in enumerate(values):
+        flat[i] = (v - zero) * scale
+
+
+def pcm_to_float32(
+    audio_bytes: bytes, sample_width: int, out: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    将 PCM 字节转换为 [-1, 1) 区间的 float32 数组
+
+    Args:
+        audio_bytes: PCM 数据，长度必须是 sample_width 的整数倍
+        sample_width: 采样宽度(字节)
+        out: 输出缓冲区(C 连续的 float32)，元素数必须等于采样数；None 时新分配一维数组
+
+    Returns:
+        np.ndarray: out 本身，或者新分配的数组
+    """
+    fmt = _pcm_format(sample_width)
+    count = len(audio_bytes) // sample_width
+    if out is None:
+        out = np.empty(count, dtype=np.float32)
+    flat = out.reshape(-1)
+    if len(flat) != count:
+        raise ValueError(f"输出缓冲区大小 {len(flat)} 与采样数 {count} 不一致")
+    _convert(fmt, audio_bytes, flat)
+    return out
+
+
+class PCMRingBuffer:
+    """
+    预分配的 float32 环形缓冲区。解码阶段写入，输出回调读取，两端可以在不同线程。
+
+    读写位置使用单调递增的计数器，(write - read) 即为可读的采样数。
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity 必须大于 0")
+        self._buf = np.zeros(capacity, dtype=np.float32)
+        self._capacity = capacity
+        self._read = 0
+        self._write = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def available(self) -> int:
+        """可读的采样数"""
+        return self._write - self._read
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def close(self):
+        """标记写入结束，之后的写入被丢弃，唤醒所有等待者"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def discard(self):
+        """丢弃尚未读取的采样"""
+        with self._cond:
+            self._read = self._write
+            self._cond.notify_all()
+
+    def write(self, samples: np.ndarray, timeout: Optional[float] = None) -> int:
+        """
+        写入采样，缓冲区满时阻塞等待读取端消费(反压)
+
+        Returns:
+            int: 实际写入的采样数，超时或关闭时可能小于 len(samples)
+        """
+        written = 0
+        total = len(samples)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while written < total:
+                if self._closed:
+                    break
+                free = self._capacity - (self._write - self._read)
+                if free == 0:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    continue
+                n = min(free, total - written)
+                start = self._write % self._capacity
+                first = min(n, self._capacity - start)
+                self._buf[start:start + first] = samples[written:written + first]
+                if first < n:
+                    self._buf[:n - first] = samples[written + first:written + n]
+                self._write += n
+                written += n
+                self._cond.notify_all()
+        return written
+
+    def read_into(self, out: np.ndarray) -> int:
+        """
+        非阻塞读取，尽量填满 out，返回实际读取的采样数。供音频回调使用，不会等待。
+        """
+        with self._cond:
+            n = min(len(out), self._write - self._read)
+            if n:
+                start = self._read % self._capacity
+                first = min(n, self._capacity - start)
+                out[:first] = self._buf[start:start + first]
+                if first < n:
+                    out[first:n] = self._buf[:n - first]
+                self._read += n
+                self._cond.notify_all()
+        return n
+
+
+class WavStreamDecoder:
+    """
+    增量 WAV 解码器。
+
+    - WAV 头部可能被切分到多个块中，会缓存直到找到 data 块
+    - 首块不是 RIFF 时按默认参数当作裸 PCM 处理
+    - 块边界可能切开一帧(比如 int16 收到奇数字节，或者立体声只收到左声道)，多出的字节留到下一块
+    - 输出形状为 (帧数, 声道数)，feed_into 直接写入调用方预分配的缓冲区
+    """
+
+    def __init__(self, default_format: tuple[int, int, int] = DEFAULT_AUDIO_FORMAT):
+        self.channels, self.sample_width, self.sample_rate = default_format
+        self._header = b""
+        self._pending = b""
+        self._format_ready = False
+        self._fmt: Optional[tuple] = None
+
+    @property
+    def format_ready(self) -> bool:
+        return self._format_ready
+
+    @property
+    def frame_size(self) -> int:
+        """一帧(所有声道各一个采样)的字节数"""
+        return self.sample_width * self.channels
+
+    def _parse_header(self) -> Optional[int]:
+        """解析缓存中的 RIFF 头部，返回音频数据起始偏移；数据不足时返回 None"""
+        data = self._header
+        pos = 12
+        while pos + 8 <= len(data):
+            chunk_id = data[pos:pos + 4]
+            chunk_size = struct.unpack("<I", data[pos + 4:pos + 8])[0]
+            if chunk_id == b"data":
+                return pos + 8
+            if chunk_id == b"fmt ":
+                if pos + 8 + 16 > len(data):
+                    return None
+                _, channels, sample_rate, _, _, bits = struct.unpack(
+                    "<HHIIHH", data[pos + 8:pos + 24]
+                )
+                self.channels = channels or 1
+                self.sample_rate = sample_rate
+                self.sample_width = max(bits // 8, 1)
+            # RIFF 块按偶数字节对齐
+            pos += 8 + chunk_size + (chunk_size & 1)
+        return None
+
+    def strip_header(self, chunk: bytes) -> Optional[memoryview]:
+        """
+        去掉头部后的音频字节；头部还不完整时返回 None。
+        头部解析完成前声道数还不确定，预分配输出缓冲区之前先调用它。
+        """
+        if self._format_ready:
+            return memoryview(chunk)
+        self._header += chunk
+        if len(self._header) < 12:
+            return None
+        if self._header[:4] == b"RIFF" and self._header[8:12] == b"WAVE":
+            data_start = self._parse_header()
+            if data_start is None:
+                return None
+            logger.debug(
+                f"音频参数: channels={self.channels}, sample_width={self.sample_width}, sample_rate={self.sample_rate}"
+            )
+        else:
+            logger.debug("第一个块没有WAV头部，直接处理为音频数据")
+            data_start = 0
+        data = memoryview(self._header)[data_start:]
+        self._header = b""
+        self._format_ready = True
+        return data
+
+    def max_frames(self, nbytes: int) -> int:
+        """输入 nbytes 字节最多能解码出的帧数，用于预分配输出缓冲区"""
+        return (len(self._pending) + nbytes) // self.frame_size
+
+    def feed_into(self, chunk: bytes, out: np.ndarray) -> int:
+        """
+        输入一块原始字节，解码结果从 out 的第一帧开始写入。
+        头部解析完成前声道数还不确定，这时应当先用 strip_header 去掉头部再分配 out。
+
+        Args:
+            out: 形状为 (帧数, 声道数) 的 C 连续 float32 缓冲区，至少能容纳 max_frames(len(chunk)) 帧
+
+        Returns:
+            int: 写入的帧数
+        """
+        if self._format_ready:
+            data = chunk
+        else:
+            data = self.strip_header(chunk)
+            if data is None:
+                return 0
+        channels = self.channels
+        fs = self.sample_width * channels
+        if out.shape[1:] != (channels,) or not out.flags.c_contiguous:
+            raise ValueError(f"输出缓冲区必须是 C 连续的 (帧数, {channels}) 数组，实际为 {out.shape}")
+        pending = self._pending
+        if len(out) < (len(pending) + len(data)) // fs:
+            raise ValueError("输出缓冲区太小")
+        fmt = self._fmt
+        if fmt is None:
+            fmt = self._fmt = _pcm_format(self.sample_width)
+        flat = out.reshape(-1)
+
+        frames = 0
+        pos = 0
+        if pending:
+            # 先补齐上一块剩下的半帧，只涉及不到一帧的字节
+            pos = fs - len(pending)
+            if len(data) < pos:
+                self._pending = pending + bytes(data)
+                return 0
+            _convert_frame(fmt, pending + bytes(data[:pos]), flat[:channels])
+            self._pending = b""
+            frames = 1
+
+        n = (len(data) - pos) // fs
+        if n:
+            # 直接按偏移读取输入，不切片、不拼接
+            _convert(fmt, data, flat[frames * channels:(frames + n) * channels], pos)
+            frames += n
+        end = pos + n * fs
+        if end < len(data):
+            self._pending = bytes(data[end:])
+        return frames
+
+    def feed(self, chunk: bytes) -> np.ndarray:
+        """
+        输入一块原始字节，返回本块可以解码出的采样，形状为 (帧数, 声道数)
+        """
+        data = self.strip_header(chunk)
+        if data is None:
+            return np.empty((0, self.channels), dtype=np.float32)
+        # 头部已经去掉，格式已经确定
+        out = np.empty((self.max_frames(len(data)), self.channels), dtype=np.float32)
+        n = self.feed_into(data, out)
+        return out[:n]
+
+
+@dataclass
+class PlaybackStats:
+    time_to_first_sample: Optional[float] = None
+    """从创建播放引擎到第一个有效采样被输出的时间(秒)"""
+    first_sample_at: Optional[float] = None
+    """第一个有效采样被输出的时间点(time.monotonic())"""
+    underruns: int = 0
+    """输出回调需要数据但缓冲区为空的次数(不含流结束后的尾部)"""
+    samples_played: int = 0
+
+
+class ArraySink:
+    """
+    测试用输出端，不需要声卡。按实时节奏(或加速)调用输出回调，并把输出记录到数组中，
+    用于测量首个采样延迟和欠载次数。
+    """
+
+    def __init__(
+        self,
+        samplerate: int,
+        channels: int,
+        blocksize: int,
+        callback: Callable[[np.ndarray], bool],
+        speed: float = 1.0,
+    ):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.blocksize = blocksize
+        self._callback = callback
+        self._period = blocksize / samplerate / speed if speed > 0 else 0.0
+        self._blocks: list[np.ndarray] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def data(self) -> np.ndarray:
+        """已输出的全部音频，形状为 (frames, channels)"""
+        if not self._blocks:
+            return np.zeros((0, self.channels), dtype=np.float32)
+        return np.concatenate(self._blocks)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop.is_set():
+            out = np.empty((self.blocksize, self.channels), dtype=np.float32)
+            keep_going = self._callback(out)
+            self._blocks.append(out)
+            if not keep_going:
+                break
+            next_tick += self._period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="tts-array-sink", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def abort(self):
+        self.stop()
+
+    def close(self):
+        self.stop()
+
+
+class SoundDeviceSink:
+    """基于 sounddevice.OutputStream 回调模式的输出端"""
+
+    def __init__(
+        self,
+        samplerate: int,
+        channels: int,
+        blocksize: int,
+        callback: Callable[[np.ndarray], bool],
+    ):
+        self._callback = callback
+        self._stream = sd.OutputStream(
+            samplerate=samplerate,
+            channels=channels,
+            blocksize=blocksize,
+            dtype="float32",
+            callback=self._on_output,
+        )
+
+    def _on_output(self, outdata, frames, time_info, status):
+        if not self._callback(outdata):
+            raise sd.CallbackStop
+
+    def start(self):
+        self._stream.start()
+
+    def stop(self):
+        # stop 会等待已提交的缓冲播放完毕
+        self._stream.stop()
+
+    def abort(self):
+        # 立即停止，丢弃已提交但还没播放的缓冲
+        self._stream.abort()
+
+    def close(self):
+        self._stream.close()
+
+
+class StreamingPlayback:
+    """
+    边解码边播放。feed() 在调用线程中解码并写入环形缓冲区，
+    缓冲达到预缓冲时长(pre-roll)后启动输出端，由输出回调从缓冲区取数据。
+    """
+
+    def __init__(
+        self,
+        sink_factory: Optional[Callable[..., object]] = None,
+        prebuffer_ms: int = 200,
+        buffer_seconds: float = 30.0,
+        blocksize: int = 1024,
+        default_format: tuple[int, int, int] = DEFAULT_AUDIO_FORMAT,
+    ):
+        """
+        Args:
+            sink_factory: 输出端工厂，签名为 (samplerate, channels, blocksize, callback)，默认使用声卡；
+                输出端提供 start / stop(播放完已提交的缓冲) / abort(立即停止) / close
+            prebuffer_ms: 开始播放前需要缓冲的音频时长
+            buffer_seconds: 环形缓冲区可容纳的音频时长，写满后 feed 会阻塞
+            blocksize: 每次输出回调的帧数
+        """
+        self.sink_factory = sink_factory or SoundDeviceSink
+        self.prebuffer_ms = prebuffer_ms
+        self.buffer_seconds = buffer_seconds
+        self.blocksize = blocksize
+        self.decoder = WavStreamDecoder(default_format)
+        self.stats = PlaybackStats()
+        self.sink = None
+        self._ring: Optional[PCMRingBuffer] = None
+        self._scratch: Optional[np.ndarray] = None
+        """解码缓冲区，按最大的块大小分配一次后复用"""
+        self._empty = np.empty(0, dtype=np.float32)
+        self._format: Optional[tuple[int, int]] = None
+        self._prebuffer_samples = 0
+        self._created = time.monotonic()
+        self._eos = False
+        self._done = threading.Event()
+        self._aborted = False
+        self._sink_lock = threading.Lock()
+        """feed 在工作线程中执行，abort 可能同时发生；启动和关闭输出端都在锁内检查 _aborted"""
+
+    def _ensure_ring(self):
+        if self._ring is None:
+            d = self.decoder
+            capacity = max(int(self.buffer_seconds * d.sample_rate), self.blocksize) * d.channels
+            self._ring = PCMRingBuffer(capacity)
+            self._prebuffer_samples = min(
+                int(self.prebuffer_ms * d.sample_rate / 1000) * d.channels, capacity
+            )
+
+    def _start_sink(self):
+        with self._sink_lock:
+            if self.sink is not None or self._aborted:
+                return
+            d = self.decoder
+            self.sink = self.sink_factory(d.sample_rate, d.channels, self.blocksize, self._on_output)
+            self.sink.start()
+
+    def _on_output(self, out: np.ndarray) -> bool:
+        """输出回调: 从环形缓冲区填充 out，返回 False 表示流已播放完毕"""
+        flat = out.reshape(-1)
+        n = self._ring.read_into(flat) if self._ring else 0
+        if n < len(flat):
+            flat[n:] = 0.0
+        if n:
+            if self.stats.time_to_first_sample is None:
+                self.stats.first_sample_at = time.monotonic()
+                self.stats.time_to_first_sample = self.stats.first_sample_at - self._created
+            self.stats.samples_played += n
+        if self._eos and self._ring.available == 0:
+            self._done.set()
+            return False
+        if n < len(flat):
+            self.stats.underruns += 1
+        return True
+
+    def new_segment(self):
+        """
+        开始一段新的音频流(比如分句合成的下一句)。每段都有自己的 WAV 头部，
+        解码器重新解析头部，环形缓冲区和输出端继续使用。
+        """
+        d = self.decoder
+        if d.format_ready or self._ring is not None:
+            self.decoder = WavStreamDecoder((d.channels, d.sample_width, d.sample_rate))
+
+    def _decode(self, chunk: bytes) -> np.ndarray:
+        """解码到复用的缓冲区，返回交错排列的一维视图(下次解码前有效)"""
+        d = self.decoder
+        if not d.format_ready:
+            chunk = d.strip_header(chunk)
+            if chunk is None:
+                return self._empty
+        frames = d.max_frames(len(chunk))
+        scratch = self._scratch
+        if scratch is None or len(scratch) < frames or scratch.shape[1] != d.channels:
+            scratch = self._scratch = np.empty(
+                (max(frames, len(scratch) if scratch is not None else 0), d.channels),
+                dtype=np.float32,
+            )
+        n = d.feed_into(chunk, scratch)
+        return scratch[:n].reshape(-1)
+
+    def feed(self, chunk: bytes):
+        """
+        输入一块原始音频字节。abort() 之后的输入直接丢弃。
+
+        Raises:
+            ValueError: 音频段的采样率或声道数与正在播放的不一致(输出端已按第一段的格式打开)
+        """
+        if self._aborted:
+            return
+        samples = self._decode(chunk)
+        if not len(samples):
+            return
+        if self._format is None:
+            self._format = (self.decoder.sample_rate, self.decoder.channels)
+        elif self._format != (self.decoder.sample_rate, self.decoder.channels):
+            raise ValueError(
+                f"音频段格式与正在播放的格式不一致: {(self.decoder.sample_rate, self.decoder.channels)} != {self._format}"
+            )
+        self._ensure_ring()
+        if self.sink is None:
+            need = max(self._prebuffer_samples - self._ring.available, 0)
+            if len(samples) < need:
+                self._ring.write(samples)
+                return
+            # 预缓冲写满后先启动输出端，剩余部分的写入才不会阻塞在未启动的消费端上
+            self._ring.write(samples[:need])
+            samples = samples[need:]
+            self._start_sink()
+        self._ring.write(samples)
+
+    def would_block(self, nbytes: int) -> bool:
+        """
+        输入 nbytes 字节时 feed 是否可能因缓冲区已满而阻塞。
+        输出回调只会腾出空间，所以由唯一的写入方在 feed 之前调用时结果可靠。
+        """
+        ring = self._ring
+        if ring is None or ring.closed or self._aborted:
+            # 第一块数据写入的是空缓冲区；关闭后的写入直接丢弃
+            return False
+        d = self.decoder
+        # 头部解析前格式未知，按每个字节一个采样估计上限
+        samples = d.max_frames(nbytes) * d.channels if d.format_ready else nbytes
+        return samples > ring.capacity - ring.available
+
+    def finish(self):
+        """标记输入结束。音频不足预缓冲时长时也会立即开始播放"""
+        self._eos = True
+        if self._ring is None:
+            self._done.set()
+            return
+        self._ring.close()
+        self._start_sink()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """等待缓冲区播放完毕并关闭输出端"""
+        finished = self._done.wait(timeout)
+        self._close_sink()
+        return finished
+
+    def abort(self):
+        """立即停止播放，丢弃缓冲区中尚未播放的音频。可以在 feed 执行期间从其他线程调用"""
+        with self._sink_lock:
+            self._aborted = True
+            sink, self.sink = self.sink, None
+        self._eos = True
+        if self._ring is not None:
+            self._ring.close()
+            self._ring.discard()
+        self._done.set()
+        if sink is not None:
+            sink.abort()
+            sink.close()
+
+    def _close_sink(self):
+        with self._sink_lock:
+            sink, self.sink = self.sink, None
+        if sink is not None:
+            sink.stop()
+            sink.close()
@@ -0,0 +1,118 @@
+import asyncio
+import struct
+from typing import Optional
+
+import numpy as np
+from aiohttp import web
+
+"""
+本地 TTS 桩服务，模拟 GPT-SoVITS 的 /tts 接口，用于测试和基准测试，不需要真实的模型。
+
+返回流式 WAV: 先发送头部，再按 chunk_ms 分块发送正弦波 PCM。
+合成耗时由 first_byte_delay(首包延迟) 和 realtime_factor(生成 1 秒音频需要的秒数) 控制。
+"""
+
+
+def wav_header(sample_rate: int, channels: int = 1, sample_width: int = 2, data_size: int = 0xFFFFFFFF - 36) -> bytes:
+    """构造 WAV 头部。流式输出时长度未知，默认使用最大值"""
+    byte_rate = sample_rate * channels * sample_width
+    return (
+        b"RIFF" + struct.pack("<I", (data_size + 36) & 0xFFFFFFFF) + b"WAVE"
+        + b"fmt " + struct.pack(
+            "<IHHIIHH", 16, 1, channels, sample_rate, byte_rate,
+            channels * sample_width, sample_width * 8,
+        )
+        + b"data" + struct.pack("<I", data_size & 0xFFFFFFFF)
+    )
+
+
+class StubTTSServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        sample_rate: int = 32000,
+        seconds_per_char: float = 0.2,
+        first_byte_delay: float = 0.05,
+        first_byte_per_char: float = 0.0,
+        realtime_factor: float = 0.0,
+        chunk_ms: int = 100,
+    ):
+        """
+        Args:
+            port: 监听端口，0 表示随机端口
+            seconds_per_char: 每个字符生成的音频时长
+            first_byte_delay: 收到请求到发送头部的延迟
+            first_byte_per_char: 首包延迟中与文本长度成正比的部分(每个字符)，模拟整段推理
+            realtime_factor: 生成 1 秒音频需要的时间，0 表示不限速
+            chunk_ms: 每个数据块包含的音频时长
+        """
+        self.host = host
+        self.port = port
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        self.first_byte_delay = first_byte_delay
+        self.first_byte_per_char = first_byte_per_char
+        self.realtime_factor = realtime_factor
+        self.chunk_ms = chunk_ms
+        self.requests: list[dict] = []
+        """收到的请求数据，按顺序记录"""
+        self.active = 0
+        self.max_active = 0
+        self.cancelled = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _pcm(self, text: str) -> bytes:
+        frames = max(int(len(text) * self.seconds_per_char * self.sample_rate), 1)
+        t = np.arange(frames, dtype=np.float32) / self.sample_rate
+        return (np.sin(2 * np.pi * 440 * t) * 8000).astype("<i2").tobytes()
+
+    async def _handle_tts(self, request: web.Request) -> web.StreamResponse:
+        data = await request.json()
+        self.requests.append(data)
+        text = data.get("text", "")
+        if not text:
+            return web.json_response({"message": "text is required"}, status=400)
+
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            pcm = self._pcm(text)
+            response = web.StreamResponse(headers={"Content-Type": "audio/wav"})
+            await response.prepare(request)
+            await asyncio.sleep(self.first_byte_delay + self.first_byte_per_char * len(text))
+            await response.write(wav_header(self.sample_rate))
+            chunk_bytes = self.sample_rate * 2 * self.chunk_ms // 1000
+            for i in range(0, len(pcm), chunk_bytes):
+                if self.realtime_factor:
+                    await asyncio.sleep(self.chunk_ms / 1000 * self.realtime_factor)
+                await response.write(pcm[i:i + chunk_bytes])
+            await response.write_eof()
+            return response
+        except ConnectionResetError:
+            # 客户端取消了请求
+            self.cancelled += 1
+            return response
+        finally:
+            self.active -= 1
+
+    async def start(self) -> str:
+        """启动服务，返回 base_url"""
+        app = web.Application()
+        app.router.add_post("/tts", self._handle_tts)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
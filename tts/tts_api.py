@@ -1,12 +1,15 @@
-import requests
+import asyncio
+import contextlib
+from typing import AsyncGenerator, AsyncIterator, Optional
 
-from typing import Generator
-from io import BytesIO
-import numpy as np
+import aiohttp
 import soundfile as sf
-import wave
 from astrbot.api import logger
 
+from .audio_cache import AudioCache
+from .pipeline import IncrementalSpeech, SentencePipeline, split_sentences
+from .stream_player import PlaybackStats, StreamingPlayback
+
 try:
     import sounddevice as sd
     AUDIO_AVAILABLE = True
@@ -15,325 +18,363 @@ except ImportError:
     AUDIO_AVAILABLE = False
     logger.debug("警告: 未找到sounddevice库，请安装: pip install sounddevice")
 
+DEFAULT_REF_AUDIO_PATH = "data/fairy_01_疑问.wav"
+DEFAULT_PROMPT_TEXT = "替小师傅们买水，连续三次中了再来一瓶，这难道就是《天虚问道录》里所谓的气运之子的机缘？"
+
+# 缓存命中时每次交给播放器的字节数
+CACHED_CHUNK_SIZE = 64 * 1024
+
+# GPT-SoVITS /tts 接口支持的其他可选参数
+OPTIONAL_PARAMS = (
+    "top_k", "top_p", "temperature", "batch_threshold", "split_bucket",
+    "speed_factor", "fragment_interval", "seed", "parallel_infer",
+    "repetition_penalty", "sample_steps", "super_sampling",
+    "overlap_length", "min_chunk_length"
+)
+
 
 class TTSClient:
-    def __init__(self, base_url: str = "http://127.0.0.1:9880"):
+    def __init__(
+        self,
+        base_url: str = "http://127.0.0.1:9880",
+        timeout: float = 60.0,
+        connect_timeout: float = 5.0,
+        pool_size: int = 4,
+        ref_audio_path: str = DEFAULT_REF_AUDIO_PATH,
+        prompt_text: str = DEFAULT_PROMPT_TEXT,
+        cache: Optional[AudioCache] = None,
+        segment_concurrency: int = 2,
+        segment_lookahead: int = 4,
+    ):
         """
-        初始化TTS客户端
-        
+        初始化TTS客户端。一个插件实例只创建一个客户端，所有请求共用同一个连接池。
+
         Args:
             base_url: TTS API的基础URL
+            timeout: 两次读取之间的最长等待时间(秒)，流式合成时按块计算
+            connect_timeout: 建立连接的超时时间(秒)
+            pool_size: 连接池大小，同时也是并发合成请求的上限
+            ref_audio_path: 默认参考音频路径
+            prompt_text: 默认提示文本
+            cache: 音频缓存，相同的请求数据直接从缓存播放，不再请求 TTS 服务
+            segment_concurrency: 分句合成时同时进行的请求数，小于 1 时整段文本只发一个请求
+            segment_lookahead: 分句合成时最多提前合成的句子数
         """
         self.base_url = base_url
         self.tts_endpoint = f"{base_url}/tts"
-    
-    def synthesize_to_file(self, 
-                          text: str,
-                          ref_audio_path: str,
-                          prompt_text: str,
-                          output_path: str,
-                          text_lang: str = "zh",
-                          prompt_lang: str = "zh",
-                          **kwargs) -> str:
+        self.ref_audio_path = ref_audio_path
+        self.prompt_text = prompt_text
+        self.pool_size = pool_size
+        self.cache = cache
+        self.pipeline = (
+            SentencePipeline(self, segment_concurrency, segment_lookahead)
+            if segment_concurrency > 0
+            else None
+        )
+        self._timeout = aiohttp.ClientTimeout(
+            total=None, connect=connect_timeout, sock_read=timeout
+        )
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """延迟创建会话，必须在事件循环中调用"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _build_payload(
+        self,
+        text: str,
+        ref_audio_path: Optional[str],
+        prompt_text: Optional[str],
+        text_lang: str,
+        prompt_lang: str,
+        default_streaming: bool,
+        **kwargs,
+    ) -> dict:
+        """构建 /tts 请求数据"""
+        data = {
+            "text": text,
+            "text_lang": text_lang,
+            "ref_audio_path": ref_audio_path or self.ref_audio_path,
+            "prompt_lang": prompt_lang,
+            "prompt_text": prompt_text if prompt_text is not None else self.prompt_text,
+            "text_split_method": kwargs.get("text_split_method", "cut5"),
+            "batch_size": kwargs.get("batch_size", 1),
+            "media_type": kwargs.get("media_type", "wav"),
+            "streaming_mode": kwargs.get("streaming_mode", default_streaming),
+        }
+        for param in OPTIONAL_PARAMS:
+            if param in kwargs:
+                data[param] = kwargs[param]
+        return data
+
+    @staticmethod
+    async def _raise_for_error(response: aiohttp.ClientResponse):
+        if response.status != 200:
+            if response.content_type == "application/json":
+                error_msg = await response.json()
+            else:
+                error_msg = await response.text()
+            raise Exception(f"TTS请求失败: {error_msg}")
+
+    async def synthesize_to_file(self,
+                                 text: str,
+                                 ref_audio_path: Optional[str],
+                                 prompt_text: Optional[str],
+                                 output_path: str,
+                                 text_lang: str = "zh",
+                                 prompt_lang: str = "zh",
+                                 **kwargs) -> str:
         """
         将文本合成语音并保存到指定文件路径
-        
+
         Args:
             text: 要合成的文本
-            ref_audio_path: 参考音频路径
-            prompt_text: 提示文本
+            ref_audio_path: 参考音频路径，为 None 时使用客户端配置
+            prompt_text: 提示文本，为 None 时使用客户端配置
             output_path: 输出文件路径
             text_lang: 文本语言
             prompt_lang: 提示文本语言
             **kwargs: 其他可选参数
-            
+
         Returns:
             str: 成功时返回保存的文件路径
-            
+
         Raises:
             Exception: 请求失败时抛出异常
         """
-        # 构建请求数据
         logger.debug(f"开始合成音频: {text}")
-        data = {
-            "text": text,
-            "text_lang": text_lang,
-            "ref_audio_path": ref_audio_path,
-            "prompt_lang": prompt_lang,
-            "prompt_text": prompt_text,
-            "text_split_method": kwargs.get("text_split_method", "cut5"),
-            "batch_size": kwargs.get("batch_size", 1),
-            "media_type": kwargs.get("media_type", "wav"),
-            "streaming_mode": kwargs.get("streaming_mode", False)
-        }
-        
-        # 添加其他可选参数
-        optional_params = [
-            "top_k", "top_p", "temperature", "batch_threshold", "split_bucket",
-            "speed_factor", "fragment_interval", "seed", "parallel_infer",
-            "repetition_penalty", "sample_steps", "super_sampling",
-            "overlap_length", "min_chunk_length"
-        ]
-        
-        for param in optional_params:
-            if param in kwargs:
-                data[param] = kwargs[param]
-        
-        # 发送POST请求
-        response = requests.post(self.tts_endpoint, json=data)
-        
-        if response.status_code == 200:
-            # 保存音频文件
-            with open(output_path, "wb") as f:
-                f.write(response.content)
-            return output_path
+        data = self._build_payload(
+            text, ref_audio_path, prompt_text, text_lang, prompt_lang, False, **kwargs
+        )
+        key = self.cache.key_for(data) if self.cache is not None else None
+        if key and (cached := self.cache.get(key)) is not None:
+            content = cached
         else:
-            error_msg = response.json() if response.headers.get('content-type', '').startswith('application/json') else response.text
-            raise Exception(f"TTS请求失败: {error_msg}")
-    
-    def synthesize_to_stream(self,
-                           text: str,
-                           ref_audio_path: str,
-                           prompt_text: str,
-                           text_lang: str = "zh",
-                           prompt_lang: str = "zh",
-                           chunk_size: int = 1024,
-                           **kwargs) -> Generator[bytes, None, None]:
+            async with self._get_session().post(self.tts_endpoint, json=data) as response:
+                await self._raise_for_error(response)
+                content = await response.read()
+            if key:
+                await self.cache.put(key, content)
+        # 文件写入放到线程中，避免阻塞事件循环
+        await asyncio.to_thread(_write_file, output_path, content)
+        return output_path
+
+    async def synthesize_to_stream(self,
+                                   text: str,
+                                   ref_audio_path: Optional[str] = None,
+                                   prompt_text: Optional[str] = None,
+                                   text_lang: str = "zh",
+                                   prompt_lang: str = "zh",
+                                   chunk_size: int = 4096,
+                                   **kwargs) -> AsyncGenerator[bytes, None]:
         """
-        将文本合成语音并通过流返回
-        
+        将文本合成语音并通过异步流返回。消费方取消或提前关闭生成器时，连接会被立即释放。
+
         Args:
             text: 要合成的文本
-            ref_audio_path: 参考音频路径
-            prompt_text: 提示文本
+            ref_audio_path: 参考音频路径，默认使用客户端配置
+            prompt_text: 提示文本，默认使用客户端配置
             text_lang: 文本语言
             prompt_lang: 提示文本语言
             chunk_size: 流块大小
             **kwargs: 其他可选参数
-            
+
         Yields:
             bytes: 音频数据块
-            
+
         Raises:
             Exception: 请求失败时抛出异常
         """
-        # 构建请求数据
-        data = {
-            "text": text,
-            "text_lang": text_lang,
-            "ref_audio_path": ref_audio_path,
-            "prompt_lang": prompt_lang,
-            "prompt_text": prompt_text,
-            "text_split_method": kwargs.get("text_split_method", "cut5"),
-            "batch_size": kwargs.get("batch_size", 1),
-            "media_type": kwargs.get("media_type", "wav"),
-            "streaming_mode": kwargs.get("streaming_mode", True)  # 流模式默认开启
-        }
-        
-        # 添加其他可选参数
-        optional_params = [
-            "top_k", "top_p", "temperature", "batch_threshold", "split_bucket",
-            "speed_factor", "fragment_interval", "seed", "parallel_infer",
-            "repetition_penalty", "sample_steps", "super_sampling",
-            "overlap_length", "min_chunk_length"
-        ]
-        
-        for param in optional_params:
-            if param in kwargs:
-                data[param] = kwargs[param]
-        
+        data = self._build_payload(
+            text, ref_audio_path, prompt_text, text_lang, prompt_lang, True, **kwargs
+        )
+        key = self.cache.key_for(data) if self.cache is not None else None
+        if key and (cached := self.cache.get(key)) is not None:
+            logger.debug(f"TTS 缓存命中: {text}")
+            # 直接按块切分 mmap 视图，不拷贝
+            step = max(chunk_size, CACHED_CHUNK_SIZE)
+            for i in range(0, len(cached), step):
+                yield cached[i:i + step]
+            return
+
         logger.debug(f"开始合成音频: {text}")
-        # 发送POST请求（流模式）
-        response = requests.post(self.tts_endpoint, json=data, stream=True)
-        if response.status_code == 200:
-            # 逐块返回音频数据
-            for chunk in response.iter_content(chunk_size=chunk_size):
+        received = bytearray() if key else None
+        async with self._get_session().post(self.tts_endpoint, json=data) as response:
+            await self._raise_for_error(response)
+            async for chunk in response.content.iter_chunked(chunk_size):
                 if chunk:
+                    if received is not None:
+                        received += chunk
                     yield chunk
-        else:
-            error_msg = response.json() if response.headers.get('content-type', '').startswith('application/json') else response.text
-            raise Exception(f"TTS请求失败: {error_msg}")
+        # 只有完整接收的音频才写入缓存，取消或出错时不会执行到这里
+        if received:
+            await self.cache.put(key, bytes(received))
 
-    async def synthesize_and_play_realtime(self, text, ref_audio_path="data/fairy_01_疑问.wav", prompt_text="替小师傅们买水，连续三次中了再来一瓶，这难道就是《天虚问道录》里所谓的气运之子的机缘？", **kwargs):
+    def _tts_kwargs(self, ref_audio_path, prompt_text, kwargs: dict) -> dict:
+        kwargs.setdefault("temperature", 0.4)
+        kwargs.setdefault("fragment_interval", 0.45)
+        kwargs.update(ref_audio_path=ref_audio_path, prompt_text=prompt_text, streaming_mode=True)
+        return kwargs
+
+    async def synthesize_and_play_realtime(self, text, ref_audio_path=None, prompt_text=None, **kwargs):
         """
-        实时合成并播放TTS音频
-        
+        实时合成并播放TTS音频。启用分句时按句并发合成、按顺序播放，第一句合成好就开始播放。
+        任务被取消时(比如会话有了新的回复)会中断请求并停止播放。
+
         Args:
-            tts_client: TTS客户端实例
             text: 要合成的文本
-            ref_audio_path: 参考音频路径
-            prompt_text: 提示文本
+            ref_audio_path: 参考音频路径，默认使用客户端配置
+            prompt_text: 提示文本，默认使用客户端配置
             **kwargs: 其他TTS参数
         """
+        kwargs = self._tts_kwargs(ref_audio_path, prompt_text, kwargs)
         try:
-            # 获取音频流
-            audio_stream = self.synthesize_to_stream(
-                text=text,
-                ref_audio_path=ref_audio_path,
-                prompt_text=prompt_text,
-                streaming_mode=True,
-                temperature=0.4,
-                fragment_interval=0.45,
-                **kwargs
-            )
-            
-            # 创建播放器并播放
             player = TTSPlayer()
-            player.play_stream(audio_stream)
-            
+            if self.pipeline is not None:
+                await player.play_async_segments(
+                    self.pipeline.segments(split_sentences(text), **kwargs)
+                )
+            else:
+                await player.play_async_stream(self.synthesize_to_stream(text, **kwargs))
+        except asyncio.CancelledError:
+            logger.debug(f"TTS播放已取消: {text[:20]}")
+            raise
         except Exception as e:
             logger.error(f"TTS处理或播放出错: {e}")
 
-class TTSPlayer:
-    def __init__(self):
-        if not AUDIO_AVAILABLE:
-            logger.error("错误: 音频播放不可用，请安装sounddevice库")
-    
-    def _is_wav_header(self, data: bytes) -> bool:
-        """检查数据是否包含WAV头部"""
-        return len(data) >= 12 and data[:4] == b'RIFF' and data[8:12] == b'WAVE'
-    
-    def _extract_wav_parameters(self, wav_header: bytes):
-        """
-        从WAV头部提取音频参数
-        """
-        try:
-            bio = BytesIO(wav_header)
-            with wave.open(bio, 'rb') as wf:
-                channels = wf.getnchannels()
-                sample_width = wf.getsampwidth()
-                sample_rate = wf.getframerate()
-                return channels, sample_width, sample_rate
-        except Exception as e:
-            logger.error(f"解析WAV头部时出错: {e}")
-            return 1, 2, 32000  # 默认参数
-    
-    def _convert_audio_bytes(self, audio_bytes: bytes, sample_width: int):
+    async def play_incremental(self, speech: IncrementalSpeech, ref_audio_path=None, prompt_text=None,
+                               player: Optional["TTSPlayer"] = None, **kwargs) -> Optional[PlaybackStats]:
         """
-        将音频字节转换为numpy数组
+        边接收 LLM 流式输出边合成播放: speech 每切出一句就立即送去合成。
+
+        Args:
+            speech: 由 LLM 流式输出驱动的 IncrementalSpeech
+            player: 播放器，默认使用声卡
+            **kwargs: 其他TTS参数
         """
-        if not audio_bytes:
-            return np.array([], dtype=np.float32)
-            
+        kwargs = self._tts_kwargs(ref_audio_path, prompt_text, kwargs)
+        # 未启用分句时也需要按句合成，否则就退化成等待整段回复
+        pipeline = self.pipeline or SentencePipeline(self, 1, 2)
         try:
-            if sample_width == 1:
-                # 8-bit unsigned
-                data = np.frombuffer(audio_bytes, dtype=np.uint8)
-                data = (data.astype(np.int16) - 128) * 256
-            elif sample_width == 2:
-                # 16-bit signed
-                data = np.frombuffer(audio_bytes, dtype=np.int16)
-            elif sample_width == 4:
-                # 32-bit signed
-                data = np.frombuffer(audio_bytes, dtype=np.int32)
-                data = (data >> 16).astype(np.int16)
-            else:
-                raise ValueError(f"不支持的采样宽度: {sample_width}")
-                
-            return data.astype(np.float32) / 32768.0
+            stats = await (player or TTSPlayer()).play_async_segments(
+                pipeline.segments(speech.sentences(), **kwargs)
+            )
+        except asyncio.CancelledError:
+            logger.debug("增量TTS播放已取消")
+            raise
         except Exception as e:
-            logger.error(f"转换音频数据时出错: {e}")
-            return np.array([], dtype=np.float32)
-    
-    def _find_data_chunk(self, wav_data: bytes):
+            logger.error(f"TTS处理或播放出错: {e}")
+            return None
+        if stats is not None:
+            speech.latency.first_audio_at = stats.first_sample_at
+            if (latency := speech.latency.token_to_speech) is not None:
+                logger.debug(f"增量TTS: 首个 token 到开始播放 {latency * 1000:.0f}ms")
+        return stats
+
+
+async def _single(stream: AsyncGenerator[bytes, None]) -> AsyncGenerator[AsyncIterator[bytes], None]:
+    async with contextlib.aclosing(stream):
+        yield stream
+
+
+def _write_file(path: str, content: bytes):
+    with open(path, "wb") as f:
+        f.write(content)
+
+
+class TTSPlayer:
+    def __init__(self, sink_factory=None, prebuffer_ms: int = 200):
         """
-        在WAV数据中找到"data"块的起始位置
+        Args:
+            sink_factory: 输出端工厂，默认使用声卡；测试时可以传入 ArraySink
+            prebuffer_ms: 开始播放前的预缓冲时长
         """
-        data_pos = wav_data.find(b'data')
-        if data_pos != -1:
-            # data块结构: "data" + 4字节长度 + 音频数据
-            data_start = data_pos + 8
-            return data_start
-        return -1
-    
-    def play_stream(self, audio_stream_generator):
+        self.sink_factory = sink_factory
+        self.prebuffer_ms = prebuffer_ms
+        if not AUDIO_AVAILABLE and sink_factory is None:
+            logger.error("错误: 音频播放不可用，请安装sounddevice库")
+
+    def play_stream(self, audio_stream_generator) -> Optional[PlaybackStats]:
         """
-        实时播放TTS流式音频
-        
+        实时播放TTS流式音频，收到足够的预缓冲数据后即开始播放，不再等待整个流结束
+
         Args:
             audio_stream_generator: TTS流生成器
+
+        Returns:
+            PlaybackStats: 首个采样延迟、欠载次数等播放统计，播放不可用时返回 None
         """
-        if not AUDIO_AVAILABLE:
+        if not AUDIO_AVAILABLE and self.sink_factory is None:
             logger.debug("错误: 音频播放不可用")
-            return
-            
+            return None
+
+        playback = StreamingPlayback(
+            sink_factory=self.sink_factory, prebuffer_ms=self.prebuffer_ms
+        )
         try:
-            # 音频参数
-            sample_rate = 32000
-            sample_width = 2
-            channels = 1
-            
-            # 存储所有音频数据
-            audio_buffers = []
-            first_chunk = True
-            
             for chunk in audio_stream_generator:
-                if first_chunk:
-                    # 第一个块可能包含WAV头部
-                    if self._is_wav_header(chunk):
-                        logger.debug("检测到WAV头部")
-                        # 提取音频参数
-                        channels, sample_width, sample_rate = self._extract_wav_parameters(chunk)
-                        logger.debug(f"音频参数: channels={channels}, sample_width={sample_width}, sample_rate={sample_rate}")
-                        
-                        # 找到音频数据的起始位置
-                        data_start = self._find_data_chunk(chunk)
-                        if data_start != -1 and data_start < len(chunk):
-                            audio_data = chunk[data_start:]
-                            if audio_data:
-                                converted_data = self._convert_audio_bytes(audio_data, sample_width)
-                                if len(converted_data) > 0:
-                                    audio_buffers.append(converted_data)
-                        else:
-                            # 如果没有找到数据块，整个块都当作音频数据处理
-                            converted_data = self._convert_audio_bytes(chunk, sample_width)
-                            if len(converted_data) > 0:
-                                audio_buffers.append(converted_data)
-                    else:
-                        # 没有WAV头部，直接当作音频数据处理
-                        logger.debug("第一个块没有WAV头部，直接处理为音频数据")
-                        converted_data = self._convert_audio_bytes(chunk, sample_width)
-                        if len(converted_data) > 0:
-                            audio_buffers.append(converted_data)
-                    
-                    first_chunk = False
-                else:
-                    # 后续块直接当作音频数据处理
-                    converted_data = self._convert_audio_bytes(chunk, sample_width)
-                    if len(converted_data) > 0:
-                        audio_buffers.append(converted_data)
-            
-            # 合并所有音频数据
-            if audio_buffers:
-                try:
-                    # 确保所有数组具有一致的维度
-                    processed_buffers = []
-                    for buf in audio_buffers:
-                        if len(buf.shape) == 1:
-                            # 一维数组转二维 (samples, 1)
-                            processed_buffers.append(buf.reshape(-1, 1))
-                        else:
-                            processed_buffers.append(buf)
-                    
-                    full_audio = np.vstack(processed_buffers)
-                    
-                    # 如果是单声道，转换为一维数组
-                    if full_audio.shape[1] == 1:
-                        full_audio = full_audio.flatten()
-                    
-                    logger.debug(f"播放音频数据，总长度: {len(full_audio)} 采样点, 采样率: {sample_rate}")
-                    # 播放完整音频
-                    sd.play(full_audio, sample_rate)
-                    sd.wait()  # 等待播放完成
-                    logger.debug("音频播放完成")
-                except Exception as e:
-                    logger.error(f"合并或播放音频时出错: {e}")
-            else:
-                logger.debug("没有有效的音频数据可供播放")
-                
+                if chunk:
+                    playback.feed(chunk)
+            playback.finish()
+            playback.wait()
+            logger.debug(
+                f"音频播放完成，共 {playback.stats.samples_played} 采样点，"
+                f"首个采样延迟: {playback.stats.time_to_first_sample}, 欠载: {playback.stats.underruns}"
+            )
         except Exception as e:
+            playback.abort()
             logger.error(f"播放音频时出错: {e}")
-    
+        return playback.stats
+
+    async def play_async_stream(self, audio_stream: AsyncGenerator[bytes, None]) -> Optional[PlaybackStats]:
+        """
+        play_stream 的异步版本。解码写入和等待播放结束都在线程中进行，不阻塞事件循环；
+        被取消时关闭上游流并立即停止播放。
+
+        Args:
+            audio_stream: 异步音频流，比如 TTSClient.synthesize_to_stream 的返回值
+        """
+        return await self.play_async_segments(_single(audio_stream))
+
+    async def play_async_segments(
+        self, segments: AsyncGenerator[AsyncIterator[bytes], None]
+    ) -> Optional[PlaybackStats]:
+        """
+        按顺序连续播放多段音频流(每段各自带 WAV 头部)，比如 SentencePipeline.segments 的输出。
+        """
+        if not AUDIO_AVAILABLE and self.sink_factory is None:
+            logger.debug("错误: 音频播放不可用")
+            return None
+
+        playback = StreamingPlayback(
+            sink_factory=self.sink_factory, prebuffer_ms=self.prebuffer_ms
+        )
+        try:
+            async with contextlib.aclosing(segments):
+                async for segment in segments:
+                    playback.new_segment()
+                    async for chunk in segment:
+                        if playback.would_block(len(chunk)):
+                            # 缓冲区快满时 feed 会阻塞等待播放，只有这时才放到线程中执行
+                            await asyncio.to_thread(playback.feed, chunk)
+                        else:
+                            playback.feed(chunk)
+            playback.finish()
+            await asyncio.to_thread(playback.wait)
+        except BaseException:
+            playback.abort()
+            raise
+        return playback.stats
+
     def play_file(self, file_path: str):
         """
         播放本地WAV文件